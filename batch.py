@@ -0,0 +1,220 @@
+# batch.py
+
+import argparse
+import json
+import os
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+from catalog import as_catalog
+from components import components_stock
+from core import compute_recipe
+from mediaCalc import MediaPreparationHelper
+from recipe_parser import RecipeParseError, iter_file_recipes, load_file_recipes, recipe_label, recipe_stem
+from writers import write_report
+
+
+def unique_inputs(values, what):
+    # values without repeats, in order. Results are keyed by (recipe, volume), so a repeated
+    # input would only overwrite its own result; it is computed once, with a warning.
+    unique = list(dict.fromkeys(values))
+    if len(unique) < len(values):
+        repeated = [value for value in unique if values.count(value) > 1]
+        warnings.warn(f"{what} listed more than once, computed once: {', '.join(map(str, repeated))}", stacklevel=3)
+    return unique
+
+
+def load_batch_recipes(recipe_files, catalog):
+    # {label: recipe} for every recipe in the files; a file with a 'Recipe ID' column holds
+    # several, labelled '<file>:<id>'. Raises RecipeParseError listing the bad rows.
+    return {recipe_label(recipe_file, recipe_id): recipe
+            for recipe_file, recipe_id, recipe in load_file_recipes(recipe_files, catalog)}
+
+
+def run_batch(recipe_files, final_volumes_ml, components_stock=components_stock):
+    # Parse every recipe and index the catalog once up front instead of once per volume.
+    # Results are keyed by (recipe label, final volume); see load_batch_recipes.
+    recipe_files = unique_inputs(list(recipe_files), 'Recipe files')
+    final_volumes_ml = unique_inputs(list(final_volumes_ml), 'Final volumes')
+    catalog = as_catalog(components_stock)
+    recipes = load_batch_recipes(recipe_files, catalog)
+
+    results = {}
+    for recipe_file, recipe in recipes.items():
+        for final_volume_ml in final_volumes_ml:
+            result = compute_recipe(catalog, recipe['additives'], final_volume_ml)
+            results[(recipe_file, final_volume_ml)] = result.as_rows()
+    return results
+
+
+def run_batch_table(recipe_files, final_volumes_ml, components_stock=components_stock):
+    # run_batch as a columnar ResultTable (see result_table.py), without a dict per row
+    from result_table import ResultTable
+
+    recipe_files = unique_inputs(list(recipe_files), 'Recipe files')
+    final_volumes_ml = unique_inputs(list(final_volumes_ml), 'Final volumes')
+    catalog = as_catalog(components_stock)
+    recipes = load_batch_recipes(recipe_files, catalog)
+    return ResultTable.from_results(
+        ((recipe_file, final_volume_ml), compute_recipe(catalog, recipe['additives'], final_volume_ml))
+        for recipe_file, recipe in recipes.items()
+        for final_volume_ml in final_volumes_ml
+    )
+
+
+def batch_to_records(results):
+    # Flatten the (recipe, volume) keyed results into JSON friendly records
+    records = []
+    for (recipe_file, final_volume_ml), recipe_output in results.items():
+        records.append({
+            'recipe': recipe_file,
+            'final_volume_ml': final_volume_ml,
+            'components': recipe_output,
+        })
+    return records
+
+
+@dataclass(frozen=True)
+class RenderOutcome:
+    recipe: str
+    final_volume_ml: float
+    filename: str
+    seconds: float
+    error: Optional[str] = None
+    cached: bool = False  # Reused from the output cache instead of rendered
+
+
+def _render_one(report, filename, fmt):
+    # Runs in a worker process; gets the picklable MediaReport, never the helper
+    start = time.perf_counter()
+    write_report(report, filename, fmt)
+    return time.perf_counter() - start
+
+
+def render_batch(recipe_files, final_volumes_ml, output_dir='.', fmt='docx', workers=None,
+                 components_stock=components_stock, cache=None):
+    # Render a document for every recipe/volume combination, fanning the rendering out over a
+    # process pool. Failures are recorded in the outcome instead of aborting the batch. With an
+    # output_cache.OutputCache, documents whose inputs haven't changed are reused, not rendered.
+    recipe_files = unique_inputs(list(recipe_files), 'Recipe files')
+    final_volumes_ml = unique_inputs(list(final_volumes_ml), 'Final volumes')
+    catalog = as_catalog(components_stock)
+    outcomes = []
+    jobs = []
+    # A bad recipe fails its own documents only, also within a multi-recipe file
+    for recipe_file, recipe_id, recipe, error in iter_file_recipes(recipe_files, catalog):
+        label = recipe_label(recipe_file, recipe_id)
+        if error is not None:
+            outcomes.extend(RenderOutcome(label, v, '', 0.0, f"{type(error).__name__}: {error}") for v in final_volumes_ml)
+            continue
+        base_name = recipe_stem(recipe_file, recipe_id)
+        for final_volume_ml in final_volumes_ml:
+            filename = os.path.join(output_dir, f"{base_name}_{final_volume_ml:g}mL.{fmt}")
+            try:
+                helper = MediaPreparationHelper(catalog, final_volume_ml, recipe_file, recipe=recipe)
+                key = None
+                if cache is not None:
+                    key = helper.cache_key(fmt)
+                    if cache.fetch(key, filename):
+                        outcomes.append(RenderOutcome(label, final_volume_ml, filename, 0.0, cached=True))
+                        continue
+                report = helper.build_report()
+            except ValueError as e:
+                outcomes.append(RenderOutcome(label, final_volume_ml, filename, 0.0, f"ValueError: {e}"))
+                continue
+            target = cache.temp_path(fmt) if cache is not None else filename
+            jobs.append((label, final_volume_ml, filename, report, key, target))
+
+    def finish(job, seconds=0.0, error=None):
+        recipe_file, final_volume_ml, filename, _, key, target = job
+        if cache is not None:
+            if error is None:
+                cache.store(key, target, fmt, f"{recipe_file} {final_volume_ml:g} mL", filename)
+            elif os.path.exists(target):
+                os.remove(target)
+        outcomes.append(RenderOutcome(recipe_file, final_volume_ml, filename, seconds, error))
+
+    if workers == 1:
+        # Render inline, which is easier to debug and avoids the pool start-up cost
+        for job in jobs:
+            try:
+                finish(job, _render_one(job[3], job[5], fmt))
+            except Exception as e:
+                finish(job, error=f"{type(e).__name__}: {e}")
+        return outcomes
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [(job, executor.submit(_render_one, job[3], job[5], fmt)) for job in jobs]
+        for job, future in futures:
+            try:
+                finish(job, future.result())
+            except Exception as e:
+                finish(job, error=f"{type(e).__name__}: {e}")
+    return outcomes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compute many recipes at many final volumes in one pass.')
+    parser.add_argument('recipes', nargs='+', help="Recipe CSV files (with a 'Recipe ID' column, several recipes per file)")
+    parser.add_argument('--volumes', nargs='+', type=float, required=True, help='Final volumes in mL')
+    parser.add_argument('--output', help='Write the results to this JSON file instead of printing a summary')
+    parser.add_argument('--render', choices=['docx', 'json', 'csv', 'md', 'html'],
+                        help='Render a document per recipe/volume in this format instead of computing rows')
+    parser.add_argument('--output-dir', default='.', help='Directory for rendered documents')
+    parser.add_argument('--workers', type=int, help='Worker processes for --render (default: one per CPU)')
+    parser.add_argument('--cache', help='Output cache directory: reuse documents whose inputs have not changed')
+    parser.add_argument('--cache-max-mb', type=float, default=512, help='Evict cached documents above this size')
+    args = parser.parse_args(argv)
+
+    if args.render:
+        os.makedirs(args.output_dir, exist_ok=True)
+        start = time.perf_counter()
+        cache = None
+        if args.cache:
+            from output_cache import OutputCache
+            cache = OutputCache(args.cache, max_bytes=int(args.cache_max_mb * 1024 * 1024))
+        outcomes = render_batch(args.recipes, args.volumes, args.output_dir, args.render, args.workers, cache=cache)
+        failures = [outcome for outcome in outcomes if outcome.error]
+        for outcome in outcomes:
+            if outcome.error:
+                status = f"FAILED {outcome.error}"
+            else:
+                status = 'cached' if outcome.cached else f"{outcome.seconds * 1000:.1f} ms"
+            print(f"{outcome.filename or outcome.recipe}: {status}")
+        cached = sum(outcome.cached for outcome in outcomes)
+        print(f"Rendered {len(outcomes) - len(failures)}/{len(outcomes)} documents "
+              f"in {time.perf_counter() - start:.2f} s ({cached} from the cache, {len(failures)} failed).")
+        if failures:
+            raise SystemExit(1)
+        return
+
+    if args.output:
+        try:
+            results = run_batch(args.recipes, args.volumes)
+        except RecipeParseError as e:
+            raise SystemExit(str(e))
+        with open(args.output, 'w') as f:
+            json.dump(batch_to_records(results), f, indent=2)
+        print(f"Batch results for {len(results)} recipe/volume combinations written to '{args.output}'.")
+        return
+
+    try:
+        table = run_batch_table(args.recipes, args.volumes)
+    except RecipeParseError as e:
+        raise SystemExit(str(e))
+    additives = np.bincount(table.run_codes, minlength=len(table.runs))
+    for (label, final_volume_ml), count, total_volume_ul, total_cost in zip(
+            table.runs, additives, table.totals('volume_ul'), table.totals('cost')):
+        recipe_file = next(f for f in args.recipes if label == f or label.startswith(f + ':'))
+        base_name = recipe_stem(recipe_file, label[len(recipe_file) + 1:] or None)
+        print(f"{base_name} @ {final_volume_ml:g} mL: {count} additives, "
+              f"{total_volume_ul:.2f} μL total, ${total_cost:.2f}")
+
+
+if __name__ == '__main__':
+    main()
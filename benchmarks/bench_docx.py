@@ -0,0 +1,67 @@
+# benchmarks/bench_docx.py
+#
+# Per-row cost of building the media preparation table cell by cell with
+# python-docx (the old generate_word_document) versus docx_writer.add_table.
+#
+#   python benchmarks/bench_docx.py [--rows 10 100 1000] [--repeat 3]
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from docx import Document
+
+from docx_writer import add_table
+
+HEADER = ['Step', 'Component', 'Desired Concentration', 'Volume to Add (μL)', 'Cost']
+
+
+def synthetic_rows(n):
+    return [[str(i + 1), f"Component {i}", f"{i % 97 + 1} ng/mL", f"{(i * 7.3) % 500:.2f}", f"${i * 0.37:.2f}"]
+            for i in range(n)]
+
+
+def cell_by_cell(document, rows):
+    table = document.add_table(rows=1, cols=len(HEADER))
+    for cell, text in zip(table.rows[0].cells, HEADER):
+        cell.text = text
+    for row in rows:
+        row_cells = table.add_row().cells
+        for cell, text in zip(row_cells, row):
+            cell.text = text
+
+
+def bulk(document, rows):
+    add_table(document, HEADER, rows)
+
+
+def best_time(func, rows, repeat):
+    # Only the table building is timed, not creating the document from the template
+    best = float('inf')
+    for _ in range(repeat):
+        document = Document()
+        start = time.perf_counter()
+        func(document, rows)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark docx table rendering.')
+    parser.add_argument('--rows', nargs='+', type=int, default=[10, 100, 1000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    print(f"{'rows':>6} {'cell-by-cell':>16} {'bulk XML':>16} {'speed-up':>9}")
+    for n in args.rows:
+        rows = synthetic_rows(n)
+        before = best_time(cell_by_cell, rows, args.repeat)
+        after = best_time(bulk, rows, args.repeat)
+        print(f"{n:>6} {before / n * 1e6:>11.1f} μs/row {after / n * 1e6:>11.1f} μs/row {before / after:>8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
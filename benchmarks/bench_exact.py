@@ -0,0 +1,91 @@
+# benchmarks/bench_exact.py
+#
+# Cost of the Decimal engine (exact.py) against the float engine (core.py) on the
+# synthetic catalogs of bench_suite.py, at several final volumes. Also checks that
+# repeated Decimal runs give identical results and reports the largest difference
+# between the two engines' additive volumes, which should stay within the pipette
+# resolution.
+#
+#   python benchmarks/bench_exact.py [--sizes 10 100 1000] [--volumes 1 15 1000] [--repeat 5]
+
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import core
+import exact
+from bench_suite import report_volume_ml, synthetic_catalog, synthetic_recipe_rows
+from mediaCalc import parse_recipe_csv
+
+
+def best_time(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def recipe_additives(n):
+    rows = synthetic_recipe_rows(n)
+    lines = [','.join(rows[0])] + [','.join(str(value) for value in row.values()) for row in rows]
+    return parse_recipe_csv(lines)['additives']
+
+
+def max_volume_difference(float_result, exact_result):
+    # Largest |float - Decimal| additive volume in μL
+    differences = [abs(a.volume_ul - float(b.volume_ul))
+                   for a, b in zip(float_result.additives, exact_result.additives)
+                   if a.volume_ul is not None and b.volume_ul is not None]
+    return max(differences, default=0.0)
+
+
+def run(sizes, volumes, repeat, log=print):
+    results = []
+    for n in sizes:
+        components = synthetic_catalog(n)
+        additives = recipe_additives(n)
+        lookup = core.component_lookup(components)
+        # Volumes too small for the recipe are raised to the smallest one that fits
+        for volume in sorted({max(volume, report_volume_ml(n)) for volume in volumes}):
+            def float_engine():
+                return core.compute_recipe(components, additives, volume, lookup=lookup)
+
+            def decimal_engine():
+                return exact.compute_recipe(components, additives, volume, lookup=lookup)
+
+            float_seconds = best_time(float_engine, repeat)
+            exact_seconds = best_time(decimal_engine, repeat)
+            identical = decimal_engine() == decimal_engine()
+            result = {'components': n, 'final_volume_ml': volume, 'float_seconds': float_seconds,
+                      'exact_seconds': exact_seconds, 'identical': identical,
+                      'max_volume_difference_ul': max_volume_difference(float_engine(), decimal_engine())}
+            results.append(result)
+            if log:
+                log(f"{n:>6} {volume:>10g} mL {float_seconds * 1e3:>10.2f} ms {exact_seconds * 1e3:>10.2f} ms "
+                    f"{exact_seconds / float_seconds:>7.1f}x {'yes' if identical else 'NO':>9} "
+                    f"{result['max_volume_difference_ul']:>10.3f} uL")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare the Decimal engine with the float engine.')
+    parser.add_argument('--sizes', nargs='+', type=int, default=[10, 100, 1000], help='Components per catalog/recipe')
+    parser.add_argument('--volumes', nargs='+', type=float, default=[1, 15, 1000], help='Final volumes in mL')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    print(f"{'n':>6} {'volume':>13} {'float':>13} {'Decimal':>13} {'ratio':>8} {'identical':>9} {'max diff':>13}")
+    results = run(args.sizes, args.volumes, args.repeat)
+    if not all(result['identical'] for result in results):
+        raise SystemExit('Decimal results differ between runs')
+
+
+if __name__ == '__main__':
+    main()
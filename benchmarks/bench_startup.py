@@ -0,0 +1,77 @@
+# benchmarks/bench_startup.py
+#
+# Startup cost of the CLI, measured with `python -X importtime`. Reports the total
+# import time, the slowest top-level imports and whether python-docx was loaded.
+# Exits non-zero if the budget is exceeded or docx is imported for a text format,
+# so it can run as a regression check.
+#
+#   python benchmarks/bench_startup.py [--format json] [--budget-ms 150] [--repeat 5]
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+IMPORT_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+
+def run_cli(fmt):
+    # Returns the -X importtime report (stderr) for one CLI run
+    with tempfile.TemporaryDirectory() as tmp:
+        output = '-' if fmt != 'docx' else os.path.join(tmp, 'out.docx')
+        command = [sys.executable, '-X', 'importtime', os.path.join(ROOT, 'cli.py'),
+                   os.path.join(ROOT, 'exampleMedia.csv'), '--volume', '15', '--format', fmt, '--output', output]
+        completed = subprocess.run(command, cwd=ROOT, capture_output=True, text=True, check=True)
+    return completed.stderr
+
+
+def parse_importtime(stderr):
+    # ({module: cumulative μs} for top-level imports, set of every module imported)
+    modules = {}
+    imported = set()
+    for line in stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            imported.add(match.group(4))
+            if len(match.group(3)) <= 1:
+                modules[match.group(4)] = int(match.group(2))
+    return modules, imported
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark CLI import time.')
+    parser.add_argument('--format', default='json')
+    parser.add_argument('--budget-ms', type=float, default=150, help='Fail if total import time exceeds this')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--top', type=int, default=8)
+    args = parser.parse_args(argv)
+
+    # Keep the fastest run to reduce noise from the machine
+    best = None
+    best_imported = set()  # Modules imported by the run kept in best
+    for _ in range(args.repeat):
+        modules, imported = parse_importtime(run_cli(args.format))
+        if best is None or sum(modules.values()) < sum(best.values()):
+            best, best_imported = modules, imported
+
+    total_ms = sum(best.values()) / 1000
+    docx_loaded = 'docx' in best_imported
+    print(f"format={args.format} total import time {total_ms:.1f} ms, python-docx loaded: {docx_loaded}")
+    for name, us in sorted(best.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"  {us / 1000:8.1f} ms  {name}")
+
+    failed = False
+    if args.format != 'docx' and docx_loaded:
+        print('FAIL: python-docx was imported for a non-docx format')
+        failed = True
+    if total_ms > args.budget_ms:
+        print(f"FAIL: import time exceeds the {args.budget_ms:g} ms budget")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,224 @@
+# benchmarks/bench_suite.py
+#
+# Scaling benchmark for the calculation and rendering stages: read_recipe,
+# calculate_stock_solutions, generate_recipe (at every volume of a 1 mL to 10 L sweep),
+# the vectorized volume sweep, build_report and generate_word_document. Synthetic
+# catalogs and recipes are generated at each size; every stage reports its best time
+# and, from a separate tracemalloc run, its peak memory. Results are saved as JSON, and
+# --compare checks them against an earlier run.
+#
+#   python benchmarks/bench_suite.py [--sizes 10 100 1000 10000] [--output results.json]
+#   python benchmarks/bench_suite.py --compare baseline.json [--tolerance 0.25]
+
+import argparse
+import contextlib
+import csv
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+import core
+from mediaCalc import MediaPreparationHelper
+
+SWEEP_VOLUMES_ML = [1, 10, 100, 1000, 10000]
+
+
+def synthetic_catalog(n):
+    # n components cycling through mass-concentration, molar, protein and liquid (dilution) stocks
+    components = []
+    for i in range(n):
+        kind = i % 4
+        comp = {'name': f"Component {i}", 'solvent': 'Water', 'cost': 50 + i % 400, 'catalog_number': f"SYN-{i}"}
+        if kind == 0:
+            comp.update(initial_weight=10, initial_weight_unit='mg', molecular_weight=None,
+                        desired_stock_concentration=10, stock_unit='mg/mL')
+        elif kind == 1:
+            comp.update(initial_weight=5, initial_weight_unit='mg', molecular_weight=250 + i % 250,
+                        desired_stock_concentration=10, stock_unit='mM')
+        elif kind == 2:
+            comp.update(initial_weight=100, initial_weight_unit='ug', molecular_weight=20000.0,
+                        desired_stock_concentration=100, stock_unit='ug/mL', solvent='PBS with 0.1% BSA')
+        else:
+            comp.update(stock_unit='X', cost=30)
+        components.append(comp)
+    return components
+
+
+def synthetic_recipe_rows(n):
+    # Recipe CSV rows using every component of synthetic_catalog(n)
+    rows = [
+        {'Name': 'HEPES-buffered DMEM/F12', 'Type': 'Base Media', 'Desired Concentration': '', 'Desired Unit': 'na',
+         'Dilution Factor': '1'},
+        {'Name': 'Fetal Bovine Serum (FBS)', 'Type': 'Serum', 'Desired Concentration': '', 'Desired Unit': '',
+         'Dilution Factor': '10'},
+    ]
+    # Large recipes get proportionally lower concentrations, so the additives still fit in the media
+    scale = max(1.0, n / 100)
+    desired = {0: (50, 'ug/mL', None), 1: (1, 'uM', None), 2: (50, 'ng/mL', None), 3: (None, '', 1000)}
+    for i in range(n):
+        concentration, unit, dilution = desired[i % 4]
+        rows.append({'Name': f"Component {i}", 'Type': 'Additive',
+                     'Desired Concentration': f"{concentration / scale:g}" if concentration else '',
+                     'Desired Unit': unit, 'Dilution Factor': f"{dilution * scale:g}" if dilution else ''})
+    return rows
+
+
+def write_recipe(rows, path):
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def report_volume_ml(n):
+    # Smallest round volume the base media can still fill: every addition is at least 5 μL
+    return max(15.0, n * core.MIN_VOLUME_UL / 1000 * 4)
+
+
+def measure(func, repeat, setup=None):
+    # (best seconds, peak traced bytes); tracemalloc runs separately so it doesn't skew the timing.
+    # One untimed call first, so lazy imports (numpy for the volume sweep, python-docx) aren't timed.
+    func(setup() if setup else None)
+    best = float('inf')
+    for _ in range(repeat):
+        state = setup() if setup else None
+        start = time.perf_counter()
+        func(state)
+        best = min(best, time.perf_counter() - start)
+
+    state = setup() if setup else None
+    tracemalloc.start()
+    try:
+        func(state)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return best, peak
+
+
+def stages(components, recipe_file, n, volumes, docx_dir):
+    # (stage, final volume or None, function, setup) for one catalog size
+    def helper(final_volume_ml):
+        def setup():
+            core.default_plan_cache.invalidate()  # Time the calculations, not the warm cache
+            return MediaPreparationHelper(components, final_volume_ml, recipe_file)
+        return setup
+
+    report_volume = report_volume_ml(n)
+    yield 'read_recipe', None, lambda _: MediaPreparationHelper(components, report_volume, recipe_file), None
+    yield 'calculate_stock_solutions', None, lambda h: h.calculate_stock_solutions(), helper(report_volume)
+    for volume in volumes:
+        yield 'generate_recipe', volume, lambda h: h.generate_recipe(h.recipe_data), helper(volume)
+    sweep = [volumes[0] * (volumes[-1] / volumes[0]) ** (i / 999) for i in range(1000)]
+    yield 'volume_sweep_1000', None, lambda h: h.calculate_volumes(sweep), helper(report_volume)
+    yield 'build_report', report_volume, lambda h: h.build_report(), helper(report_volume)
+    if docx_dir is not None:
+        def generate_word_document(h):
+            with contextlib.redirect_stdout(io.StringIO()):
+                h.generate_word_document(h.generate_recipe(h.recipe_data), os.path.join(docx_dir, f"bench_{n}.docx"))
+        yield 'generate_word_document', report_volume, generate_word_document, helper(report_volume)
+
+
+def run_suite(sizes, volumes=SWEEP_VOLUMES_ML, repeat=3, docx=True, log=print):
+    try:
+        import docx  # noqa: F401 (only to see whether the Word stage can run)
+    except ImportError:
+        docx = False
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in sizes:
+            components = synthetic_catalog(n)
+            recipe_file = os.path.join(tmp, f"recipe_{n}.csv")
+            write_recipe(synthetic_recipe_rows(n), recipe_file)
+            for stage, volume, func, setup in stages(components, recipe_file, n, volumes, tmp if docx else None):
+                seconds, peak = measure(func, repeat, setup)
+                results.append({'stage': stage, 'components': n, 'final_volume_ml': volume,
+                                'seconds': seconds, 'peak_bytes': peak})
+                if log:
+                    log(format_result(results[-1]))
+    return results
+
+
+def format_result(result):
+    volume = f"{result['final_volume_ml']:g} mL" if result['final_volume_ml'] is not None else ''
+    return (f"{result['stage']:<26} {result['components']:>6} {volume:>10} "
+            f"{result['seconds'] * 1e3:>10.2f} ms {result['peak_bytes'] / 1e6:>9.2f} MB")
+
+
+def metadata():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ''
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'commit': commit or None,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+    }
+
+
+def result_key(result):
+    return result['stage'], result['components'], result['final_volume_ml']
+
+
+def compare(results, baseline, tolerance, min_seconds=1e-3):
+    # Lines comparing two runs, and the results that got slower than baseline x (1 + tolerance).
+    # Stages faster than min_seconds in both runs are too noisy to count as regressions.
+    before = {result_key(result): result for result in baseline}
+    lines = []
+    regressions = []
+    for result in results:
+        old = before.get(result_key(result))
+        if old is None or not old['seconds']:
+            continue
+        ratio = result['seconds'] / old['seconds']
+        flag = ''
+        if ratio > 1 + tolerance and max(result['seconds'], old['seconds']) >= min_seconds:
+            regressions.append(result)
+            flag = '  REGRESSION'
+        lines.append(f"{format_result(result)}  {ratio:>6.2f}x of baseline{flag}")
+    return lines, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the calculation and rendering stages at several catalog sizes.')
+    parser.add_argument('--sizes', nargs='+', type=int, default=[10, 100, 1000, 10000], help='Components per catalog/recipe')
+    parser.add_argument('--volumes', nargs='+', type=float, default=SWEEP_VOLUMES_ML, help='Final volumes (mL) for generate_recipe')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--no-docx', action='store_true', help='Skip the Word document stage')
+    parser.add_argument('--output', '-o', help='Save the results as JSON')
+    parser.add_argument('--compare', help='Earlier JSON results to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed slow-down before a stage counts as a regression')
+    args = parser.parse_args(argv)
+
+    print(f"{'stage':<26} {'n':>6} {'volume':>10} {'time':>13} {'peak memory':>12}")
+    results = run_suite(args.sizes, sorted(args.volumes), args.repeat, docx=not args.no_docx)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'meta': metadata(), 'results': results}, f, indent=2)
+        print(f"Saved results to '{args.output}'.")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        lines, regressions = compare(results, baseline, args.tolerance)
+        print(f"\nCompared with '{args.compare}':")
+        print('\n'.join(lines))
+        if regressions:
+            raise SystemExit(f"{len(regressions)} stage(s) slower than the baseline by more than {args.tolerance:.0%}")
+
+
+if __name__ == '__main__':
+    main()
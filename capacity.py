@@ -0,0 +1,190 @@
+# capacity.py
+#
+# Reverse of calculate_volume: the largest final volume of each recipe that the stock
+# on hand can make, and the component that runs out first. The inventory lists, per
+# component, the prepared stock left over (stock_volume_ml, at the planned stock
+# concentration unless stock_concentration says otherwise) and the powder still on the
+# shelf (initial_weight, in the catalog's unit). Powder counts as the stock it would
+# make, through the same plan_stock_solution math as the document. Components the
+# inventory doesn't list fall back to one vial of the catalog's initial_weight; liquids
+# without either are not limiting.
+#
+# All recipes are solved at once: the stock each recipe draws per mL of media (from
+# the same concentration math as vectorized.calculate_volume_matrix) forms a recipes x
+# components matrix, and dividing the supply by it gives every limit in one step.
+#
+#   python capacity.py exampleMedia.csv colonMedia.csv [--inventory inventory.csv]
+#
+# Inventory CSV columns: name, stock_volume_ml, stock_concentration, initial_weight
+# (empty cells are left out).
+
+import argparse
+import csv
+import math
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+import numpy as np
+
+from catalog import as_catalog
+from components import components_stock
+from core import default_plan_cache, plan_stock_solution, stock_concentration_for
+from vectorized import recipe_arrays
+
+INVENTORY_FIELDS = ('stock_volume_ml', 'stock_concentration', 'initial_weight')
+
+
+@dataclass(frozen=True)
+class RecipeCapacity:
+    recipe: str
+    max_volume_ml: float  # inf if nothing in the inventory limits the recipe
+    bottleneck: Optional[str]
+    limits: Tuple[Tuple[str, float], ...]  # (component, largest final volume in mL), tightest first
+    errors: Tuple[Tuple[str, str], ...] = ()  # (additive, reason) for additives left out
+
+
+def read_inventory(inventory_file):
+    # {component name: {'stock_volume_ml': ..., 'stock_concentration': ..., 'initial_weight': ...}}
+    inventory = {}
+    with open(inventory_file, 'r', newline='', encoding='utf-8') as csvfile:
+        for line, row in enumerate(csv.DictReader(csvfile), start=2):
+            name = (row.get('name') or '').strip()
+            if not name:
+                continue
+            entry = {}
+            for key in INVENTORY_FIELDS:
+                value = (row.get(key) or '').strip()
+                if value:
+                    try:
+                        entry[key] = float(value)
+                    except ValueError:
+                        raise ValueError(f"{inventory_file}, line {line}: {key} '{value}' is not a number")
+            inventory[name] = entry
+    return inventory
+
+
+def stock_supply_ml(comp, stock_concentration, entry=None):
+    # Prepared stock plus the stock the shelf powder would make, in mL at stock_concentration;
+    # None if the inventory doesn't track the component
+    if entry is None:
+        if 'initial_weight' not in comp:
+            return None
+        entry = {'initial_weight': comp['initial_weight']}
+
+    supply_ml = entry.get('stock_volume_ml', 0.0)
+    if supply_ml and stock_concentration:
+        supply_ml *= entry.get('stock_concentration', stock_concentration) / stock_concentration
+
+    weight = entry.get('initial_weight')
+    if weight and stock_concentration is not None:
+        plan = plan_stock_solution(dict(comp, initial_weight=weight), stock_concentration, max_volume_ml=math.inf)
+        if plan is not None and plan.stock_volume_ml:
+            supply_ml += plan.stock_volume_ml
+    return supply_ml
+
+
+def usage_rates(catalog, recipe_data):
+    # ({component name: μL of its stock per mL of media}, [(additive, reason)]) for one recipe
+    names, stock_conc, desired_conc, dilution_factors, _, working_dilution, errors = recipe_arrays(catalog, recipe_data)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rates = np.where(np.isnan(dilution_factors),
+                         desired_conc * 1000 / (stock_conc * np.where(np.isnan(working_dilution), 1.0, working_dilution)),
+                         1000 / dilution_factors)
+    usage = {}
+    for i, (name, rate) in enumerate(zip(names, rates)):
+        if i in errors or np.isnan(rate):
+            continue
+        component = catalog.find(name)['name']
+        usage[component] = usage.get(component, 0.0) + float(rate)
+    return usage, [(names[i], reason) for i, reason in errors.items()]
+
+
+def capacity_matrix(recipes, components_stock=components_stock, inventory=None):
+    # (recipe names, component names, limits, errors): limits[i, j] is the largest final volume
+    # (mL) of recipe i that component j allows, inf where it isn't used or isn't tracked.
+    # recipes maps a name to its additives (parse_recipe(...)['additives']).
+    catalog = as_catalog(components_stock)
+    inventory = inventory or {}
+    recipe_names = list(recipes)
+    usages = []
+    errors = []
+    component_index = {}
+    for name in recipe_names:
+        usage, recipe_errors = usage_rates(catalog, recipes[name])
+        usages.append(usage)
+        errors.append(recipe_errors)
+        for component in usage:
+            component_index.setdefault(component, len(component_index))
+
+    rates = np.zeros((len(recipe_names), len(component_index)))
+    for i, usage in enumerate(usages):
+        for component, rate in usage.items():
+            rates[i, component_index[component]] = rate
+
+    supply = np.full(len(component_index), np.inf)
+    version = getattr(catalog, 'version', None)
+    for component, j in component_index.items():
+        comp = catalog.find(component)
+        try:
+            # The planned stock, as recipe_arrays uses for the rates
+            stock_concentration, _ = stock_concentration_for(comp, default_plan_cache.plan(comp, catalog_version=version))
+        except ValueError:
+            stock_concentration = None  # Liquid used by dilution factor
+        entry = inventory.get(component)
+        supplied = stock_supply_ml(comp, stock_concentration, entry)
+        if supplied is not None:
+            supply[j] = supplied
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        limits = np.where(rates > 0, supply * 1000 / rates, np.inf)  # mL of stock x 1000 / (μL per mL)
+    return recipe_names, list(component_index), limits, errors
+
+
+def recipe_capacities(recipes, components_stock=components_stock, inventory=None):
+    # One RecipeCapacity per recipe, in the order given
+    recipe_names, components, limits, errors = capacity_matrix(recipes, components_stock, inventory)
+    capacities = []
+    if not components:
+        limits = np.full((len(recipe_names), 1), np.inf)
+    best = limits.argmin(axis=1)
+    max_volume = limits.min(axis=1)
+    for i, name in enumerate(recipe_names):
+        finite = np.flatnonzero(np.isfinite(limits[i]))
+        order = finite[np.argsort(limits[i, finite], kind='stable')]
+        capacities.append(RecipeCapacity(
+            recipe=name,
+            max_volume_ml=float(max_volume[i]),
+            bottleneck=components[best[i]] if np.isfinite(max_volume[i]) else None,
+            limits=tuple((components[j], float(limits[i, j])) for j in order),
+            errors=tuple(errors[i]),
+        ))
+    return capacities
+
+
+def main(argv=None):
+    from catalog_store import load_catalog
+    from mediaCalc import parse_recipe
+
+    parser = argparse.ArgumentParser(description='Largest final volume of each recipe the stock on hand can make.')
+    parser.add_argument('recipes', nargs='+', help='Recipe CSV files')
+    parser.add_argument('--inventory', help="CSV with 'name', 'stock_volume_ml', 'stock_concentration' and 'initial_weight'")
+    parser.add_argument('--catalog', help='Component catalog .csv or .sqlite file (default: components.py)')
+    parser.add_argument('--limits', type=int, default=3, help='Tightest components to list per recipe')
+    args = parser.parse_args(argv)
+
+    inventory = read_inventory(args.inventory) if args.inventory else None
+    catalog = load_catalog(args.catalog)
+    recipes = {recipe_file: parse_recipe(recipe_file, catalog)['additives'] for recipe_file in args.recipes}
+    for capacity in recipe_capacities(recipes, catalog, inventory):
+        if capacity.bottleneck is None:
+            print(f"{capacity.recipe}: not limited by the inventory")
+        else:
+            print(f"{capacity.recipe}: up to {capacity.max_volume_ml:.4g} mL, limited by {capacity.bottleneck}")
+            for component, volume_ml in capacity.limits[1:args.limits]:
+                print(f"    then {component} at {volume_ml:.4g} mL")
+        for additive, reason in capacity.errors:
+            print(f"    ! {additive}: {reason}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+# catalog.py
+
+import itertools
+import re
+from collections.abc import Sequence
+from types import MappingProxyType
+
+
+def normalize_name(name):
+    # Case, whitespace and hyphen insensitive key, so "Ascorbate-2-phosphate" matches "ascorbate 2-phosphate"
+    return ' '.join(part for part in re.split(r'[\s\-_]+', name.lower()) if part)
+
+
+# Every catalog gets a new version, so caches keyed by it never mix catalogs
+_versions = itertools.count(1)
+
+
+class ComponentCatalog(Sequence):
+    # Read-only, indexed view of the components_stock list.
+    # Iterates and indexes like the list, and find() looks names up in O(1).
+    def __init__(self, components, aliases=None):
+        # Read-only copies of the entries, so neither the catalog nor the source list can be changed through it
+        self._components = tuple(MappingProxyType(dict(comp)) for comp in components)
+        self.version = next(_versions)
+        self._by_name = {}
+        self._by_alias = {}
+        for comp in self._components:
+            self._by_name.setdefault(comp['name'], comp)
+            for alias in [comp['name']] + list(comp.get('aliases', [])):
+                self._by_alias.setdefault(normalize_name(alias), comp)
+
+        # Extra aliases given as {alias: component name}
+        for alias, name in (aliases or {}).items():
+            comp = self.find(name)
+            if comp is None:
+                raise ValueError(f"Alias '{alias}' refers to unknown component {name}")
+            self._by_alias.setdefault(normalize_name(alias), comp)
+
+    def __getitem__(self, index):
+        return self._components[index]
+
+    def __len__(self):
+        return len(self._components)
+
+    def __repr__(self):
+        return f"ComponentCatalog({len(self)} components)"
+
+    def find(self, name):
+        # Exact name first, then the normalized alias index
+        comp = self._by_name.get(name)
+        if comp is None:
+            comp = self._by_alias.get(normalize_name(name))
+        return comp
+
+    def names(self):
+        return list(self._by_name)
+
+
+def as_catalog(components_stock):
+    # Accept either a ComponentCatalog or a plain components_stock list
+    if isinstance(components_stock, ComponentCatalog):
+        return components_stock
+    return ComponentCatalog(components_stock)
+
+
+def component_skus(comp):
+    # Purchasable pack sizes for a component. Entries may list several under 'skus'
+    # (each with its own cost, initial_weight and optionally catalog_number/vendor/
+    # initial_weight_unit); otherwise the entry's own weight and cost are the only SKU.
+    defaults = {
+        'catalog_number': comp.get('catalog_number'),
+        'vendor': comp.get('vendor'),
+        'initial_weight_unit': comp.get('initial_weight_unit'),
+    }
+    skus = comp.get('skus')
+    if skus:
+        return [dict(defaults, **sku) for sku in skus]
+    if 'initial_weight' in comp and 'cost' in comp:
+        return [dict(defaults, initial_weight=comp['initial_weight'], cost=comp['cost'])]
+    return []
@@ -0,0 +1,293 @@
+# catalog_store.py
+#
+# Component catalogs kept outside the code, in a CSV file or an SQLite database.
+# SQLite catalogs are read lazily: opening one reads nothing but the row count, and
+# find() fetches a single entry through the name index, so a recipe only ever loads the
+# components it references. A CSV catalog is parsed once into an SQLite cache next to it
+# (<catalog>.csv.cache.sqlite) and opened from there until the CSV changes, so startup
+# doesn't grow with the catalog.
+#
+#   python catalog_store.py export components.sqlite    (write components.py to SQLite or CSV)
+#   python catalog_store.py info catalog.csv
+
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+from types import MappingProxyType
+
+from catalog import ComponentCatalog, _versions, normalize_name
+
+SCHEMA_VERSION = 1
+
+# CSV columns read as numbers; everything else stays a string
+NUMERIC_FIELDS = {
+    'initial_weight', 'molecular_weight', 'desired_stock_concentration', 'adjusted_stock_concentration',
+    'stock_concentration', 'max_stock_concentration', 'working_solution_concentration', 'cost',
+}
+# CSV columns holding lists: aliases separated by ';', skus as JSON
+LIST_FIELDS = {'aliases'}
+JSON_FIELDS = {'skus'}
+
+CSV_FIELDS = [
+    'name', 'initial_weight', 'initial_weight_unit', 'molecular_weight', 'desired_stock_concentration',
+    'stock_unit', 'solvent', 'cost', 'catalog_number', 'purpose',
+]
+
+
+def _number(value):
+    try:
+        return int(value)
+    except ValueError:
+        return float(value)
+
+
+def parse_component_row(row):
+    # One CSV row as a catalog entry; empty cells are left out, as in components.py
+    comp = {}
+    for key, value in row.items():
+        if key is None or value is None:
+            continue
+        key = key.strip()
+        value = value.strip()
+        if not key or value == '':
+            continue
+        try:
+            if key in NUMERIC_FIELDS:
+                value = _number(value)
+            elif key in LIST_FIELDS:
+                value = [part.strip() for part in value.split(';') if part.strip()]
+            elif key in JSON_FIELDS:
+                value = json.loads(value)
+        except ValueError:
+            raise ValueError(f"Invalid {key} '{value}' for component {row.get('name')}")
+        comp[key] = value
+    if 'name' not in comp:
+        raise ValueError(f"Catalog row without a name: {dict(row)}")
+    return comp
+
+
+def read_components_csv(path):
+    with open(path, 'r', newline='', encoding='utf-8') as f:
+        return [parse_component_row(row) for row in csv.DictReader(f)]
+
+
+def write_components_csv(components, path):
+    fields = list(CSV_FIELDS)
+    for comp in components:
+        fields.extend(key for key in comp if key not in fields)
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        for comp in components:
+            row = {}
+            for key, value in comp.items():
+                if value is None:
+                    continue
+                if key in LIST_FIELDS:
+                    value = ';'.join(value)
+                elif key in JSON_FIELDS:
+                    value = json.dumps(value)
+                row[key] = value
+            writer.writerow(row)
+
+
+def write_components_sqlite(components, path, source=None):
+    # Entries are stored as JSON, so types (ints, None, lists) come back exactly as written.
+    # The database is built in a temporary file and moved into place, so readers never see half of it.
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(suffix='.sqlite', dir=directory)
+    os.close(fd)
+    try:
+        connection = sqlite3.connect(tmp_path)
+        with connection:
+            connection.executescript("""
+                CREATE TABLE components (position INTEGER PRIMARY KEY, name TEXT NOT NULL, data TEXT NOT NULL);
+                CREATE INDEX components_name ON components (name);
+                CREATE TABLE aliases (alias TEXT PRIMARY KEY, position INTEGER NOT NULL);
+                CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+            """)
+            aliases = {}
+            rows = []
+            for position, comp in enumerate(components):
+                rows.append((position, comp['name'], json.dumps(dict(comp))))
+                for alias in [comp['name']] + list(comp.get('aliases', [])):
+                    aliases.setdefault(normalize_name(alias), position)
+            connection.executemany('INSERT INTO components VALUES (?, ?, ?)', rows)
+            connection.executemany('INSERT INTO aliases VALUES (?, ?)', aliases.items())
+            meta = {'schema_version': SCHEMA_VERSION}
+            if source is not None:
+                meta['source'] = source
+            connection.executemany('INSERT INTO meta VALUES (?, ?)',
+                                   [(key, json.dumps(value)) for key, value in meta.items()])
+        connection.close()
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+class SQLiteCatalog(ComponentCatalog):
+    # ComponentCatalog over an SQLite file. Entries are fetched on first use and kept;
+    # iterating (e.g. core.calculate_stock_solutions over the whole catalog) loads them all.
+    def __init__(self, path, aliases=None):
+        self.path = path
+        self.version = next(_versions)
+        self._connection = sqlite3.connect(f"file:{os.path.abspath(path)}?mode=ro", uri=True,
+                                           check_same_thread=False)
+        self._lock = threading.Lock()  # One connection shared by the server's worker threads
+        self._rows = {}       # position -> entry
+        self._positions = {}  # name or normalized alias -> position (None if not in the catalog)
+        self._length = self._query_one('SELECT COUNT(*) FROM components')[0]
+        self._extra_aliases = {normalize_name(alias): name for alias, name in (aliases or {}).items()}
+        for alias, name in self._extra_aliases.items():
+            if self.find(name) is None:
+                raise ValueError(f"Alias '{alias}' refers to unknown component {name}")
+
+    def _query_one(self, sql, parameters=()):
+        with self._lock:
+            return self._connection.execute(sql, parameters).fetchone()
+
+    def meta(self):
+        with self._lock:
+            rows = self._connection.execute('SELECT key, value FROM meta').fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def _entry(self, position):
+        if position not in self._rows:
+            row = self._query_one('SELECT data FROM components WHERE position = ?', (position,))
+            self._rows[position] = MappingProxyType(json.loads(row[0]))
+        return self._rows[position]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('catalog index out of range')
+        return self._entry(index)
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        # Fetch the rows not loaded yet in one query
+        with self._lock:
+            rows = self._connection.execute('SELECT position, data FROM components ORDER BY position').fetchall()
+        for position, data in rows:
+            if position not in self._rows:
+                self._rows[position] = MappingProxyType(json.loads(data))
+        return (self._rows[position] for position in range(len(self)))
+
+    def __repr__(self):
+        return f"SQLiteCatalog({self.path!r}, {len(self)} components)"
+
+    def _position(self, name):
+        if name in self._positions:
+            return self._positions[name]
+        # Exact name first (first entry wins, as with the list), then the normalized alias index
+        row = self._query_one('SELECT MIN(position) FROM components WHERE name = ?', (name,))
+        position = row[0] if row else None
+        if position is None:
+            key = normalize_name(name)
+            row = self._query_one('SELECT position FROM aliases WHERE alias = ?', (key,))
+            position = row[0] if row else None
+            if position is None and key in self._extra_aliases:
+                position = self._position(self._extra_aliases[key])
+        self._positions[name] = position
+        return position
+
+    def find(self, name):
+        position = self._position(name)
+        return self._entry(position) if position is not None else None
+
+    def names(self):
+        with self._lock:
+            rows = self._connection.execute('SELECT name FROM components ORDER BY position').fetchall()
+        return list(dict.fromkeys(name for name, in rows))
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+def cache_path_for(csv_path):
+    return csv_path + '.cache.sqlite'
+
+
+def _csv_signature(csv_path):
+    stat = os.stat(csv_path)
+    return {'path': os.path.abspath(csv_path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def cached_csv_catalog(csv_path, cache_path=None):
+    # SQLiteCatalog for a CSV catalog, rebuilding the cache only when the CSV has changed
+    cache_path = cache_path or cache_path_for(csv_path)
+    signature = _csv_signature(csv_path)
+    if os.path.exists(cache_path):
+        try:
+            catalog = SQLiteCatalog(cache_path)
+            meta = catalog.meta()
+            if meta.get('schema_version') == SCHEMA_VERSION and meta.get('source') == signature:
+                return catalog
+            catalog.close()
+        except sqlite3.Error:
+            pass  # Unreadable cache; rebuild it
+    write_components_sqlite(read_components_csv(csv_path), cache_path, source=signature)
+    return SQLiteCatalog(cache_path)
+
+
+def open_catalog(path, cache=True):
+    # ComponentCatalog for a .csv, .sqlite or .db catalog file
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.csv':
+        if cache:
+            return cached_csv_catalog(path)
+        return ComponentCatalog(read_components_csv(path))
+    if extension in ('.sqlite', '.sqlite3', '.db'):
+        return SQLiteCatalog(path)
+    raise ValueError(f"Unknown catalog format '{extension}'. Use .csv, .sqlite or .db")
+
+
+def load_catalog(path=None):
+    # The catalog file at path, or the built-in components.py list
+    if path is None:
+        from components import components_stock
+        return ComponentCatalog(components_stock)
+    return open_catalog(path)
+
+
+def export_catalog(components, path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.csv':
+        write_components_csv(components, path)
+    elif extension in ('.sqlite', '.sqlite3', '.db'):
+        write_components_sqlite(components, path)
+    else:
+        raise ValueError(f"Unknown catalog format '{extension}'. Use .csv, .sqlite or .db")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Convert and inspect component catalogs.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    export = subparsers.add_parser('export', help='Write components.py to a .csv or .sqlite catalog')
+    export.add_argument('path')
+    info = subparsers.add_parser('info', help='Show the size of a catalog file')
+    info.add_argument('path')
+    args = parser.parse_args(argv)
+
+    if args.command == 'export':
+        from components import components_stock
+        export_catalog(components_stock, args.path)
+        print(f"Wrote {len(components_stock)} components to '{args.path}'.")
+    else:
+        catalog = open_catalog(args.path)
+        print(f"{args.path}: {len(catalog)} components")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+# cli.py
+#
+# Command line entry point. Only the standard library and the calculation modules are
+# imported at startup; python-docx is loaded only when a .docx is actually written.
+#
+#   python cli.py exampleMedia.csv --volume 15
+#   python cli.py exampleMedia.csv --volume 15 50 500 --format json
+#   python cli.py exampleMedia.csv --volume 15 --format md --output -
+#   python cli.py exampleMedia.csv --volume 15 --exact     (Decimal engine, see exact.py)
+#   python cli.py exampleMedia.csv --volume 15 --ledger stock.ledger   (record the batch, see ledger.py)
+
+import argparse
+import sys
+
+FORMATS = ['docx', 'json', 'csv', 'md', 'html']
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Generate media preparation instructions from a recipe CSV.')
+    parser.add_argument('recipe', help="Recipe CSV file (with a 'Recipe ID' column, one document per recipe)")
+    parser.add_argument('--volume', '-v', nargs='+', type=float, required=True, help='Final volume(s) in mL')
+    parser.add_argument('--format', '-f', choices=FORMATS,
+                        help='Output format (default: from the --output extension, otherwise docx)')
+    parser.add_argument('--output', '-o',
+                        help="Output file, or '-' for stdout. Defaults to <recipe>_<volume>mL.<format>; "
+                             "with several volumes, '{volume}' in the name is replaced by each volume, "
+                             "and with several recipes, '{recipe}' by each Recipe ID")
+    parser.add_argument('--catalog', help='Component catalog .csv or .sqlite file (default: components.py)')
+    parser.add_argument('--stats', action='store_true', help='Print per-stage timings and lookup counts to stderr as JSON')
+    parser.add_argument('--exact', action='store_true',
+                        help='Use the Decimal engine: volumes rounded to pipette resolution, costs to the cent')
+    parser.add_argument('--cache', help='Output cache directory: reuse documents whose inputs have not changed')
+    parser.add_argument('--ledger', help='Stock ledger file: record what each batch draws from the stocks')
+    return parser
+
+
+def output_filename(recipe_file, final_volume_ml, fmt, output=None, recipe_id=None):
+    from recipe_parser import recipe_stem
+
+    if output:
+        return output.replace('{volume}', f"{final_volume_ml:g}").replace('{recipe}', recipe_stem(recipe_file, recipe_id))
+    return f"{recipe_stem(recipe_file, recipe_id)}_{final_volume_ml:g}mL.{fmt}"
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    from writers import output_format, render_report
+
+    fmt = args.format
+    if fmt is None:
+        fmt = output_format(args.output) if args.output and args.output != '-' else 'docx'
+    if args.output == '-' and fmt == 'docx':
+        raise SystemExit("Word documents can't be written to stdout; pick another --format.")
+    if len(args.volume) > 1 and args.output and args.output != '-' and '{volume}' not in args.output:
+        raise SystemExit("With several volumes, --output must contain '{volume}'.")
+
+    from catalog_store import load_catalog
+    from mediaCalc import MediaPreparationHelper
+    from recipe_parser import RecipeParseError, load_file_recipes, recipe_label
+
+    instrumentation = None
+    if args.stats:
+        from instrumentation import Instrumentation
+        instrumentation = Instrumentation()
+
+    rounding = None
+    if args.exact:
+        from exact import DEFAULT_POLICY
+        rounding = DEFAULT_POLICY
+
+    cache = None
+    if args.cache:
+        from output_cache import OutputCache
+        cache = OutputCache(args.cache)
+
+    components_stock = load_catalog(args.catalog)
+
+    try:
+        if instrumentation is not None:
+            with instrumentation.stage('parse'):
+                recipes = load_file_recipes([args.recipe], components_stock)
+        else:
+            recipes = load_file_recipes([args.recipe], components_stock)
+    except RecipeParseError as e:
+        raise SystemExit(str(e))
+    if len(recipes) > 1 and args.output and args.output != '-' and '{recipe}' not in args.output:
+        raise SystemExit("With several recipes in the file, --output must contain '{recipe}'.")
+
+    ledger = None
+    if args.ledger:
+        from ledger import StockLedger
+        ledger = StockLedger(args.ledger)
+    try:
+        for _, recipe_id, recipe in recipes:
+            for final_volume_ml in args.volume:
+                helper = MediaPreparationHelper(components_stock, final_volume_ml, args.recipe, recipe=recipe,
+                                                instrumentation=instrumentation, rounding=rounding,
+                                                cache=cache)
+                if args.output == '-':
+                    sys.stdout.write(render_report(helper.build_report(), fmt))
+                else:
+                    filename = output_filename(args.recipe, final_volume_ml, fmt, args.output, recipe_id)
+                    helper.write_output(filename, fmt=fmt)
+                    print(f"Wrote '{filename}'.")
+                # Only a batch whose document was written takes stock off the books
+                if ledger is not None:
+                    batch = helper.record_batch(ledger, f"{recipe_label(args.recipe, recipe_id)} {final_volume_ml:g} mL")
+                    for shortfall in batch.shortfalls:
+                        print(f"! {shortfall.component}: needs {shortfall.draw_ml * 1000:.4g} μL, "
+                              f"{shortfall.balance_ml * 1000:.4g} μL left", file=sys.stderr)
+    finally:
+        if ledger is not None:
+            ledger.close()
+
+    if instrumentation is not None:
+        import json
+        print(json.dumps(instrumentation.summary(), indent=2), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
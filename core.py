@@ -0,0 +1,408 @@
+# core.py
+#
+# Side-effect-free calculation layer. Nothing in here writes to the component or
+# recipe dicts it is given; every function returns new, immutable result objects,
+# so results can be cached and computed from threads or process pools.
+
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from typing import Optional, Tuple
+
+import units
+from units import conversion_factor, conversion_factor_table, is_unit, parse_unit, to_base
+
+# Conversion factors for units, kept for code that still reads the old table;
+# the calculations themselves go through the unit registry in units.py
+CONVERSION_FACTORS = conversion_factor_table([
+    'mg', 'ug', 'μg', 'g',
+    'mg/mL', 'ug/mL', 'μg/mL', 'ng/mL', 'ng/μL',
+    'M', 'mM', 'uM', 'μM', 'nM',
+    'X',
+])
+
+MAX_STOCK_VOLUME_ML = 15  # Stock volumes above this are capped by weighing out less
+MIN_VOLUME_UL = 5         # Smallest volume we pipette into the media
+
+# Bump whenever the calculations (here or in exact.py) change their results; cached documents
+# (see output_cache.py) computed by another version are then made again
+CALCULATION_VERSION = 1
+
+
+@dataclass(frozen=True)
+class StockPreparation:
+    name: str
+    initial_weight: float
+    initial_weight_unit: str
+    stock_concentration: float
+    stock_unit: str
+    solvent: str
+    stock_volume_ml: Optional[float]
+    cost_per_ml: Optional[float]
+
+    def as_dict(self, component=None):
+        # Same keys calculate_stock_solutions used to write into the component dict
+        data = dict(component) if component is not None else {}
+        data.update(asdict(self))
+        return data
+
+
+@dataclass(frozen=True)
+class VolumeCalculation:
+    volume_ul: float
+    adjusted_stock_concentration: Optional[float] = None
+    working_solution_dilution_factor: Optional[float] = None
+
+
+@dataclass(frozen=True)
+class AdditiveResult:
+    name: str
+    volume_ul: Optional[float]
+    cost: Optional[float]
+    note: Optional[str] = None
+    adjusted_stock_concentration: Optional[float] = None
+    working_solution_dilution_factor: Optional[float] = None
+
+    def as_dict(self):
+        # Row format returned by MediaPreparationHelper.generate_recipe
+        data = {
+            'name': self.name,
+            'volume_ul': self.volume_ul,
+            'cost': self.cost,
+        }
+        if self.note is not None:
+            data['note'] = self.note
+        return data
+
+
+@dataclass(frozen=True)
+class RecipeResult:
+    final_volume_ml: float
+    additives: Tuple[AdditiveResult, ...]
+    stock_preparations: Tuple[StockPreparation, ...]
+
+    def as_rows(self):
+        return [additive.as_dict() for additive in self.additives]
+
+
+def plan_stock_solution(comp, concentration=None, max_volume_ml=MAX_STOCK_VOLUME_ML):
+    # Stock preparation for one catalog entry, or None if it is not prepared from powder
+    if 'initial_weight' not in comp or 'desired_stock_concentration' not in comp:
+        return None
+
+    initial_weight = comp['initial_weight']  # Amount
+    initial_weight_unit = comp['initial_weight_unit']  # Unit
+    molecular_weight = comp.get('molecular_weight')  # g/mol
+    if concentration is None:
+        concentration = comp.get('adjusted_stock_concentration', comp['desired_stock_concentration'])
+    stock_unit = comp['stock_unit']
+    solvent = comp.get('solvent', 'Appropriate solvent')
+
+    # Convert initial weight to grams
+    weight_unit = parse_unit(initial_weight_unit)
+    initial_weight_g = initial_weight * weight_unit.scale
+
+    # Stock units we can't parse (or that aren't concentrations) have no stock volume
+    dimension = parse_unit(stock_unit).dimension if is_unit(stock_unit) else None
+
+    # Calculate volume_ml based on the concentration
+    if dimension == units.MASS_CONCENTRATION:
+        # For mass-based concentrations
+        concentration_mg_per_ml = concentration * conversion_factor(stock_unit, 'mg/mL')
+
+        mass_mg = initial_weight_g * 1000  # Convert g to mg
+        volume_ml = mass_mg / concentration_mg_per_ml  # in mL
+
+    elif dimension == units.MOLAR:
+        # For molar concentrations
+        if molecular_weight is None:
+            raise ValueError(f"Molecular weight is required for component {comp['name']}")
+
+        concentration_M = to_base(concentration, stock_unit, units.MOLAR)
+
+        moles = initial_weight_g / molecular_weight  # in mol
+        volume_L = moles / concentration_M  # in L
+        volume_ml = volume_L * 1000  # in mL
+
+    else:
+        volume_ml = None
+
+    # Weigh out less if the volume exceeds the cap
+    if volume_ml and volume_ml > max_volume_ml:
+        volume_ml = max_volume_ml
+        if dimension == units.MASS_CONCENTRATION:
+            mass_mg = concentration_mg_per_ml * volume_ml  # mg/mL * mL
+            adjusted_initial_weight_g = mass_mg / 1000  # Convert mg to g
+        else:
+            moles = concentration_M * (volume_ml / 1000)  # Convert mL to L
+            adjusted_initial_weight_g = moles * molecular_weight  # in g
+
+        initial_weight = adjusted_initial_weight_g / weight_unit.scale  # Convert back to original unit
+
+    # Calculate cost per mL
+    if 'cost' in comp and volume_ml:
+        cost_per_ml = comp['cost'] / volume_ml
+    else:
+        cost_per_ml = None
+
+    return StockPreparation(
+        name=comp['name'],
+        initial_weight=initial_weight,
+        initial_weight_unit=initial_weight_unit,
+        stock_concentration=concentration,
+        stock_unit=stock_unit,
+        solvent=solvent,
+        stock_volume_ml=volume_ml,
+        cost_per_ml=cost_per_ml,
+    )
+
+
+def calculate_stock_solutions(components_stock, max_volume_ml=MAX_STOCK_VOLUME_ML):
+    stock_preparations = []
+    for comp in components_stock:
+        plan = plan_stock_solution(comp, max_volume_ml=max_volume_ml)
+        if plan is not None:
+            stock_preparations.append(plan)
+    return tuple(stock_preparations)
+
+
+def stock_concentration_for(component_stock, stock_plan=None):
+    # (concentration, unit) of the stock an additive is pipetted from, preferring the planned stock
+    if stock_plan is not None:
+        stock_concentration = stock_plan.stock_concentration
+        stock_unit = stock_plan.stock_unit
+    else:
+        stock_concentration = component_stock.get('stock_concentration', component_stock.get('desired_stock_concentration'))
+        stock_unit = component_stock.get('stock_unit')
+    if stock_concentration is None or stock_unit is None:
+        raise ValueError(f"No stock concentration found for component {component_stock['name']}")
+    return stock_concentration, stock_unit
+
+
+def common_concentrations(component_stock, stock_concentration, stock_unit, desired_concentration, desired_unit):
+    # Stock and desired concentrations in the stock's base unit (see units.py), going through
+    # the working solution if the component has one. Returns
+    # (stock_conc_common, desired_conc_common, pipetted stock Unit, working solution dilution factor).
+    molecular_weight = component_stock.get('molecular_weight')
+    try:
+        stock = parse_unit(stock_unit)
+        desired = parse_unit(desired_unit)
+    except ValueError:
+        raise ValueError(f"Unit conversion not defined for units {stock_unit} or {desired_unit}")
+
+    # Handle working solutions
+    working_solution_dilution_factor = None
+    if 'working_solution_concentration' in component_stock:
+        working = parse_unit(component_stock['working_solution_unit'])
+        working_concentration = component_stock['working_solution_concentration']
+
+        # Calculate dilution factor to make working solution
+        working_solution_dilution_factor = to_base(stock_concentration, stock, working.dimension, molecular_weight) / \
+                                           (working_concentration * working.scale)
+        stock_concentration = working_concentration
+        stock = working
+
+    # Convert concentrations to common units
+    stock_conc_common = stock_concentration * stock.scale
+    desired_conc_common = to_base(desired_concentration, desired, stock.dimension, molecular_weight)
+    return stock_conc_common, desired_conc_common, stock, working_solution_dilution_factor
+
+
+def calculate_volume(component_stock, desired_concentration_info, final_volume_ml, stock_plan=None,
+                     min_volume_ul=MIN_VOLUME_UL):
+    # Volume of one additive in μL; raises ValueError if it cannot be calculated
+    if 'dilution_factor' in desired_concentration_info:
+        # Volume based on dilution factor
+        volume_needed_ml = final_volume_ml / desired_concentration_info['dilution_factor']
+        return VolumeCalculation(volume_needed_ml * 1000)
+
+    stock_concentration, stock_unit = stock_concentration_for(component_stock, stock_plan)
+    stock_conc_common, desired_conc_common, stock, working_solution_dilution_factor = common_concentrations(
+        component_stock, stock_concentration, stock_unit,
+        desired_concentration_info['desired_concentration'], desired_concentration_info['desired_unit'])
+
+    # Calculate volume in uL
+    volume_ul = (desired_conc_common * final_volume_ml * 1000) / stock_conc_common
+
+    # Adjust stock concentration if volume is less than the minimum
+    adjusted_stock_concentration = None
+    if volume_ul < min_volume_ul:
+        stock_conc_common = (desired_conc_common * final_volume_ml * 1000) / min_volume_ul
+        # Convert back to original stock unit
+        adjusted_stock_concentration = stock_conc_common / stock.scale
+        volume_ul = (desired_conc_common * final_volume_ml * 1000) / stock_conc_common
+
+    return VolumeCalculation(volume_ul, adjusted_stock_concentration, working_solution_dilution_factor)
+
+
+def calculate_additive(component_stock, item, final_volume_ml, stock_plan=None, **options):
+    # One generate_recipe row as an AdditiveResult; calculation errors become the note
+    if component_stock is None:
+        return AdditiveResult(item['name'], None, None, 'Component not found in stock!')
+    try:
+        calculation = calculate_volume(component_stock, item, final_volume_ml, stock_plan, **options)
+    except ValueError as e:
+        return AdditiveResult(item['name'], None, None, str(e))
+
+    # Calculate cost for the volume added
+    cost = None
+    cost_per_ml = stock_plan.cost_per_ml if stock_plan is not None else component_stock.get('cost_per_ml')
+    if cost_per_ml is not None:
+        cost = (calculation.volume_ul / 1000) * cost_per_ml  # Convert μL to mL
+
+    # Add note if working solution is needed
+    note = None
+    if calculation.working_solution_dilution_factor is not None:
+        note = f"Prepare working solution by diluting the stock {int(calculation.working_solution_dilution_factor)}:1."
+
+    return AdditiveResult(
+        name=item['name'],
+        volume_ul=calculation.volume_ul,
+        cost=cost,
+        note=note,
+        adjusted_stock_concentration=calculation.adjusted_stock_concentration,
+        working_solution_dilution_factor=calculation.working_solution_dilution_factor,
+    )
+
+
+def component_lookup(components_stock):
+    # Name -> component function; ComponentCatalog brings its own index,
+    # plain lists get one (first entry wins, as with a linear scan)
+    if hasattr(components_stock, 'find'):
+        return components_stock.find
+    index = {}
+    for comp in components_stock:
+        index.setdefault(comp['name'], comp)
+    return index.get
+
+
+_MISSING = object()  # Cache miss marker; None is a valid cached plan
+
+
+class StockPlanCache:
+    # Thread-safe LRU cache of stock preparations. Entries are keyed by the catalog
+    # version plus every field plan_stock_solution reads, so an edited entry or a
+    # new catalog never sees a stale plan; invalidate() drops everything at once.
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._plans = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(comp, concentration=None, max_volume_ml=MAX_STOCK_VOLUME_ML, catalog_version=None):
+        return (
+            catalog_version,
+            comp.get('name'),
+            comp.get('initial_weight'),
+            comp.get('initial_weight_unit'),
+            comp.get('molecular_weight'),
+            comp.get('desired_stock_concentration'),
+            comp.get('adjusted_stock_concentration'),
+            comp.get('stock_unit'),
+            comp.get('solvent'),
+            comp.get('cost'),
+            concentration,
+            max_volume_ml,
+        )
+
+    def plan(self, comp, concentration=None, max_volume_ml=MAX_STOCK_VOLUME_ML, catalog_version=None,
+             instrumentation=None):
+        key = self.key(comp, concentration, max_volume_ml, catalog_version)
+        with self._lock:
+            if key in self._plans:
+                self._plans.move_to_end(key)
+                self.hits += 1
+                plan = self._plans[key]
+            else:
+                plan = _MISSING
+        if plan is not _MISSING:
+            if instrumentation is not None:
+                instrumentation.count('plan_cache_hits')
+            return plan
+
+        plan = plan_stock_solution(comp, concentration, max_volume_ml)
+
+        if instrumentation is not None:
+            instrumentation.count('plan_cache_misses')
+        with self._lock:
+            self.misses += 1
+            self._plans[key] = plan
+            while len(self._plans) > self.maxsize:
+                self._plans.popitem(last=False)
+        return plan
+
+    def invalidate(self):
+        with self._lock:
+            self._plans.clear()
+
+    def __len__(self):
+        return len(self._plans)
+
+
+# Shared by every compute_recipe call that doesn't bring its own cache
+default_plan_cache = StockPlanCache()
+
+
+def plan_additive(component_stock, item, final_volume_ml, plan_stock):
+    # One additive of a recipe as (AdditiveResult, stock plan, adjusted stock plan or None).
+    # plan_stock(component_stock, concentration=None) returns a StockPreparation (or None)
+    # and may raise ValueError, which becomes the additive's note.
+    if component_stock is None:
+        return calculate_additive(None, item, final_volume_ml), None, None
+    try:
+        stock_plan = plan_stock(component_stock)
+    except ValueError as e:
+        return AdditiveResult(item['name'], None, None, str(e)), None, None
+
+    additive = calculate_additive(component_stock, item, final_volume_ml, stock_plan)
+    adjusted_plan = None
+    if additive.adjusted_stock_concentration is not None and stock_plan is not None:
+        adjusted_plan = plan_stock(component_stock, additive.adjusted_stock_concentration)
+    return additive, stock_plan, adjusted_plan
+
+
+def collect_stock_preparations(plans):
+    # Stock preparations for (stock plan, adjusted plan) pairs in recipe order: one per
+    # component, in order of first use, at the last adjusted concentration if there is one
+    base_plans = {}
+    adjusted_plans = {}
+    for stock_plan, adjusted_plan in plans:
+        if stock_plan is not None:
+            base_plans.setdefault(stock_plan.name, stock_plan)
+        if adjusted_plan is not None:
+            adjusted_plans[adjusted_plan.name] = adjusted_plan
+    return tuple(adjusted_plans.get(name, plan) for name, plan in base_plans.items())
+
+
+def compute_recipe(components_stock, recipe_data, final_volume_ml, lookup=None, plan_cache=None,
+                   instrumentation=None):
+    # Full recipe calculation: every additive plus the stock preparations it implies.
+    # Only stocks the recipe references are planned. Stocks that had to be diluted to
+    # reach the minimum volume are re-planned at the adjusted concentration, which is
+    # what the document's stock table shows. An instrumentation.Instrumentation times
+    # the stock planning and counts plan cache hits.
+    if lookup is None:
+        lookup = component_lookup(components_stock)
+    if plan_cache is None:
+        plan_cache = default_plan_cache
+    catalog_version = getattr(components_stock, 'version', None)
+
+    if instrumentation is None:
+        def plan_stock(component_stock, concentration=None):
+            return plan_cache.plan(component_stock, concentration, catalog_version=catalog_version)
+    else:
+        def plan_stock(component_stock, concentration=None):
+            with instrumentation.stage('stock_plan'):
+                return plan_cache.plan(component_stock, concentration, catalog_version=catalog_version,
+                                       instrumentation=instrumentation)
+
+    additives = []
+    plans = []
+    for item in recipe_data:
+        additive, stock_plan, adjusted_plan = plan_additive(lookup(item['name']), item, final_volume_ml, plan_stock)
+        additives.append(additive)
+        plans.append((stock_plan, adjusted_plan))
+
+    return RecipeResult(final_volume_ml, tuple(additives), collect_stock_preparations(plans))
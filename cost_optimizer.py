@@ -0,0 +1,156 @@
+# cost_optimizer.py
+#
+# Picks the cheapest combination of SKUs (vendor pack sizes) that covers the powder a
+# batch plan needs. The amount needed comes from the same weight/volume math as the
+# stock preparations (core.plan_stock_solution for one recipe, planner.stock_weight for
+# a schedule). Components are independent, so each one is solved on its own: every
+# combination of pack counts is enumerated at once with NumPy and the cheapest one
+# that covers the demand wins.
+#
+#   python cost_optimizer.py schedule.csv
+
+import argparse
+import math
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+import numpy as np
+
+import units
+from catalog import as_catalog, component_skus
+from components import components_stock
+
+MAX_COMBINATIONS = 2_000_000  # Above this, fall back to the greedy cheapest-per-gram fill
+
+
+@dataclass(frozen=True)
+class SkuPurchase:
+    catalog_number: Optional[str]
+    vendor: Optional[str]
+    pack_grams: float
+    cost: float
+    count: int
+
+
+@dataclass(frozen=True)
+class ComponentPurchase:
+    name: str
+    demand_grams: float
+    purchases: Tuple[SkuPurchase, ...]
+    total_cost: float
+    total_grams: float
+    note: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class PurchasePlan:
+    components: Tuple[ComponentPurchase, ...]
+
+    @property
+    def total_cost(self):
+        return sum(component.total_cost for component in self.components)
+
+
+def sku_arrays(comp):
+    # (pack sizes in grams, prices, SKU dicts) for a component
+    skus = [sku for sku in component_skus(comp) if sku.get('initial_weight') and sku.get('cost') is not None]
+    grams = np.array([sku['initial_weight'] * units.parse_unit(sku['initial_weight_unit']).scale for sku in skus])
+    prices = np.array([float(sku['cost']) for sku in skus])
+    return grams, prices, skus
+
+
+def cheapest_combination(demand_grams, grams, prices):
+    # Pack counts minimizing cost with sum(counts * grams) >= demand_grams
+    if demand_grams <= 0:
+        return np.zeros(len(grams), dtype=int)
+    upper = np.ceil(demand_grams / grams).astype(int)  # More than this of one SKU is never needed
+
+    if np.prod(upper + 1, dtype=float) > MAX_COMBINATIONS:
+        # Greedy: best price per gram, then top up with the cheapest pack that covers the rest
+        counts = np.zeros(len(grams), dtype=int)
+        best = int(np.argmin(prices / grams))
+        counts[best] = int(demand_grams // grams[best])
+        remaining = demand_grams - counts[best] * grams[best]
+        if remaining > 0:
+            options = np.ceil(remaining / grams) * prices
+            top_up = int(np.argmin(options))
+            counts[top_up] += int(math.ceil(remaining / grams[top_up]))
+        return counts
+
+    # Every combination of counts for all SKUs but the last; the last one covers what is left
+    grids = np.meshgrid(*[np.arange(n + 1) for n in upper[:-1]], indexing='ij') if len(grams) > 1 else []
+    counts = np.stack([grid.ravel() for grid in grids], axis=1) if grids else np.zeros((1, 0), dtype=int)
+    covered = counts @ grams[:-1] if len(grams) > 1 else np.zeros(1)
+    last = np.maximum(np.ceil((demand_grams - covered) / grams[-1] - 1e-9), 0).astype(int)
+    counts = np.column_stack([counts, last])
+    cost = counts @ prices
+    return counts[int(np.argmin(cost))]
+
+
+def optimize_component(comp, demand_grams):
+    grams, prices, skus = sku_arrays(comp)
+    if not skus:
+        return ComponentPurchase(comp['name'], demand_grams, (), 0.0, 0.0, 'No SKU with a weight and cost in the catalog')
+    counts = cheapest_combination(demand_grams, grams, prices)
+    purchases = tuple(
+        SkuPurchase(sku.get('catalog_number'), sku.get('vendor'), float(pack), float(price), int(count))
+        for sku, pack, price, count in zip(skus, grams, prices, counts) if count
+    )
+    return ComponentPurchase(
+        name=comp['name'],
+        demand_grams=demand_grams,
+        purchases=purchases,
+        total_cost=float(counts @ prices),
+        total_grams=float(counts @ grams),
+    )
+
+
+def optimize_purchases(demand_grams, components_stock=components_stock):
+    # demand_grams is {component name: grams of powder needed}
+    catalog = as_catalog(components_stock)
+    results = []
+    for name, grams in demand_grams.items():
+        comp = catalog.find(name)
+        if comp is None:
+            results.append(ComponentPurchase(name, grams, (), 0.0, 0.0, 'Component not found in stock!'))
+            continue
+        results.append(optimize_component(comp, grams))
+    return PurchasePlan(tuple(results))
+
+
+def demand_from_recipe(recipe_result):
+    # Grams weighed out for each stock preparation of a core.RecipeResult
+    return {
+        plan.name: plan.initial_weight * units.parse_unit(plan.initial_weight_unit).scale
+        for plan in recipe_result.stock_preparations
+    }
+
+
+def demand_from_schedule(schedule_plan):
+    # Grams weighed out for each consolidated stock of a planner.SchedulePlan
+    return {
+        prep.name: prep.weight * units.parse_unit(prep.weight_unit).scale
+        for prep in schedule_plan.stock_preps if prep.weight is not None
+    }
+
+
+def main(argv=None):
+    from planner import plan_schedule, read_schedule
+
+    parser = argparse.ArgumentParser(description='Cheapest SKU combination for a schedule of batches.')
+    parser.add_argument('schedule', help="CSV with 'Recipe', 'Volume (mL)' and 'Date' columns")
+    args = parser.parse_args(argv)
+
+    plan = optimize_purchases(demand_from_schedule(plan_schedule(read_schedule(args.schedule))))
+    for component in plan.components:
+        if component.note:
+            print(f"- {component.name}: {component.note}")
+            continue
+        packs = ', '.join(f"{purchase.count} x {purchase.catalog_number or '?'} ({purchase.pack_grams:g} g, ${purchase.cost:.2f})"
+                          for purchase in component.purchases)
+        print(f"- {component.name}: {packs} = ${component.total_cost:.2f}")
+    print(f"Total: ${plan.total_cost:.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,437 @@
+# dispensing.py
+#
+# Dispensing plans for a lab's own pipettes and tubes. core.calculate_volume has a
+# fixed 5 μL floor and fixes small volumes by diluting the whole stock; here an
+# InstrumentProfile lists the pipettes (min/max volume), the tubes and the highest
+# stock concentration each component can be dissolved at, and the solver picks
+# intermediate working dilutions (1:10, 1:100, ... of the stock, like the catalog's
+# working_solution_concentration) so that every addition can be dispensed.
+#
+# Across a batch of recipes and volumes, each component is solved on its own: every
+# set of dilution levels is tried, each addition is taken from the level that needs the
+# fewest aspirations, and the set with the fewest pipetting steps overall (additions
+# plus making the dilutions) wins. Dilutions are made serially, each from the next
+# stronger level, and are shared by every batch that uses them.
+#
+#   python dispensing.py schedule.csv [--profile lab.json]     (columns: Recipe, Volume (mL), Date)
+#
+# A profile file is JSON: {"pipettes": [{"name": "P20", "min_ul": 2, "max_ul": 20}, ...],
+# "tubes": [{"name": "15 mL conical", "volume_ml": 15}, ...], "max_stock_concentrations":
+# {"EGF": 500}, "dilution_factors": [10, 100, 1000], "overage": 0.1}
+
+import argparse
+import json
+import math
+from dataclasses import dataclass, field
+from typing import Optional, Tuple
+
+import numpy as np
+
+from catalog import as_catalog
+from components import components_stock
+from core import StockPreparation, common_concentrations, plan_stock_solution, stock_concentration_for
+
+
+@dataclass(frozen=True)
+class Pipette:
+    name: str
+    min_ul: float
+    max_ul: float
+
+
+@dataclass(frozen=True)
+class Tube:
+    name: str
+    volume_ml: float
+
+
+@dataclass(frozen=True)
+class InstrumentProfile:
+    pipettes: Tuple[Pipette, ...]
+    tubes: Tuple[Tube, ...]
+    max_stock_concentrations: dict = field(default_factory=dict, hash=False)  # Name -> max, in the stock unit
+    dilution_factors: Tuple[float, ...] = (10, 100, 1000)  # Intermediate levels the solver may use
+    overage: float = 0.1  # Extra volume made of each working dilution
+
+    def __post_init__(self):
+        if not self.pipettes or not self.tubes:
+            raise ValueError('An instrument profile needs at least one pipette and one tube')
+        for pipette in self.pipettes:
+            if not 0 < pipette.min_ul <= pipette.max_ul:
+                raise ValueError(f"Pipette {pipette.name} needs 0 < min_ul <= max_ul")
+
+    @property
+    def sorted_pipettes(self):
+        # Smallest first, so aspirations() prefers the smaller pipette on ties
+        return tuple(sorted(self.pipettes, key=lambda pipette: pipette.max_ul))
+
+    @property
+    def min_volume_ul(self):
+        return min(pipette.min_ul for pipette in self.pipettes)
+
+    @property
+    def max_volume_ul(self):
+        return max(pipette.max_ul for pipette in self.pipettes)
+
+    @property
+    def stock_volume_ml(self):
+        # Stocks are capped at the largest tube, as MAX_STOCK_VOLUME_ML caps them in core.py
+        return max(tube.volume_ml for tube in self.tubes)
+
+    def max_stock_concentration(self, comp):
+        return self.max_stock_concentrations.get(comp['name'], comp.get('max_stock_concentration'))
+
+    def tube_for(self, volume_ml):
+        # Smallest tube that holds volume_ml (the largest one if none does)
+        tubes = sorted(self.tubes, key=lambda tube: tube.volume_ml)
+        return next((tube for tube in tubes if tube.volume_ml >= volume_ml), tubes[-1])
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            pipettes=tuple(Pipette(p['name'], float(p['min_ul']), float(p['max_ul'])) for p in data['pipettes']),
+            tubes=tuple(Tube(t['name'], float(t['volume_ml'])) for t in data['tubes']),
+            max_stock_concentrations=dict(data.get('max_stock_concentrations', {})),
+            dilution_factors=tuple(float(f) for f in data.get('dilution_factors', (10, 100, 1000))),
+            overage=float(data.get('overage', 0.1)),
+        )
+
+
+DEFAULT_PROFILE = InstrumentProfile(
+    pipettes=(
+        Pipette('P2', 0.2, 2),
+        Pipette('P20', 2, 20),
+        Pipette('P200', 20, 200),
+        Pipette('P1000', 100, 1000),
+        Pipette('10 mL serological', 1000, 10000),
+    ),
+    tubes=(
+        Tube('1.5 mL tube', 1.5),
+        Tube('15 mL conical', 15),
+    ),
+)
+
+
+def load_profile(path):
+    with open(path, 'r') as f:
+        return InstrumentProfile.from_dict(json.load(f))
+
+
+@dataclass(frozen=True)
+class WorkingDilution:
+    name: str
+    factor: float                  # Relative to the stock
+    parent_factor: float           # Level it is made from (1 = the stock itself)
+    concentration: Optional[float]  # In the stock unit; None for stocks without one
+    unit: Optional[str]
+    volume_ml: float               # Per preparation
+    preparations: int
+    aliquot_ul: float              # Of the parent level, per preparation
+    diluent_ul: float
+    tube: str
+    steps: int                     # Pipetting steps for all preparations
+
+
+@dataclass(frozen=True)
+class Dispense:
+    batch: int
+    name: str
+    source_factor: Optional[float]  # 1 = the stock, otherwise the working dilution it comes from
+    volume_ul: Optional[float]
+    pipette: Optional[str] = None
+    aspirations: int = 0
+    note: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class DispensingPlan:
+    stock_preparations: Tuple[StockPreparation, ...]
+    dilutions: Tuple[WorkingDilution, ...]
+    dispenses: Tuple[Dispense, ...]
+    notes: Tuple[str, ...] = ()
+
+    @property
+    def total_steps(self):
+        return sum(dilution.steps for dilution in self.dilutions) + sum(d.aspirations for d in self.dispenses)
+
+    def dispenses_for(self, batch):
+        return [dispense for dispense in self.dispenses if dispense.batch == batch]
+
+
+def aspirations(volumes_ul, pipettes):
+    # (aspiration counts, pipette index) per volume: the fewest aspirations of any one pipette
+    # that keep each aspiration within its range, preferring the smaller pipette on ties.
+    # Volumes no pipette can dispense get an infinite count and index -1.
+    volumes = np.asarray(volumes_ul, dtype=float)[..., None]
+    min_ul = np.array([pipette.min_ul for pipette in pipettes])
+    max_ul = np.array([pipette.max_ul for pipette in pipettes])
+    counts = np.maximum(np.ceil(volumes / max_ul * (1 - 1e-9)), 1.0)
+    counts = np.where(volumes / counts >= min_ul * (1 - 1e-9), counts, np.inf)
+    best = counts.argmin(axis=-1)
+    best_counts = np.take_along_axis(counts, best[..., None], axis=-1)[..., 0]
+    return best_counts, np.where(np.isfinite(best_counts), best, -1)
+
+
+def _prepare_levels(levels, draws_ul, profile, pipettes):
+    # Working dilutions for the chosen levels (ascending, after the stock at index 0), given what
+    # the additions draw from each. Returns (steps, [(level, parent, volume, preparations, aliquot,
+    # diluent)]) or None if a level is unused or can't be made with these pipettes and tubes.
+    draws = list(draws_ul)
+    largest_tube_ul = max(tube.volume_ml for tube in profile.tubes) * 1000
+    min_ul = profile.min_volume_ul
+    steps = 0
+    made = []
+    for i in range(len(levels) - 1, 0, -1):
+        need = draws[i] * (1 + profile.overage)
+        if need <= 0:
+            return None  # A smaller set of levels does the same job
+        ratio = levels[i] / levels[i - 1]
+        if min_ul * ratio > largest_tube_ul:
+            return None
+        volume = max(need, min_ul * ratio)
+        preparations = math.ceil(volume / largest_tube_ul * (1 - 1e-9))
+        volume /= preparations
+        aliquot = volume / ratio
+        counts, _ = aspirations([aliquot, volume - aliquot], pipettes)
+        if not np.isfinite(counts).all():
+            return None
+        steps += preparations * int(counts.sum())
+        draws[i - 1] += preparations * aliquot
+        made.append((levels[i], levels[i - 1], volume, preparations, aliquot, volume - aliquot))
+    return steps, made[::-1]
+
+
+def solve_levels(stock_volumes_ul, candidate_factors, profile):
+    # Best set of dilution levels for one component's additions, given the volume of stock each
+    # addition would take. Returns (steps, levels, level index per addition, aspirations per
+    # addition, pipette per addition, dilutions) or None if no set of levels works.
+    pipettes = profile.sorted_pipettes
+    factors = [1.0] + sorted(set(float(f) for f in candidate_factors if f > 1))
+    stock_volumes = np.asarray(stock_volumes_ul, dtype=float)
+    counts, pipette_index = aspirations(stock_volumes[:, None] * np.array(factors), pipettes)
+
+    best = None
+    for mask in range(1 << (len(factors) - 1)):
+        chosen = [0] + [j + 1 for j in range(len(factors) - 1) if mask >> j & 1]
+        sub = counts[:, chosen]
+        choice = sub.argmin(axis=1)
+        addition_steps = sub[np.arange(len(stock_volumes)), choice]
+        if not np.isfinite(addition_steps).all():
+            continue
+        levels = [factors[j] for j in chosen]
+        draws = np.bincount(choice, weights=stock_volumes * np.array(levels)[choice], minlength=len(chosen))
+        prepared = _prepare_levels(levels, draws, profile, pipettes)
+        if prepared is None:
+            continue
+        dilution_steps, made = prepared
+        total = int(addition_steps.sum()) + dilution_steps
+        rank = (total, len(chosen), sum(levels))
+        if best is None or rank < best[0]:
+            columns = np.array(chosen)[choice]
+            best = (rank, levels, choice, addition_steps.astype(int),
+                    [pipettes[i].name for i in pipette_index[np.arange(len(stock_volumes)), columns]], made)
+    if best is None:
+        return None
+    rank, levels, choice, addition_steps, pipette_names, made = best
+    return rank[0], levels, choice, addition_steps, pipette_names, made
+
+
+def _component_demand(comp, items, batches, concentration, stock_unit):
+    # (stock μL per addition, [(batch, name)], working solution factor, errors) at a stock concentration
+    volumes = []
+    keys = []
+    errors = []
+    working_factor = None
+    for batch, item in items:
+        final_volume_ul = batches[batch][1] * 1000
+        if 'dilution_factor' in item:
+            volumes.append(final_volume_ul / item['dilution_factor'])
+            keys.append((batch, item['name']))
+            continue
+        try:
+            if concentration is None:
+                raise ValueError(f"No stock concentration found for component {comp['name']}")
+            stock_common, desired_common, _, working_factor = common_concentrations(
+                comp, concentration, stock_unit, item['desired_concentration'], item['desired_unit'])
+        except ValueError as e:
+            errors.append(Dispense(batch, item['name'], None, None, note=str(e)))
+            continue
+        # Volume of the stock itself; a working solution is just another dilution level
+        volumes.append(desired_common * final_volume_ul / (stock_common * (working_factor or 1)))
+        keys.append((batch, item['name']))
+    return volumes, keys, working_factor, errors
+
+
+def plan_component(comp, items, batches, profile=DEFAULT_PROFILE):
+    # (StockPreparation or None, [WorkingDilution], [Dispense], [note]) for one component's
+    # (batch, recipe item) pairs
+    notes = []
+    concentration = None
+    stock_unit = None
+    try:
+        concentration, stock_unit = stock_concentration_for(comp)
+    except ValueError:
+        pass  # Liquids used by dilution factor only
+    ceiling = profile.max_stock_concentration(comp)
+    if concentration is not None and ceiling is not None and concentration > ceiling:
+        notes.append(f"{comp['name']}: stock planned at the maximum {ceiling:g} {stock_unit} "
+                     f"instead of {concentration:g} {stock_unit}.")
+        concentration = ceiling
+
+    volumes, keys, working_factor, dispenses = _component_demand(comp, items, batches, concentration, stock_unit)
+    if not volumes:
+        return None, [], dispenses, notes
+    factors = list(profile.dilution_factors) + ([working_factor] if working_factor else [])
+
+    # The stock as planned, and if additions need several aspirations, a stronger stock up to the maximum
+    options = [(concentration, volumes)]
+    if (concentration is not None and ceiling is not None and ceiling > concentration and not working_factor
+            and max(volumes) > profile.max_volume_ul):
+        raised = min(ceiling, concentration * max(volumes) / profile.max_volume_ul)
+        options.append((raised, [volume * concentration / raised for volume in volumes]))
+
+    best = None
+    for option_concentration, option_volumes in options:
+        solved = solve_levels(option_volumes, factors, profile)
+        if solved is not None and (best is None or solved[0] < best[1][0]):
+            best = (option_concentration, solved, option_volumes)
+    if best is None:
+        # Solve what can be solved and report the rest
+        stock_volumes = np.asarray(volumes)
+        factors_all = np.array([1.0] + sorted(factors))
+        counts, _ = aspirations(stock_volumes[:, None] * factors_all, profile.sorted_pipettes)
+        feasible = np.isfinite(counts).any(axis=1)
+        for (batch, name), volume, ok in zip(keys, volumes, feasible):
+            if not ok:
+                dispenses.append(Dispense(batch, name, None, volume, note=(
+                    f"{volume:.4g} μL of stock can't be dispensed, even after a 1:{factors_all[-1]:g} dilution")))
+        keys = [key for key, ok in zip(keys, feasible) if ok]
+        volumes = [volume for volume, ok in zip(volumes, feasible) if ok]
+        solved = solve_levels(volumes, factors, profile) if volumes else None
+        if solved is None:
+            for batch, name in keys:
+                dispenses.append(Dispense(batch, name, None, None, note='No set of working dilutions fits the tubes'))
+            return None, [], dispenses, notes
+        best = (concentration, solved, volumes)
+
+    option_concentration, (_, levels, choice, addition_steps, pipette_names, made), option_volumes = best
+    if option_concentration != concentration:
+        notes.append(f"{comp['name']}: stock raised to {option_concentration:.4g} {stock_unit} "
+                     f"to save pipetting steps.")
+    stock_plan = None
+    if option_concentration is not None:
+        stock_plan = plan_stock_solution(comp, option_concentration, profile.stock_volume_ml)
+
+    pipettes = profile.sorted_pipettes
+    dilutions = []
+    for factor, parent, volume_ul, preparations, aliquot, diluent in made:
+        counts, _ = aspirations([aliquot, diluent], pipettes)
+        dilutions.append(WorkingDilution(
+            name=comp['name'],
+            factor=factor,
+            parent_factor=parent,
+            concentration=option_concentration / factor if option_concentration is not None else None,
+            unit=stock_unit if option_concentration is not None else None,
+            volume_ml=volume_ul / 1000,
+            preparations=preparations,
+            aliquot_ul=aliquot,
+            diluent_ul=diluent,
+            tube=profile.tube_for(volume_ul / 1000).name,
+            steps=preparations * int(counts.sum()),
+        ))
+
+    total_stock_ul = sum(volume for volume, level in zip(option_volumes, choice) if level == 0)
+    total_stock_ul += sum(d.aliquot_ul * d.preparations for d in dilutions if d.parent_factor == 1)
+    if stock_plan is not None and stock_plan.stock_volume_ml and total_stock_ul > stock_plan.stock_volume_ml * 1000:
+        notes.append(f"{comp['name']}: the batch uses {total_stock_ul / 1000:.3g} mL of stock; one preparation makes "
+                     f"{stock_plan.stock_volume_ml:g} mL, so prepare "
+                     f"{math.ceil(total_stock_ul / 1000 / stock_plan.stock_volume_ml)}.")
+
+    for (batch, name), volume, level, steps, pipette in zip(keys, option_volumes, choice, addition_steps, pipette_names):
+        factor = levels[level]
+        dispenses.append(Dispense(batch, name, factor, volume * factor, pipette, int(steps)))
+    return stock_plan, dilutions, dispenses, notes
+
+
+def plan_dispensing(batches, components_stock=components_stock, profile=DEFAULT_PROFILE):
+    # DispensingPlan for (recipe additives, final volume in mL) batches, e.g.
+    # [(parse_recipe('exampleMedia.csv')['additives'], 15), ...]
+    catalog = as_catalog(components_stock)
+    batches = [(list(additives), float(final_volume_ml)) for additives, final_volume_ml in batches]
+    demand = {}
+    dispenses = []
+    for index, (additives, _) in enumerate(batches):
+        for item in additives:
+            comp = catalog.find(item['name'])
+            if comp is None:
+                dispenses.append(Dispense(index, item['name'], None, None, note='Component not found in stock!'))
+                continue
+            demand.setdefault(comp['name'], (comp, []))[1].append((index, item))
+
+    stock_preparations = []
+    dilutions = []
+    notes = []
+    for comp, items in demand.values():
+        stock_plan, component_dilutions, component_dispenses, component_notes = plan_component(
+            comp, items, batches, profile)
+        if stock_plan is not None:
+            stock_preparations.append(stock_plan)
+        dilutions.extend(component_dilutions)
+        dispenses.extend(component_dispenses)
+        notes.extend(component_notes)
+
+    dispenses.sort(key=lambda dispense: dispense.batch)
+    return DispensingPlan(tuple(stock_preparations), tuple(dilutions), tuple(dispenses), tuple(notes))
+
+
+def plan_schedule_dispensing(schedule, components_stock=components_stock, profile=DEFAULT_PROFILE):
+    # plan_dispensing for planner.ScheduledBatch entries (recipe file, final volume, date)
+    from mediaCalc import parse_recipe
+
+    recipes = {}
+    batches = []
+    for entry in schedule:
+        if entry.recipe not in recipes:
+            recipes[entry.recipe] = parse_recipe(entry.recipe, components_stock)
+        batches.append((recipes[entry.recipe]['additives'], entry.final_volume_ml))
+    return plan_dispensing(batches, components_stock, profile)
+
+
+def format_factor(factor):
+    return 'stock' if factor == 1 else f"1:{factor:g}"
+
+
+def main(argv=None):
+    from planner import read_schedule
+
+    parser = argparse.ArgumentParser(description='Working dilutions and pipette choices for a schedule of batches.')
+    parser.add_argument('schedule', help="CSV with 'Recipe', 'Volume (mL)' and 'Date' columns")
+    parser.add_argument('--profile', help='Instrument profile JSON (default: P2 to 10 mL serological, 1.5 and 15 mL tubes)')
+    args = parser.parse_args(argv)
+
+    profile = load_profile(args.profile) if args.profile else DEFAULT_PROFILE
+    schedule = read_schedule(args.schedule)
+    plan = plan_schedule_dispensing(schedule, profile=profile)
+
+    if plan.dilutions:
+        print('Working dilutions:')
+        for d in plan.dilutions:
+            concentration = f" ({d.concentration:.4g} {d.unit})" if d.concentration is not None else ''
+            repeat = f"{d.preparations} x " if d.preparations > 1 else ''
+            print(f"- {d.name} {format_factor(d.factor)}{concentration}: {repeat}{d.aliquot_ul:.4g} μL of "
+                  f"{format_factor(d.parent_factor)} + {d.diluent_ul:.4g} μL diluent in a {d.tube}")
+    for index, entry in enumerate(schedule):
+        print(f"\n{entry.recipe} {entry.final_volume_ml:g} mL {entry.date}".rstrip() + ':')
+        for d in plan.dispenses_for(index):
+            if d.note:
+                print(f"  - {d.name}: {d.note}")
+                continue
+            repeat = f" ({d.aspirations} x)" if d.aspirations > 1 else ''
+            print(f"  - {d.name}: {d.volume_ul:.4g} μL of {format_factor(d.source_factor)} with {d.pipette}{repeat}")
+    for note in plan.notes:
+        print(f"! {note}")
+    print(f"\nPipetting steps: {plan.total_steps}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+# docx_writer.py
+#
+# Word output for media reports. Adding rows with table.add_row().cells and
+# setting cell.text walks the table grid for every cell, so large tables get slow.
+# Here the whole table is built as one XML string and parsed once.
+
+from xml.sax.saxutils import escape
+
+from docx import Document
+from docx.oxml import parse_xml
+from docx.oxml.ns import nsdecls
+
+from report import stock_table, steps_table, total_cost_lines
+
+TWIPS_PER_EMU = 1 / 635
+
+
+def _cell_xml(text, width):
+    if text:
+        paragraph = f'<w:p><w:r><w:t xml:space="preserve">{escape(text)}</w:t></w:r></w:p>'
+    else:
+        paragraph = '<w:p/>'
+    return f'<w:tc><w:tcPr><w:tcW w:type="dxa" w:w="{width}"/></w:tcPr>{paragraph}</w:tc>'
+
+
+def table_xml(header, rows, width_twips):
+    # Same markup python-docx produces for document.add_table() plus cell.text
+    cols = len(header)
+    col_width = int(width_twips / cols)
+    parts = [
+        f'<w:tbl {nsdecls("w")}>',
+        '<w:tblPr><w:tblW w:type="auto" w:w="0"/>'
+        '<w:tblLook w:firstColumn="1" w:firstRow="1" w:lastColumn="0" w:lastRow="0" '
+        'w:noHBand="0" w:noVBand="1" w:val="04A0"/></w:tblPr>',
+        '<w:tblGrid>',
+        f'<w:gridCol w:w="{col_width}"/>' * cols,
+        '</w:tblGrid>',
+    ]
+    for row in [header] + list(rows):
+        parts.append('<w:tr>')
+        parts.extend(_cell_xml(str(text), col_width) for text in row)
+        parts.append('</w:tr>')
+    parts.append('</w:tbl>')
+    return ''.join(parts)
+
+
+def add_table(document, header, rows):
+    # Append a table with a header row and string rows to the end of the document
+    section = document.sections[-1]
+    width_twips = (section.page_width - section.left_margin - section.right_margin) * TWIPS_PER_EMU
+    tbl = parse_xml(table_xml(header, rows, width_twips))
+
+    body = document.element.body
+    if body.sectPr is not None:
+        body.sectPr.addprevious(tbl)
+    else:
+        body.append(tbl)
+    return tbl
+
+
+def build_docx(report):
+    # Word version of a report.MediaReport, with the same sections generate_word_document has always written
+    document = Document()
+
+    # Title
+    document.add_heading(report.title, 0)
+
+    # Materials Needed
+    document.add_heading('Materials Needed:', level=1)
+    document.add_paragraph(f"- **Base Media:** {report.base_media}")
+    document.add_paragraph(f"- **Serum:** {report.serum}")
+
+    # Stock Solution Preparations
+    if report.stock_preparations:
+        document.add_heading('Stock Solution Preparations:', level=1)
+        add_table(document, *stock_table(report))
+        document.add_paragraph('Prepare the stock solutions as per the table above.')
+
+    # Media Preparation Steps
+    document.add_heading('Media Preparation Steps:', level=1)
+    add_table(document, *steps_table(report))
+
+    # Final Mixing Steps
+    document.add_paragraph('\n**Final Steps:**')
+    for line in report.final_steps:
+        document.add_paragraph(f"- {line}")
+
+    # Display Total Cost
+    document.add_paragraph(f"\n**Total Cost:**")
+    for line in total_cost_lines(report):
+        document.add_paragraph(f"- {line}")
+
+    return document
+
+
+def write_docx(report, filename):
+    build_docx(report).save(filename)
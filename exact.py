@@ -0,0 +1,298 @@
+# exact.py
+#
+# Decimal version of the recipe calculation for regulated batches. Inputs are converted
+# with Decimal(repr(x)), so 0.1 stays 0.1. All arithmetic runs in a private decimal
+# context, with a fixed precision and ROUND_HALF_EVEN, so results are bit-identical run
+# to run and across platforms. Rounding is explicit and happens at every step the bench
+# does:
+#
+#   - each additive volume is rounded to the pipette resolution
+#   - the serum volume is rounded to the serological pipette resolution
+#   - each line cost is rounded to the cent
+#
+# The base media volume is then the final volume minus the rounded serum and additive
+# volumes, so the document always adds up exactly. The float engine in core.py stays
+# the default; see benchmarks/bench_exact.py for the cost of this one.
+
+from dataclasses import dataclass
+from decimal import Context, Decimal, ROUND_HALF_EVEN
+from typing import Optional, Tuple
+
+import units
+from core import AdditiveResult, MAX_STOCK_VOLUME_ML, MIN_VOLUME_UL, StockPreparation, component_lookup
+from report import MediaReport, PreparationStep, desired_concentration_text
+
+CONTEXT = Context(prec=28, rounding=ROUND_HALF_EVEN)
+
+ONE = Decimal(1)
+THOUSAND = Decimal(1000)
+HUNDRED = Decimal(100)
+
+
+@dataclass(frozen=True)
+class RoundingPolicy:
+    volume_ul: Decimal = Decimal('0.1')         # Pipette resolution for additives
+    serum_volume_ml: Decimal = Decimal('0.01')  # Serological pipette resolution
+    cost: Decimal = Decimal('0.01')
+    min_volume_ul: Decimal = Decimal(MIN_VOLUME_UL)
+
+
+DEFAULT_POLICY = RoundingPolicy()
+
+
+@dataclass(frozen=True)
+class ExactRecipeResult:
+    final_volume_ml: Decimal
+    additives: Tuple[AdditiveResult, ...]        # Decimal volume_ul and cost
+    stock_preparations: Tuple[StockPreparation, ...]
+    serum_volume_ml: Decimal
+    total_additives_volume_ml: Decimal
+    base_media_volume_ml: Decimal
+    total_cost: Decimal
+
+    def as_rows(self):
+        return [additive.as_dict() for additive in self.additives]
+
+
+def to_decimal(value):
+    # Exact Decimal for an int, str or Decimal; floats go through their shortest repr
+    if isinstance(value, Decimal):
+        return value
+    if isinstance(value, float):
+        return Decimal(repr(value))
+    return Decimal(value)
+
+
+def unit_scale(unit):
+    return ONE.scaleb(unit.exponent)
+
+
+def _quantize(value, quantum):
+    return value.quantize(quantum, context=CONTEXT)
+
+
+def to_base(value, unit, dimension, molecular_weight=None):
+    # units.to_base in Decimal
+    if isinstance(unit, str):
+        unit = units.parse_unit(unit)
+    value = to_decimal(value)
+    c = CONTEXT
+    if unit.dimension == dimension:
+        return c.multiply(value, unit_scale(unit))
+    base = units.base_unit(dimension)
+    dimensions = (unit.dimension, dimension)
+    if dimensions in ((units.MOLAR, units.MASS_CONCENTRATION), (units.MASS_CONCENTRATION, units.MOLAR)):
+        if not molecular_weight:
+            raise ValueError(f"Molecular weight is required to convert {unit.symbol} to {base.symbol}")
+        mass_per_molar = c.multiply(to_decimal(molecular_weight), to_decimal(units.MOLAR_TO_MASS_CONCENTRATION))
+        if unit.dimension == units.MOLAR:
+            factor = c.divide(c.multiply(unit_scale(unit), mass_per_molar), unit_scale(base))
+        else:
+            factor = c.divide(c.divide(unit_scale(unit), mass_per_molar), unit_scale(base))
+        return c.multiply(value, factor)
+    raise ValueError(f"Unit conversion not defined for units {unit.symbol} or {base.symbol}")
+
+
+def plan_stock_solution(comp, concentration=None, max_volume_ml=MAX_STOCK_VOLUME_ML):
+    # core.plan_stock_solution in Decimal
+    if 'initial_weight' not in comp or 'desired_stock_concentration' not in comp:
+        return None
+    c = CONTEXT
+    initial_weight = to_decimal(comp['initial_weight'])
+    initial_weight_unit = comp['initial_weight_unit']
+    molecular_weight = comp.get('molecular_weight')
+    if concentration is None:
+        concentration = comp.get('adjusted_stock_concentration', comp['desired_stock_concentration'])
+    concentration = to_decimal(concentration)
+    stock_unit = comp['stock_unit']
+    max_volume_ml = to_decimal(max_volume_ml)
+
+    weight_scale = unit_scale(units.parse_unit(initial_weight_unit))
+    initial_weight_g = c.multiply(initial_weight, weight_scale)
+    dimension = units.parse_unit(stock_unit).dimension if units.is_unit(stock_unit) else None
+
+    if dimension == units.MASS_CONCENTRATION:
+        concentration_common = to_base(concentration, stock_unit, units.MASS_CONCENTRATION)  # μg/mL
+        volume_ml = c.divide(c.multiply(initial_weight_g, Decimal(10) ** 6), concentration_common)
+    elif dimension == units.MOLAR:
+        if molecular_weight is None:
+            raise ValueError(f"Molecular weight is required for component {comp['name']}")
+        concentration_common = to_base(concentration, stock_unit, units.MOLAR)  # M
+        moles = c.divide(initial_weight_g, to_decimal(molecular_weight))
+        volume_ml = c.multiply(c.divide(moles, concentration_common), THOUSAND)
+    else:
+        volume_ml = None
+
+    # Weigh out less if the volume exceeds the cap
+    if volume_ml and volume_ml > max_volume_ml:
+        volume_ml = max_volume_ml
+        if dimension == units.MASS_CONCENTRATION:
+            grams = c.divide(c.multiply(concentration_common, volume_ml), Decimal(10) ** 6)
+        else:
+            grams = c.multiply(c.multiply(concentration_common, c.divide(volume_ml, THOUSAND)),
+                               to_decimal(molecular_weight))
+        initial_weight = c.divide(grams, weight_scale)
+
+    cost_per_ml = None
+    if 'cost' in comp and volume_ml:
+        cost_per_ml = c.divide(to_decimal(comp['cost']), volume_ml)
+
+    return StockPreparation(
+        name=comp['name'],
+        initial_weight=initial_weight,
+        initial_weight_unit=initial_weight_unit,
+        stock_concentration=concentration,
+        stock_unit=stock_unit,
+        solvent=comp.get('solvent', 'Appropriate solvent'),
+        stock_volume_ml=volume_ml,
+        cost_per_ml=cost_per_ml,
+    )
+
+
+def calculate_additive(component_stock, item, final_volume_ml, stock_plan=None, policy=DEFAULT_POLICY):
+    # core.calculate_additive in Decimal, with the volume rounded to the pipette resolution
+    if component_stock is None:
+        return AdditiveResult(item['name'], None, None, 'Component not found in stock!')
+    c = CONTEXT
+    final_volume_ul = c.multiply(final_volume_ml, THOUSAND)
+    adjusted_stock_concentration = None
+    working_solution_dilution_factor = None
+    try:
+        if 'dilution_factor' in item:
+            volume_ul = c.divide(final_volume_ul, to_decimal(item['dilution_factor']))
+        else:
+            if stock_plan is not None:
+                stock_concentration, stock_unit = stock_plan.stock_concentration, stock_plan.stock_unit
+            else:
+                stock_concentration = component_stock.get('stock_concentration',
+                                                          component_stock.get('desired_stock_concentration'))
+                stock_unit = component_stock.get('stock_unit')
+            if stock_concentration is None or stock_unit is None:
+                raise ValueError(f"No stock concentration found for component {component_stock['name']}")
+            try:
+                stock = units.parse_unit(stock_unit)
+                desired = units.parse_unit(item['desired_unit'])
+            except ValueError:
+                raise ValueError(f"Unit conversion not defined for units {stock_unit} or {item['desired_unit']}")
+            molecular_weight = component_stock.get('molecular_weight')
+            stock_concentration = to_decimal(stock_concentration)
+
+            if 'working_solution_concentration' in component_stock:
+                working = units.parse_unit(component_stock['working_solution_unit'])
+                working_concentration = to_decimal(component_stock['working_solution_concentration'])
+                working_solution_dilution_factor = c.divide(
+                    to_base(stock_concentration, stock, working.dimension, molecular_weight),
+                    c.multiply(working_concentration, unit_scale(working)))
+                stock_concentration = working_concentration
+                stock = working
+
+            stock_common = c.multiply(stock_concentration, unit_scale(stock))
+            desired_common = to_base(item['desired_concentration'], desired, stock.dimension, molecular_weight)
+            amount = c.multiply(desired_common, final_volume_ul)
+            volume_ul = c.divide(amount, stock_common)
+            if volume_ul < policy.min_volume_ul:
+                adjusted_stock_concentration = c.divide(c.divide(amount, policy.min_volume_ul), unit_scale(stock))
+                volume_ul = policy.min_volume_ul
+    except ValueError as e:
+        return AdditiveResult(item['name'], None, None, str(e))
+
+    volume_ul = _quantize(volume_ul, policy.volume_ul)
+    cost = None
+    cost_per_ml = stock_plan.cost_per_ml if stock_plan is not None else component_stock.get('cost_per_ml')
+    if cost_per_ml is not None:
+        cost = _quantize(c.multiply(c.divide(volume_ul, THOUSAND), to_decimal(cost_per_ml)), policy.cost)
+
+    note = None
+    if working_solution_dilution_factor is not None:
+        note = f"Prepare working solution by diluting the stock {int(working_solution_dilution_factor)}:1."
+    return AdditiveResult(item['name'], volume_ul, cost, note, adjusted_stock_concentration,
+                          working_solution_dilution_factor)
+
+
+def compute_recipe(components_stock, recipe_data, final_volume_ml, serum_percentage=10, policy=DEFAULT_POLICY,
+                   lookup=None):
+    # core.compute_recipe in Decimal, plus the serum and base media volumes and the total cost
+    if lookup is None:
+        lookup = component_lookup(components_stock)
+    c = CONTEXT
+    final_volume_ml = to_decimal(final_volume_ml)
+
+    additives = []
+    plans = {}
+    adjusted_plans = {}
+    for item in recipe_data:
+        component_stock = lookup(item['name'])
+        stock_plan = None
+        if component_stock is not None:
+            name = component_stock['name']
+            if name not in plans:
+                try:
+                    plans[name] = plan_stock_solution(component_stock)
+                except ValueError as e:
+                    additives.append(AdditiveResult(item['name'], None, None, str(e)))
+                    continue
+            stock_plan = plans[name]
+        additive = calculate_additive(component_stock, item, final_volume_ml, stock_plan, policy)
+        additives.append(additive)
+        if additive.adjusted_stock_concentration is not None and stock_plan is not None:
+            adjusted_plans[stock_plan.name] = plan_stock_solution(component_stock, additive.adjusted_stock_concentration)
+
+    total_additives_ul = sum((a.volume_ul for a in additives if a.volume_ul is not None), Decimal(0))
+    total_additives_ml = c.divide(total_additives_ul, THOUSAND)
+    serum_volume_ml = _quantize(c.multiply(c.divide(to_decimal(serum_percentage), HUNDRED), final_volume_ml),
+                                policy.serum_volume_ml)
+    base_media_volume_ml = c.subtract(c.subtract(final_volume_ml, serum_volume_ml), total_additives_ml)
+    total_cost = sum((a.cost for a in additives if a.cost is not None), Decimal(0))
+
+    stock_preparations = tuple(adjusted_plans.get(name, plan) for name, plan in plans.items() if plan is not None)
+    return ExactRecipeResult(final_volume_ml, tuple(additives), stock_preparations, serum_volume_ml,
+                             total_additives_ml, base_media_volume_ml, total_cost)
+
+
+def build_exact_report(components_stock, recipe, final_volume_ml, policy=DEFAULT_POLICY, lookup=None):
+    # report.MediaReport from the Decimal engine, for any of the writers. recipe is a parse_recipe dict;
+    # numbers are handed over as floats (float(Decimal) is exact to the shortest repr, so still reproducible).
+    serum_percentage = recipe['serum'].get('percentage', 10)
+    result = compute_recipe(components_stock, recipe['additives'], final_volume_ml, serum_percentage, policy, lookup)
+    if result.base_media_volume_ml < 0:
+        raise ValueError("Total volume of additives and serum exceeds the final volume. Adjust final volume or component concentrations.")
+
+    def number(value):
+        return float(value) if value is not None else None
+
+    def microlitres(volume_ml):
+        return float(CONTEXT.multiply(volume_ml, THOUSAND))
+
+    steps = [
+        PreparationStep(1, recipe['base_media']['name'], '-', microlitres(result.base_media_volume_ml), None,
+                        kind='base_media'),
+        PreparationStep(2, recipe['serum']['name'], f"{float(to_decimal(serum_percentage))}% v/v",
+                        microlitres(result.serum_volume_ml), None, kind='serum'),
+    ]
+    recipe_items = {}
+    for item in recipe['additives']:
+        recipe_items.setdefault(item['name'], item)
+    for additive in result.additives:
+        steps.append(PreparationStep(len(steps) + 1, additive.name,
+                                     desired_concentration_text(recipe_items.get(additive.name)),
+                                     number(additive.volume_ul), number(additive.cost), additive.note))
+
+    stock_preparations = tuple(
+        StockPreparation(plan.name, number(plan.initial_weight), plan.initial_weight_unit, number(plan.stock_concentration),
+                         plan.stock_unit, plan.solvent, number(plan.stock_volume_ml), number(plan.cost_per_ml))
+        for plan in result.stock_preparations
+    )
+    cost_per_ml = _quantize(CONTEXT.divide(result.total_cost, result.final_volume_ml), policy.cost)
+    return MediaReport(
+        base_media=recipe['base_media']['name'],
+        serum=recipe['serum']['name'],
+        serum_percentage=float(to_decimal(serum_percentage)),
+        final_volume_ml=float(result.final_volume_ml),
+        stock_preparations=stock_preparations,
+        steps=tuple(steps),
+        base_media_volume_ml=float(result.base_media_volume_ml),
+        serum_volume_ml=float(result.serum_volume_ml),
+        total_additives_volume_ml=float(result.total_additives_volume_ml),
+        total_cost=float(result.total_cost),
+        cost_per_ml=float(cost_per_ml),
+    )
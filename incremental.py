@@ -0,0 +1,208 @@
+# incremental.py
+#
+# Dependency-tracked recipe model for interactive editing. A RecipeWorkspace holds the
+# catalog and any number of recipes; every recipe keeps its additive results and stock
+# plans and only recalculates what an edit touches:
+#
+#   - set_additive() recalculates that additive's volume_ul and cost,
+#   - set_serum_percentage() only re-derives the totals,
+#   - set_final_volume() recalculates every additive of that recipe,
+#   - workspace.update_component() recalculates the additives that use the component,
+#     in the recipes that reference it, and leaves every other recipe alone.
+#
+# The totals (base media volume, serum volume, total cost) come from report.build_report,
+# so the numbers are the same as a full MediaPreparationHelper run.
+
+from types import MappingProxyType
+
+from catalog import as_catalog
+from core import StockPlanCache, collect_stock_preparations, plan_additive, RecipeResult
+from mediaCalc import DEFAULT_BASE_MEDIA, DEFAULT_SERUM, parse_recipe
+from recipe_parser import parse_item, serum_percentage
+from report import build_report
+
+
+class RecipeWorkspace:
+    def __init__(self, components_stock, plan_cache=None):
+        self.catalog = as_catalog(components_stock)
+        self.plan_cache = plan_cache if plan_cache is not None else StockPlanCache()
+        self._edited = {}      # Component name -> edited entry
+        self._revisions = {}   # Component name -> number of edits
+        self._recipes = {}
+        self._dependents = {}  # Component name -> keys of the recipes that reference it
+
+    def find(self, name):
+        comp = self.catalog.find(name)
+        if comp is None:
+            return None
+        return self._edited.get(comp['name'], comp)
+
+    def plan(self, comp, concentration=None):
+        # Edits bump the component's revision, so the shared plan cache never returns a stale plan
+        version = (self.catalog.version, self._revisions.get(comp['name'], 0))
+        return self.plan_cache.plan(comp, concentration, catalog_version=version)
+
+    def add_recipe(self, key, recipe, final_volume_ml):
+        # recipe is a recipe CSV path or a parse_recipe() dict
+        if key in self._recipes:
+            self.remove_recipe(key)
+        model = RecipeModel(self, recipe, final_volume_ml)
+        self._recipes[key] = model
+        for name in model.components():
+            self._dependents.setdefault(name, set()).add(key)
+        return model
+
+    def remove_recipe(self, key):
+        model = self._recipes.pop(key)
+        for name in model.components():
+            self._dependents[name].discard(key)
+
+    def recipe(self, key):
+        return self._recipes[key]
+
+    def __getitem__(self, key):
+        return self._recipes[key]
+
+    def __len__(self):
+        return len(self._recipes)
+
+    def update_component(self, name, **fields):
+        # Edit catalog fields of one component; returns the keys of the recipes that were invalidated
+        comp = self.find(name)
+        if comp is None:
+            raise ValueError(f"Component {name} not found in stock!")
+        name = comp['name']
+        self._edited[name] = MappingProxyType(dict(comp, **fields))
+        self._revisions[name] = self._revisions.get(name, 0) + 1
+
+        invalidated = sorted(self._dependents.get(name, ()), key=str)
+        for key in invalidated:
+            self._recipes[key].invalidate_component(name)
+        return invalidated
+
+
+class RecipeModel:
+    # One recipe at one final volume. Additive results are kept per recipe row and
+    # recalculated lazily, on the next result()/report() after an edit marks them dirty.
+    def __init__(self, workspace, recipe, final_volume_ml):
+        if isinstance(recipe, str):
+            recipe = parse_recipe(recipe, workspace.catalog)
+        self.workspace = workspace
+        self.base_media = dict(DEFAULT_BASE_MEDIA, **recipe['base_media'])
+        self.serum = dict(DEFAULT_SERUM, **recipe['serum'])
+        self.recipe_data = [dict(item) for item in recipe['additives']]
+        self.final_volume_ml = final_volume_ml
+        self.recalculated = 0  # Additive calculations so far, for checking what an edit cost
+
+        # Catalog name of every row (None if the component isn't in the catalog) and the reverse index
+        self._names = []
+        self._rows = {}
+        for index, item in enumerate(self.recipe_data):
+            comp = workspace.find(item['name'])
+            name = comp['name'] if comp is not None else None
+            self._names.append(name)
+            if name is not None:
+                self._rows.setdefault(name, []).append(index)
+
+        self._additives = [None] * len(self.recipe_data)
+        self._plans = [(None, None)] * len(self.recipe_data)  # (stock plan, adjusted plan) per row
+        self._stock_plans = {}  # (component name, concentration) -> StockPreparation or ValueError
+        self._dirty = set(range(len(self.recipe_data)))
+        self._result = None
+        self._report = None
+
+    def components(self):
+        # Catalog names this recipe depends on
+        return list(self._rows)
+
+    def _plan_stock(self, comp, concentration=None):
+        key = (comp['name'], concentration)
+        if key not in self._stock_plans:
+            try:
+                self._stock_plans[key] = self.workspace.plan(comp, concentration)
+            except ValueError as e:
+                self._stock_plans[key] = e
+        plan = self._stock_plans[key]
+        if isinstance(plan, ValueError):
+            raise plan
+        return plan
+
+    def _invalidate(self, rows):
+        self._dirty.update(rows)
+        self._result = None
+        self._report = None
+
+    def invalidate_component(self, name):
+        # Called by the workspace when a catalog entry changes
+        self._stock_plans = {key: plan for key, plan in self._stock_plans.items() if key[0] != name}
+        self._invalidate(self._rows.get(name, ()))
+
+    def _row(self, name):
+        for index, item in enumerate(self.recipe_data):
+            if item['name'] == name:
+                return index
+        raise ValueError(f"Component {name} is not in the recipe")
+
+    def set_additive(self, name, desired_concentration=None, desired_unit=None, dilution_factor=None):
+        # Change one additive to a desired concentration or to a dilution factor. The new row goes
+        # through the same checks as a recipe file row before anything is changed.
+        index = self._row(name)
+        item = {'name': self.recipe_data[index]['name']}
+        if dilution_factor is not None:
+            item['dilution_factor'] = dilution_factor
+        elif desired_concentration is not None:
+            item['desired_concentration'] = desired_concentration
+            item['desired_unit'] = desired_unit or self.recipe_data[index].get('desired_unit')
+            if item['desired_unit'] is None:
+                raise ValueError(f"A desired unit is required for component {name}")
+        else:
+            raise ValueError("Give either a desired concentration or a dilution factor")
+        try:
+            item = parse_item(item, self.workspace.find)
+        except ValueError as e:
+            raise ValueError(f"{item['name']}: {e}")
+        self.recipe_data[index] = item
+        self._invalidate([index])
+
+    def set_final_volume(self, final_volume_ml):
+        if final_volume_ml != self.final_volume_ml:
+            self.final_volume_ml = final_volume_ml
+            self._invalidate(range(len(self.recipe_data)))
+
+    def set_serum_percentage(self, percentage):
+        # Only the serum and base media volumes depend on this
+        self.serum['percentage'] = serum_percentage(percentage)
+        self._report = None
+
+    def result(self):
+        # core.RecipeResult, the same as core.compute_recipe would return
+        if self._result is None:
+            for index in sorted(self._dirty):
+                name = self._names[index]
+                comp = self.workspace.find(name) if name is not None else None
+                additive, stock_plan, adjusted_plan = plan_additive(
+                    comp, self.recipe_data[index], self.final_volume_ml, self._plan_stock)
+                self._additives[index] = additive
+                self._plans[index] = (stock_plan, adjusted_plan)
+                self.recalculated += 1
+            self._dirty.clear()
+            self._result = RecipeResult(self.final_volume_ml, tuple(self._additives),
+                                        collect_stock_preparations(self._plans))
+        return self._result
+
+    def report(self):
+        if self._report is None:
+            result = self.result()
+            self._report = build_report(result.additives, self.recipe_data, result.stock_preparations,
+                                        self.base_media, self.serum, self.final_volume_ml)
+        return self._report
+
+    def totals(self):
+        report = self.report()
+        return {
+            'base_media_volume_ml': report.base_media_volume_ml,
+            'serum_volume_ml': report.serum_volume_ml,
+            'total_additives_volume_ml': report.total_additives_volume_ml,
+            'total_cost': report.total_cost,
+            'cost_per_ml': report.cost_per_ml,
+        }
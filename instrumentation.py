@@ -0,0 +1,72 @@
+# instrumentation.py
+#
+# Optional timers and counters for MediaPreparationHelper. Pass an Instrumentation to
+# the helper and every stage it runs is timed:
+#
+#   parse        reading the recipe CSV
+#   stock_plan   planning stock solutions (inside volume_calc when called from it)
+#   volume_calc  calculate_recipe: lookups, unit conversions and volumes
+#   report       assembling the MediaReport (totals, steps)
+#   render       formatting the document (python-docx tables, Markdown, HTML, ...)
+#   save         writing the file
+#
+# Counters record catalog lookups (and misses), stock plan cache hits and misses and,
+# with an output cache, output cache hits and misses.
+# Hooks are called with (kind, name, value) for every stage ('stage', name, seconds)
+# and counter update ('count', name, increment), for forwarding to a metrics system.
+# Without an Instrumentation the helper skips all of this.
+
+import threading
+import time
+from contextlib import contextmanager
+
+STAGES = ('parse', 'stock_plan', 'volume_calc', 'report', 'render', 'save')
+
+
+class Instrumentation:
+    def __init__(self, hooks=()):
+        self.hooks = list(hooks)
+        self.stages = {}    # name -> [calls, seconds]
+        self.counters = {}  # name -> count
+        self._lock = threading.Lock()
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name, seconds):
+        with self._lock:
+            totals = self.stages.setdefault(name, [0, 0.0])
+            totals[0] += 1
+            totals[1] += seconds
+        for hook in self.hooks:
+            hook('stage', name, seconds)
+
+    def count(self, name, increment=1):
+        if not increment:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + increment
+        for hook in self.hooks:
+            hook('count', name, increment)
+
+    def summary(self):
+        # Plain dict, ready for json.dumps
+        with self._lock:
+            return {
+                'stages': {name: {'calls': calls, 'seconds': seconds} for name, (calls, seconds) in self.stages.items()},
+                'counters': dict(self.counters),
+            }
+
+    def reset(self):
+        with self._lock:
+            self.stages.clear()
+            self.counters.clear()
+
@@ -0,0 +1,427 @@
+# ledger.py
+#
+# Append-only record of the stock actually on hand. Every stock preparation (or bottle
+# received) and every batch of media made is an entry; entries are never changed or
+# deleted, a correction is another entry (an adjustment). Next to the entries, the
+# ledger keeps running indexes that are updated in the same transaction as each entry:
+#
+#   balances   one row per component: mL left, mL received and used, cost in and out
+#   usage      one row per (month, component): mL and cost drawn that month
+#
+# so "what's left of each stock" and "cost consumed this month" read one row per
+# component instead of summing the whole history. rebuild() recomputes both indexes
+# from the entries, e.g. after restoring a backup.
+#
+# Volumes are mL of the stock as prepared. A batch pipetting from a working solution
+# draws volume / dilution factor of the stock, and one pipetting from a stock adjusted
+# to a lower concentration draws the equivalent volume of the prepared stock.
+#
+#   ledger = StockLedger('stock.ledger')
+#   ledger.record_preparation(plan)   (a core.StockPreparation)
+#   batch = helper.record_batch(ledger, label='colon media, plate 3')
+#   batch.shortfalls                  (components whose balance would go negative)
+#
+#   python ledger.py stock.ledger prepare Noggin EGF
+#   python ledger.py stock.ledger record exampleMedia.csv --volume 15
+#   python ledger.py stock.ledger balances
+
+import argparse
+import sqlite3
+import time
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+import units
+
+SCHEMA_VERSION = 1
+KINDS = ('stock', 'use', 'adjust')
+TOLERANCE_ML = 1e-9  # Rounding noise, not a shortfall
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    time REAL NOT NULL,
+    month TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    component TEXT NOT NULL,
+    volume_ml REAL NOT NULL,
+    cost REAL,
+    stock_concentration REAL,
+    stock_unit TEXT,
+    batch TEXT,
+    note TEXT
+);
+CREATE INDEX IF NOT EXISTS entries_component ON entries (component, id);
+CREATE TRIGGER IF NOT EXISTS entries_no_update BEFORE UPDATE ON entries
+    BEGIN SELECT RAISE(ABORT, 'ledger entries are append-only'); END;
+CREATE TRIGGER IF NOT EXISTS entries_no_delete BEFORE DELETE ON entries
+    BEGIN SELECT RAISE(ABORT, 'ledger entries are append-only'); END;
+CREATE TABLE IF NOT EXISTS balances (
+    component TEXT PRIMARY KEY,
+    balance_ml REAL NOT NULL,
+    received_ml REAL NOT NULL,
+    used_ml REAL NOT NULL,
+    cost_in REAL NOT NULL,
+    cost_used REAL NOT NULL,
+    stock_concentration REAL,
+    stock_unit TEXT,
+    last_entry INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS usage (
+    month TEXT NOT NULL,
+    component TEXT NOT NULL,
+    volume_ml REAL NOT NULL,
+    cost REAL NOT NULL,
+    PRIMARY KEY (month, component)
+);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+# Running indexes; excluded.* is the row being added
+UPDATE_BALANCE = """
+INSERT INTO balances VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (component) DO UPDATE SET
+    balance_ml = balance_ml + excluded.balance_ml,
+    received_ml = received_ml + excluded.received_ml,
+    used_ml = used_ml + excluded.used_ml,
+    cost_in = cost_in + excluded.cost_in,
+    cost_used = cost_used + excluded.cost_used,
+    stock_concentration = COALESCE(excluded.stock_concentration, stock_concentration),
+    stock_unit = COALESCE(excluded.stock_unit, stock_unit),
+    last_entry = excluded.last_entry
+"""
+UPDATE_USAGE = """
+INSERT INTO usage VALUES (?, ?, ?, ?)
+ON CONFLICT (month, component) DO UPDATE SET
+    volume_ml = volume_ml + excluded.volume_ml,
+    cost = cost + excluded.cost
+"""
+
+
+@dataclass(frozen=True)
+class Entry:
+    id: int
+    time: float
+    kind: str          # 'stock', 'use' or 'adjust'
+    component: str
+    volume_ml: float   # Positive for stock added, negative for stock drawn
+    cost: Optional[float]
+    stock_concentration: Optional[float]
+    stock_unit: Optional[str]
+    batch: Optional[str]
+    note: Optional[str]
+
+
+@dataclass(frozen=True)
+class Balance:
+    component: str
+    balance_ml: float
+    received_ml: float
+    used_ml: float
+    cost_in: float
+    cost_used: float
+    stock_concentration: Optional[float]  # Of the latest preparation
+    stock_unit: Optional[str]
+
+    @property
+    def cost_per_ml(self):
+        return self.cost_in / self.received_ml if self.received_ml else None
+
+
+@dataclass(frozen=True)
+class Draw:
+    component: str
+    volume_ml: float  # Of the stock as prepared
+    cost: Optional[float]
+    additive: str     # Recipe row the draw comes from
+
+
+@dataclass(frozen=True)
+class Shortfall:
+    component: str
+    balance_ml: float  # Before the batch
+    draw_ml: float
+
+    @property
+    def missing_ml(self):
+        return self.draw_ml - self.balance_ml
+
+
+@dataclass(frozen=True)
+class BatchRecord:
+    label: Optional[str]
+    rows: Tuple[dict, ...]               # generate_recipe rows of the batch
+    draws: Tuple[Draw, ...]
+    shortfalls: Tuple[Shortfall, ...]    # Tracked components whose balance goes negative
+    untracked: Tuple[str, ...]           # Components the ledger has no stock for
+    entry_ids: Tuple[int, ...] = ()      # Empty when nothing was recorded
+
+
+def _month(timestamp):
+    return time.strftime('%Y-%m', time.localtime(timestamp))
+
+
+def batch_draws(result, lookup=None, balances=None):
+    # Draws of a core.RecipeResult (or exact.ExactRecipeResult) on the stocks: one per additive
+    # with a volume, merged per component. lookup maps recipe names to catalog entries (for the
+    # catalog name); balances gives the stock concentration each component was prepared at and
+    # what a mL of it cost, so a draw costs the stock actually taken off the shelf.
+    balances = balances or {}
+    volumes = {}
+    additives = {}
+    for additive in result.additives:
+        if additive.volume_ul is None:
+            continue
+        comp = lookup(additive.name) if lookup is not None else None
+        component = comp['name'] if comp is not None else additive.name
+        volume_ml = float(additive.volume_ul) / 1000
+        balance = balances.get(component)
+        if (additive.adjusted_stock_concentration is not None and comp is not None and balance is not None
+                and balance.stock_concentration and balance.stock_unit):
+            # Pipetted from a solution diluted to the adjusted concentration, in the unit of what is
+            # pipetted (the working solution, if any); the stock it takes is that amount at the
+            # concentration the balance was prepared at
+            pipetted = comp.get('working_solution_unit' if additive.working_solution_dilution_factor else 'stock_unit')
+            factor = units.conversion_factor(pipetted, balance.stock_unit, comp.get('molecular_weight'))
+            volume_ml *= float(additive.adjusted_stock_concentration) * factor / balance.stock_concentration
+        elif additive.working_solution_dilution_factor:
+            volume_ml /= float(additive.working_solution_dilution_factor)
+        volumes[component] = volumes.get(component, 0) + volume_ml
+        additives.setdefault(component, []).append(additive.name)
+    draws = []
+    for component, volume_ml in volumes.items():
+        balance = balances.get(component)
+        cost_per_ml = balance.cost_per_ml if balance is not None else None
+        cost = volume_ml * cost_per_ml if cost_per_ml is not None else None
+        draws.append(Draw(component, volume_ml, cost, '; '.join(additives[component])))
+    return tuple(draws)
+
+
+class StockLedger:
+    def __init__(self, path):
+        self.path = path
+        # Transactions are opened explicitly (BEGIN IMMEDIATE), so two processes can't
+        # read the same balance and both draw on it
+        self._connection = sqlite3.connect(path, isolation_level=None)
+        self._connection.executescript(SCHEMA)
+        row = self._connection.execute("SELECT value FROM meta WHERE key = 'schema_version'").fetchone()
+        if row is None:
+            self._connection.execute("INSERT INTO meta VALUES ('schema_version', ?)", (str(SCHEMA_VERSION),))
+        elif int(row[0]) != SCHEMA_VERSION:
+            raise ValueError(f"{path}: ledger schema {row[0]}, expected {SCHEMA_VERSION}")
+
+    def close(self):
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _append(self, entries, when=None):
+        # Insert (kind, component, volume_ml, cost, stock_concentration, stock_unit, batch, note)
+        # rows and update the indexes; the caller holds the transaction. Returns the entry ids.
+        when = time.time() if when is None else when
+        month = _month(when)
+        ids = []
+        for kind, component, volume_ml, cost, concentration, unit, batch, note in entries:
+            if kind not in KINDS:
+                raise ValueError(f"Unknown ledger entry kind '{kind}'; use one of {', '.join(KINDS)}")
+            cursor = self._connection.execute(
+                'INSERT INTO entries (time, month, kind, component, volume_ml, cost, stock_concentration, '
+                'stock_unit, batch, note) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (when, month, kind, component, volume_ml, cost, concentration, unit, batch, note))
+            ids.append(cursor.lastrowid)
+            self._index(cursor.lastrowid, month, kind, component, volume_ml, cost, concentration, unit)
+        return tuple(ids)
+
+    def _index(self, entry_id, month, kind, component, volume_ml, cost, concentration, unit):
+        received = volume_ml if kind == 'stock' else 0.0
+        used = -volume_ml if kind == 'use' else 0.0
+        cost_in = (cost or 0.0) if kind == 'stock' else 0.0
+        cost_used = (cost or 0.0) if kind == 'use' else 0.0
+        self._connection.execute(UPDATE_BALANCE, (component, volume_ml, received, used, cost_in, cost_used,
+                                                  concentration, unit, entry_id))
+        if kind == 'use':
+            self._connection.execute(UPDATE_USAGE, (month, component, used, cost_used))
+
+    def _transaction(self, append):
+        self._connection.execute('BEGIN IMMEDIATE')
+        try:
+            result = append()
+            self._connection.execute('COMMIT')
+            return result
+        except BaseException:
+            self._connection.execute('ROLLBACK')
+            raise
+
+    def record_stock(self, component, volume_ml, cost=None, stock_concentration=None, stock_unit=None,
+                     batch=None, note=None, when=None):
+        # Stock prepared or received; returns the entry id
+        if volume_ml <= 0:
+            raise ValueError(f"{component}: stock volume must be positive (use record_adjustment to remove stock)")
+        return self._transaction(lambda: self._append(
+            [('stock', component, volume_ml, cost, stock_concentration, stock_unit, batch, note)], when)[0])
+
+    def record_preparation(self, plan, batch=None, note=None, when=None):
+        # A core.StockPreparation made up in full, at its cost_per_ml
+        if not plan.stock_volume_ml:
+            raise ValueError(f"{plan.name}: the stock plan has no volume")
+        cost = plan.cost_per_ml * plan.stock_volume_ml if plan.cost_per_ml is not None else None
+        return self.record_stock(plan.name, plan.stock_volume_ml, cost, plan.stock_concentration, plan.stock_unit,
+                                 batch, note or f"{plan.initial_weight:g} {plan.initial_weight_unit} in {plan.solvent}",
+                                 when)
+
+    def record_adjustment(self, component, volume_ml, note, when=None):
+        # Correction after a count, a spill or a discarded stock: volume_ml is added to the balance
+        return self._transaction(lambda: self._append(
+            [('adjust', component, volume_ml, None, None, None, None, note)], when)[0])
+
+    def record_batch(self, result, label=None, lookup=None, allow_negative=True, when=None):
+        # Record what a batch of media (a core.RecipeResult) draws from the stocks. Returns a
+        # BatchRecord; with allow_negative=False nothing is recorded if any tracked balance
+        # would go negative.
+        def append():
+            names = [additive.name for additive in result.additives]
+            balances = self._balances(names, lookup)
+            draws = batch_draws(result, lookup, balances)
+            shortfalls = []
+            untracked = []
+            for draw in draws:
+                balance = balances.get(draw.component)
+                if balance is None or not balance.received_ml:
+                    untracked.append(draw.component)
+                elif balance.balance_ml - draw.volume_ml < -TOLERANCE_ML:
+                    shortfalls.append(Shortfall(draw.component, balance.balance_ml, draw.volume_ml))
+            record = BatchRecord(label, tuple(result.as_rows()), draws,
+                                 tuple(shortfalls), tuple(untracked))
+            if shortfalls and not allow_negative:
+                return record
+            ids = self._append([('use', draw.component, -draw.volume_ml, draw.cost, None, None, label, draw.additive)
+                                for draw in draws], when)
+            return BatchRecord(record.label, record.rows, record.draws, record.shortfalls, record.untracked, ids)
+
+        return self._transaction(append)
+
+    def _balances(self, components, lookup=None):
+        if lookup is not None:
+            components = [comp['name'] for comp in map(lookup, components) if comp is not None]
+        components = list(dict.fromkeys(components))
+        if not components:
+            return {}
+        rows = self._connection.execute(
+            f"SELECT * FROM balances WHERE component IN ({', '.join('?' * len(components))})", components).fetchall()
+        return {row[0]: Balance(*row[:8]) for row in rows}
+
+    def balance(self, component):
+        return self._balances([component]).get(component)
+
+    def balances(self):
+        # {component: Balance} from the running index, one row per component
+        rows = self._connection.execute('SELECT * FROM balances ORDER BY component').fetchall()
+        return {row[0]: Balance(*row[:8]) for row in rows}
+
+    def usage(self, month=None):
+        # {component: (mL drawn, cost)} for month ('YYYY-MM', default this month)
+        month = month or _month(time.time())
+        rows = self._connection.execute('SELECT component, volume_ml, cost FROM usage WHERE month = ? '
+                                        'ORDER BY component', (month,)).fetchall()
+        return {component: (volume_ml, cost) for component, volume_ml, cost in rows}
+
+    def cost_consumed(self, month=None):
+        row = self._connection.execute('SELECT COALESCE(SUM(cost), 0) FROM usage WHERE month = ?',
+                                       (month or _month(time.time()),)).fetchone()
+        return row[0]
+
+    def entries(self, component=None):
+        # Entries in the order they were recorded, for one component or all
+        if component is None:
+            cursor = self._connection.execute('SELECT * FROM entries ORDER BY id')
+        else:
+            cursor = self._connection.execute('SELECT * FROM entries WHERE component = ? ORDER BY id', (component,))
+        for row in cursor:
+            yield Entry(row[0], row[1], row[3], *row[4:])
+
+    def __len__(self):
+        return self._connection.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+
+    def rebuild(self):
+        # Recompute the balances and usage indexes from the entries
+        def append():
+            self._connection.execute('DELETE FROM balances')
+            self._connection.execute('DELETE FROM usage')
+            for row in self._connection.execute('SELECT id, month, kind, component, volume_ml, cost, '
+                                                'stock_concentration, stock_unit FROM entries ORDER BY id').fetchall():
+                self._index(*row)
+
+        self._transaction(append)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Record stock preparations and batches, and show what is left.')
+    parser.add_argument('ledger', help='Ledger file (SQLite; created if missing)')
+    parser.add_argument('--catalog', help='Component catalog .csv or .sqlite file (default: components.py)')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    prepare = subparsers.add_parser('prepare', help='Record full stock preparations of catalog components')
+    prepare.add_argument('components', nargs='+')
+    record = subparsers.add_parser('record', help='Record the stock a batch of media draws')
+    record.add_argument('recipe', help='Recipe CSV file')
+    record.add_argument('--volume', '-v', type=float, required=True, help='Final volume in mL')
+    record.add_argument('--label', help='Batch label (default: <recipe> <volume> mL)')
+    record.add_argument('--strict', action='store_true', help='Record nothing if a balance would go negative')
+    adjust = subparsers.add_parser('adjust', help='Add (or with a negative volume, remove) stock after a count')
+    adjust.add_argument('component')
+    adjust.add_argument('volume_ml', type=float)
+    adjust.add_argument('note')
+    subparsers.add_parser('balances', help='Stock left per component')
+    usage = subparsers.add_parser('usage', help='Stock and cost drawn in a month')
+    usage.add_argument('--month', help='YYYY-MM (default: this month)')
+    subparsers.add_parser('rebuild', help='Recompute the balance indexes from the entries')
+    args = parser.parse_args(argv)
+
+    from catalog_store import load_catalog
+    from core import plan_stock_solution
+
+    with StockLedger(args.ledger) as ledger:
+        if args.command == 'prepare':
+            catalog = load_catalog(args.catalog)
+            for name in args.components:
+                comp = catalog.find(name)
+                plan = plan_stock_solution(comp) if comp is not None else None
+                if plan is None or not plan.stock_volume_ml:
+                    raise SystemExit(f"{name}: no stock preparation in the catalog")
+                ledger.record_preparation(plan)
+                print(f"{plan.name}: {plan.stock_volume_ml:.4g} mL at {plan.stock_concentration:g} {plan.stock_unit}")
+        elif args.command == 'record':
+            from mediaCalc import MediaPreparationHelper
+            helper = MediaPreparationHelper(load_catalog(args.catalog), args.volume, args.recipe)
+            batch = helper.record_batch(ledger, args.label or f"{args.recipe} {args.volume:g} mL",
+                                        allow_negative=not args.strict)
+            for shortfall in batch.shortfalls:
+                print(f"! {shortfall.component}: needs {shortfall.draw_ml * 1000:.4g} μL, "
+                      f"{shortfall.balance_ml * 1000:.4g} μL left")
+            if not batch.entry_ids:
+                raise SystemExit('Nothing recorded.')
+            print(f"Recorded {len(batch.entry_ids)} draws for '{batch.label}'.")
+        elif args.command == 'adjust':
+            ledger.record_adjustment(args.component, args.volume_ml, args.note)
+        elif args.command == 'balances':
+            for balance in ledger.balances().values():
+                if not balance.received_ml:
+                    print(f"{balance.component}: {balance.used_ml:.4g} mL used, no stock recorded")
+                    continue
+                flag = '  (negative)' if balance.balance_ml < -TOLERANCE_ML else ''
+                print(f"{balance.component}: {balance.balance_ml:.4g} mL left of {balance.received_ml:.4g} mL{flag}")
+        elif args.command == 'usage':
+            usage = ledger.usage(args.month)
+            for component, (volume_ml, cost) in usage.items():
+                print(f"{component}: {volume_ml * 1000:.4g} μL, ${cost:.2f}")
+            print(f"Total: ${sum(cost for _, cost in usage.values()):.2f}")
+        else:
+            ledger.rebuild()
+            print(f"Rebuilt the indexes from {len(ledger)} entries.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,251 @@
+# output_cache.py
+#
+# Content-addressed cache for rendered documents. A document is keyed by a SHA-256 of
+# everything that goes into it: the normalized recipe (base media, serum and additive
+# rows in order), the catalog entries the recipe references, the final volume, the
+# output format, the rounding policy (for the Decimal engine), the calculation version
+# (core.CALCULATION_VERSION) and the renderer version (writers.RENDERER_VERSION, plus the
+# python-docx version for Word). When the key is already in the cache, the stored
+# document is hard-linked (or copied, across file systems) to the requested filename
+# instead of being rendered again.
+#
+# The cache is a directory with one file per document under objects/ and a
+# manifest.json recording each entry's file, size, checksum and last use. Entries are
+# evicted least recently used first once the cache grows past max_bytes. Documents are
+# always written next to the cache and moved into place, so a hard-linked output is
+# never truncated by a later render. One process should write to a cache at a time.
+#
+#   helper = MediaPreparationHelper(components_stock, 15, 'exampleMedia.csv', cache=OutputCache('.media_cache'))
+#   helper.write_output('exampleMedia_15mL.docx')
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from core import CALCULATION_VERSION
+from writers import RENDERER_VERSION
+
+CACHE_DIR = '.media_cache'
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+MANIFEST_VERSION = 1
+
+# mkstemp creates files readable only by their owner; cached documents get the usual
+# permissions. Fixed rather than read with os.umask(), which would briefly change the
+# umask of the whole process (and of the server's worker threads).
+FILE_MODE = 0o644
+
+
+def _number(value):
+    # Numbers that compare equal hash equally (15 and 15.0), other values unchanged
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return value
+    return float(value)
+
+
+def _normalize(value):
+    if isinstance(value, dict) or hasattr(value, 'keys'):
+        return {str(key): _normalize(value[key]) for key in value.keys()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(item) for item in value]
+    if isinstance(value, str):
+        return value.strip()
+    return _number(value)
+
+
+def normalize_recipe(base_media, serum, additives):
+    return {
+        'base_media': base_media.get('name', '').strip(),
+        'serum': {'name': serum.get('name', '').strip(), 'percentage': _number(serum.get('percentage', 10))},
+        'additives': [_normalize(item) for item in additives],
+    }
+
+
+def renderer_version(fmt):
+    if fmt != 'docx':
+        return str(RENDERER_VERSION)
+    try:
+        from importlib.metadata import version
+        return f"{RENDERER_VERSION}/python-docx {version('python-docx')}"
+    except Exception:
+        return f"{RENDERER_VERSION}/python-docx"
+
+
+def cache_key(base_media, serum, additives, components, final_volume_ml, fmt, rounding=None):
+    # Hex digest for a document. components are the catalog entries the additives refer to
+    # (None for missing ones), in additive order.
+    data = {
+        'recipe': normalize_recipe(base_media, serum, additives),
+        'components': [_normalize(comp) if comp is not None else None for comp in components],
+        'final_volume_ml': _number(final_volume_ml),
+        'format': fmt,
+        'rounding': repr(rounding) if rounding is not None else None,
+        'calculation': CALCULATION_VERSION,
+        'renderer': renderer_version(fmt),
+    }
+    text = json.dumps(data, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=repr)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _place(source, filename, link):
+    # Put source at filename atomically, as a hard link when possible
+    if os.path.exists(filename) and os.path.samefile(source, filename):
+        return  # Already linked
+    directory = os.path.dirname(os.path.abspath(filename))
+    fd, tmp = tempfile.mkstemp(prefix='.cache-', dir=directory)
+    os.close(fd)
+    os.remove(tmp)
+    try:
+        if link:
+            try:
+                os.link(source, tmp)
+            except OSError:
+                shutil.copyfile(source, tmp)
+        else:
+            shutil.copyfile(source, tmp)
+        os.replace(tmp, filename)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+class OutputCache:
+    def __init__(self, directory=CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, link=True):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.link = link  # Hard-link cached documents to the output filename (copy if False)
+        self.hits = 0
+        self.misses = 0
+        self._entries = None
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.directory, 'manifest.json')
+
+    @property
+    def entries(self):
+        # {key: {'file', 'format', 'size', 'sha256', 'label', 'created', 'last_used'}}
+        if self._entries is None:
+            self._entries = {}
+            try:
+                with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                    manifest = json.load(f)
+            except (OSError, ValueError):
+                manifest = {}
+            if manifest.get('version') == MANIFEST_VERSION:
+                self._entries = manifest.get('entries', {})
+        return self._entries
+
+    def _save(self):
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(prefix='.manifest-', dir=self.directory)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({'version': MANIFEST_VERSION, 'entries': self.entries}, f, indent=1, sort_keys=True)
+            os.replace(tmp, self.manifest_path)
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+    def _object_path(self, entry):
+        return os.path.join(self.directory, entry['file'])
+
+    @property
+    def total_bytes(self):
+        return sum(entry['size'] for entry in self.entries.values())
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def temp_path(self, fmt):
+        # Where to render a new document before store() moves it into the cache
+        os.makedirs(self.directory, exist_ok=True)
+        fd, path = tempfile.mkstemp(prefix='.render-', suffix=f".{fmt}", dir=self.directory)
+        os.close(fd)
+        os.chmod(path, FILE_MODE)
+        return path
+
+    def fetch(self, key, filename):
+        # Put the cached document for key at filename; False (and nothing written) on a miss.
+        # Entries whose file is missing or changed are dropped.
+        entry = self.entries.get(key)
+        if entry is not None:
+            path = self._object_path(entry)
+            try:
+                valid = os.path.getsize(path) == entry['size'] and file_sha256(path) == entry['sha256']
+            except OSError:
+                valid = False
+            if not valid:
+                self.remove(key)
+                entry = None
+        if entry is None:
+            self.misses += 1
+            return False
+        _place(path, filename, self.link)
+        entry['last_used'] = time.time()
+        self.hits += 1
+        self._save()
+        return True
+
+    def store(self, key, path, fmt, label='', filename=None):
+        # Move a rendered document into the cache under key (and put it at filename, if given),
+        # then evict down to max_bytes
+        relative = os.path.join('objects', key[:2], f"{key}.{fmt}")
+        target = os.path.join(self.directory, relative)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(path, target)
+        now = time.time()
+        self.entries[key] = {
+            'file': relative,
+            'format': fmt,
+            'size': os.path.getsize(target),
+            'sha256': file_sha256(target),
+            'label': label,
+            'created': now,
+            'last_used': now,
+        }
+        if filename is not None:
+            _place(target, filename, self.link)
+        self.evict(keep=key)
+        self._save()
+
+    def remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            try:
+                os.remove(self._object_path(entry))
+            except FileNotFoundError:
+                pass
+
+    def evict(self, keep=None):
+        # Drop least recently used entries until the cache fits in max_bytes; returns the removed keys
+        removed = []
+        total = self.total_bytes
+        for key, entry in sorted(self.entries.items(), key=lambda item: item[1]['last_used']):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            total -= entry['size']
+            self.remove(key)
+            removed.append(key)
+        return removed
+
+    def clear(self):
+        for key in list(self.entries):
+            self.remove(key)
+        self._save()
@@ -0,0 +1,265 @@
+# planner.py
+#
+# Multi-batch stock planner. Takes a schedule of (recipe, final volume, date) entries,
+# sums what every batch draws from each stock and picks one stock concentration and
+# prep volume per component that serves all of the batches within the pipetting limits.
+#
+#   python planner.py schedule.csv      (columns: Recipe, Volume (mL), Date)
+
+import argparse
+import csv
+import math
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+import units
+from catalog import as_catalog
+from components import components_stock
+from core import MAX_STOCK_VOLUME_ML, MIN_VOLUME_UL, common_concentrations, stock_concentration_for
+from mediaCalc import parse_recipe
+
+
+@dataclass(frozen=True)
+class ScheduledBatch:
+    recipe: str
+    final_volume_ml: float
+    date: str = ''
+
+
+@dataclass(frozen=True)
+class BatchAddition:
+    batch: int  # Index into the schedule
+    name: str
+    volume_ul: Optional[float]
+    note: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class StockPrep:
+    name: str
+    stock_concentration: Optional[float]
+    stock_unit: Optional[str]
+    prep_volume_ml: float
+    preparations: int  # Tubes of at most max_stock_volume_ml
+    weight: Optional[float]  # Total to weigh out, in weight_unit
+    weight_unit: Optional[str]
+    batches: int
+    total_volume_ul: float
+    min_addition_ul: float
+    max_addition_ul: float
+    adjusted: bool = False  # Concentration differs from the catalog's desired stock concentration
+    warnings: Tuple[str, ...] = ()
+    # For components pipetted as a working solution: what is pipetted, made by diluting
+    # working_volume_ml / working_solution_dilution_factor of the stock (included in prep_volume_ml)
+    working_concentration: Optional[float] = None
+    working_unit: Optional[str] = None
+    working_volume_ml: Optional[float] = None
+    working_solution_dilution_factor: Optional[float] = None
+
+
+@dataclass(frozen=True)
+class SchedulePlan:
+    schedule: Tuple[ScheduledBatch, ...]
+    stock_preps: Tuple[StockPrep, ...]
+    additions: Tuple[BatchAddition, ...]
+
+    def additions_for(self, batch):
+        return [addition for addition in self.additions if addition.batch == batch]
+
+
+def read_schedule(schedule_file):
+    schedule = []
+    with open(schedule_file, 'r', newline='') as csvfile:
+        for row in csv.DictReader(csvfile):
+            schedule.append(ScheduledBatch(row['Recipe'], float(row['Volume (mL)']), row.get('Date', '') or ''))
+    return schedule
+
+
+def stock_weight(comp, concentration, stock_unit, volume_ml):
+    # Amount of powder for volume_ml of stock at concentration, in the catalog's weight unit
+    weight_unit = comp.get('initial_weight_unit')
+    if weight_unit is None:
+        return None
+    unit = units.parse_unit(stock_unit)
+    if unit.dimension == units.MASS_CONCENTRATION:
+        grams = units.to_base(concentration, unit, units.MASS_CONCENTRATION) * volume_ml * 1e-6  # μg/mL x mL
+    elif unit.dimension == units.MOLAR and comp.get('molecular_weight'):
+        grams = units.to_base(concentration, unit, units.MOLAR) * volume_ml / 1000 * comp['molecular_weight']
+    else:
+        return None
+    return grams / units.parse_unit(weight_unit).scale
+
+
+def plan_schedule(schedule, components_stock=components_stock, min_volume_ul=MIN_VOLUME_UL, max_volume_ul=None,
+                  max_stock_volume_ml=MAX_STOCK_VOLUME_ML, overage=0.1):
+    # One stock concentration per component for the whole schedule. The catalog's desired stock
+    # concentration is kept when every batch can pipette it. With max_volume_ul, it is lowered so
+    # the smallest addition is exactly min_volume_ul (as calculate_volume does for a single batch),
+    # or raised, up to the component's max_stock_concentration, so the largest fits max_volume_ul.
+    # Without it, batches below min_volume_ul keep the stock and get a note to dilute it.
+    catalog = as_catalog(components_stock)
+    schedule = tuple(entry if isinstance(entry, ScheduledBatch) else ScheduledBatch(*entry) for entry in schedule)
+    recipes = {}
+    for entry in schedule:
+        if entry.recipe not in recipes:
+            recipes[entry.recipe] = parse_recipe(entry.recipe, catalog)
+
+    # Demand per component: (batch index, required amount in common units x μL) or fixed μL for dilutions
+    demand = {}
+    missing = []
+    for index, entry in enumerate(schedule):
+        for item in recipes[entry.recipe]['additives']:
+            comp = catalog.find(item['name'])
+            if comp is None:
+                missing.append(BatchAddition(index, item['name'], None, 'Component not found in stock!'))
+                continue
+            demand.setdefault(comp['name'], (comp, []))[1].append((index, item))
+
+    stock_preps = []
+    additions = list(missing)
+    for name, (comp, items) in demand.items():
+        warnings = []
+        fixed = []     # (batch, μL) for every addition
+        required = []  # (batch, common units x μL) for concentration additions
+        working = []   # (batch, μL) of the working solution, for components that have one
+        working_factor = None
+        stock_unit = None
+        stock_common = None
+        scale = 1.0
+        for index, item in items:
+            final_volume_ml = schedule[index].final_volume_ml
+            if 'dilution_factor' in item:
+                fixed.append((index, final_volume_ml / item['dilution_factor'] * 1000))
+                continue
+            try:
+                stock_conc, stock_unit = stock_concentration_for(comp)
+                stock_common, desired_common, pipetted, factor = common_concentrations(
+                    comp, stock_conc, stock_unit, item['desired_concentration'], item['desired_unit'])
+            except ValueError as e:
+                additions.append(BatchAddition(index, name, None, str(e)))
+                continue
+            if factor is not None:
+                # The working solution is pipetted; keep its concentration as is
+                working.append((index, desired_common * final_volume_ml * 1000 / stock_common))
+                working_factor = factor
+                continue
+            scale = pipetted.scale
+            required.append((index, desired_common * final_volume_ml * 1000))
+
+        concentration_common = None
+        adjusted = False
+        small = set()  # Batches pipetting less than min_volume_ul of the shared stock
+        if required:
+            amounts = [amount for _, amount in required]
+            concentration_common = stock_common
+            highest = min(amounts) / min_volume_ul  # Above this the smallest addition drops below the minimum
+            lowest = max(amounts) / max_volume_ul if max_volume_ul else 0.0
+            ceiling = comp.get('max_stock_concentration')
+            if concentration_common > highest and max_volume_ul:
+                # Dilute only when the largest addition is bounded; otherwise a single small batch
+                # would push every large batch to mL-sized additions
+                concentration_common = highest
+                adjusted = True
+                if concentration_common < lowest:
+                    warnings.append(f"Keeping the smallest addition at {min_volume_ul:g} μL makes the largest "
+                                    f"{max(amounts) / concentration_common:.4g} μL, above the {max_volume_ul:g} μL "
+                                    f"maximum; use an intermediate dilution.")
+            elif concentration_common > highest:
+                small = {index for index, amount in required if amount / concentration_common < min_volume_ul}
+                warnings.append(f"{len(small)} batch(es) need less than {min_volume_ul:g} μL of the "
+                                f"{concentration_common / scale:.4g} {stock_unit} stock; dilute it for those "
+                                f"batches (as their documents do) or set --max-volume to plan one diluted stock.")
+            elif concentration_common < lowest:
+                if ceiling:
+                    concentration_common = min(lowest, ceiling * scale)
+                    adjusted = True
+                if concentration_common < lowest:
+                    limit = (f"even at its max_stock_concentration of {ceiling:g} {stock_unit}" if ceiling
+                             else "and the catalog sets no max_stock_concentration to raise the stock to")
+                    warnings.append(f"The largest addition is {max(amounts) / concentration_common:.4g} μL, above "
+                                    f"the {max_volume_ul:g} μL maximum, {limit}.")
+            for index, amount in required:
+                fixed.append((index, amount / concentration_common))
+
+        volumes = [volume_ul for _, volume_ul in fixed + working]
+        if not volumes:
+            continue
+        for index, volume_ul in sorted(fixed + working):
+            note = f"Below the {min_volume_ul:g} μL minimum; dilute the stock for this batch." if index in small else None
+            additions.append(BatchAddition(index, name, volume_ul, note))
+
+        total_volume_ul = sum(volumes)
+        # The stock covers its own additions plus what the working solution is diluted from
+        working_volume_ml = sum(volume_ul for _, volume_ul in working) / 1000 * (1 + overage) if working else None
+        prep_volume_ml = sum(volume_ul for _, volume_ul in fixed) / 1000 * (1 + overage)
+        if working_volume_ml is not None:
+            prep_volume_ml += working_volume_ml / working_factor
+        if concentration_common is not None:
+            concentration, unit = concentration_common / scale, stock_unit
+        elif working:
+            concentration, unit = stock_concentration_for(comp)
+        else:
+            concentration, unit = comp.get('desired_stock_concentration'), comp.get('stock_unit')
+        weight = None
+        if concentration is not None and unit is not None and 'initial_weight' in comp and units.is_unit(unit):
+            weight = stock_weight(comp, concentration, unit, prep_volume_ml)
+            if weight is not None and weight > comp['initial_weight']:
+                vials = math.ceil(weight / comp['initial_weight'])
+                warnings.append(f"Needs {weight:.4g} {comp['initial_weight_unit']}, i.e. {vials} vials of "
+                                f"{comp['initial_weight']:g} {comp['initial_weight_unit']}.")
+
+        stock_preps.append(StockPrep(
+            name=name,
+            stock_concentration=concentration,
+            stock_unit=unit,
+            prep_volume_ml=prep_volume_ml,
+            preparations=max(1, math.ceil(prep_volume_ml / max_stock_volume_ml)),
+            weight=weight,
+            weight_unit=comp.get('initial_weight_unit') if weight is not None else None,
+            batches=len({index for index, _ in fixed + working}),
+            total_volume_ul=total_volume_ul,
+            min_addition_ul=min(volumes),
+            max_addition_ul=max(volumes),
+            adjusted=adjusted,
+            warnings=tuple(warnings),
+            working_concentration=comp['working_solution_concentration'] if working else None,
+            working_unit=comp['working_solution_unit'] if working else None,
+            working_volume_ml=working_volume_ml,
+            working_solution_dilution_factor=working_factor,
+        ))
+
+    additions.sort(key=lambda addition: addition.batch)
+    return SchedulePlan(schedule, tuple(stock_preps), tuple(additions))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Plan consolidated stock preparations for a schedule of batches.')
+    parser.add_argument('schedule', help="CSV with 'Recipe', 'Volume (mL)' and 'Date' columns")
+    parser.add_argument('--min-volume', type=float, default=MIN_VOLUME_UL, help='Smallest pipetting volume in μL')
+    parser.add_argument('--max-volume', type=float, help='Largest single addition in μL')
+    parser.add_argument('--overage', type=float, default=0.1, help='Extra stock to prepare, as a fraction')
+    args = parser.parse_args(argv)
+
+    plan = plan_schedule(read_schedule(args.schedule), min_volume_ul=args.min_volume,
+                         max_volume_ul=args.max_volume, overage=args.overage)
+
+    print(f"Stock preparations for {len(plan.schedule)} batches:")
+    for prep in plan.stock_preps:
+        concentration = f"{prep.stock_concentration:.4g} {prep.stock_unit}" if prep.stock_concentration is not None else 'as supplied'
+        weight = f", weigh {prep.weight:.4g} {prep.weight_unit}" if prep.weight is not None else ''
+        print(f"- {prep.name}: {concentration}{' (adjusted)' if prep.adjusted else ''}, "
+              f"{prep.prep_volume_ml:.2f} mL in {prep.preparations} tube(s){weight}; "
+              f"{prep.batches} batches, {prep.min_addition_ul:.2f}-{prep.max_addition_ul:.2f} μL per addition")
+        if prep.working_volume_ml is not None:
+            print(f"    working solution: {prep.working_concentration:g} {prep.working_unit}, "
+                  f"{prep.working_volume_ml:.2f} mL from {prep.working_volume_ml / prep.working_solution_dilution_factor:.4g} "
+                  f"mL of the stock ({prep.working_solution_dilution_factor:.4g}:1)")
+        for warning in prep.warnings:
+            print(f"    ! {warning}")
+    for addition in plan.additions:
+        if addition.note:
+            print(f"! Batch {addition.batch + 1} ({plan.schedule[addition.batch].recipe}): {addition.name}: {addition.note}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,362 @@
+# plate_designer.py
+#
+# Dose-response plates (96 or 384 wells) from one base recipe. Every well gets the same
+# master mix (base media, serum and the recipe's additives) plus one spike per
+# concentration axis, e.g. a 1:3 series of SB202190 crossed with a 1:2 series of A83-01.
+# Spikes are spike_fraction of the well volume, taken from an intermediate series made
+# in base media at 1/spike_fraction times the final concentration. Each intermediate is
+# made from the next stronger one (the strongest from the stock), so the series needs
+# one stock aliquot and one transfer per level. When only the transfer out of the stock
+# is below the 5 μL minimum, the stock is prediluted once and the series keeps its volumes.
+#
+# The whole plate is computed at once: the well grid, the spike and master mix volumes
+# are arrays, the intermediate volumes come from one reverse cumulative sum per axis,
+# and the master mix is a single compute_recipe call for the plate's total volume
+# (the same calculate_volume math as a document). Additions below the 5 μL minimum come
+# from stocks diluted as the recipe document's stock table says (MasterMix.stock_preparations),
+# and the worklist names the stock concentration every addition is pipetted from.
+#
+#   python plate_designer.py exampleMedia.csv --axis "SB202190:10:uM:3:8" --axis "A83-01:500:nM:2:6" \
+#       --well-volume 100 --plate 96 --plate-map map.csv --worklist worklist.csv
+#
+# An axis is NAME:TOP:UNIT:FACTOR:POINTS, plus a vehicle (0) well unless --no-vehicle.
+
+import argparse
+import csv
+from dataclasses import dataclass
+from typing import Tuple
+
+import numpy as np
+
+from catalog import as_catalog
+from components import components_stock
+from core import (AdditiveResult, MIN_VOLUME_UL, StockPreparation, common_concentrations, compute_recipe,
+                  stock_concentration_for)
+
+PLATE_FORMATS = {96: (8, 12), 384: (16, 24)}
+ROW_LETTERS = 'ABCDEFGHIJKLMNOP'
+
+
+@dataclass(frozen=True)
+class ConcentrationAxis:
+    name: str
+    concentrations: Tuple[float, ...]  # Final concentrations in the well; 0 is the vehicle control
+    unit: str
+
+
+def serial_dilution(name, top, unit, factor=3, points=8, vehicle=True):
+    # Axis from top down by factor, points long, plus a vehicle (0) point
+    concentrations = tuple(top / factor ** i for i in range(points))
+    return ConcentrationAxis(name, concentrations + ((0.0,) if vehicle else ()), unit)
+
+
+def parse_axis(text, vehicle=True):
+    # 'NAME:TOP:UNIT:FACTOR:POINTS' as used on the command line
+    parts = text.rsplit(':', 4)
+    if len(parts) != 5:
+        raise ValueError(f"Axis '{text}' must look like NAME:TOP:UNIT:FACTOR:POINTS")
+    name, top, unit, factor, points = parts
+    try:
+        return serial_dilution(name.strip(), float(top), unit.strip(), float(factor), int(points), vehicle)
+    except ValueError:
+        raise ValueError(f"Axis '{text}': TOP and FACTOR must be numbers and POINTS an integer")
+
+
+@dataclass(frozen=True)
+class IntermediateDilution:
+    axis: str
+    concentration: float               # Final concentration in the well (a predilution's is never plated)
+    intermediate_concentration: float  # Concentration of the intermediate, in the axis unit
+    unit: str
+    volume_ul: float                   # To prepare
+    source: str                        # Stock or the previous intermediate
+    source_ul: float
+    diluent_ul: float
+    predilution: bool = False          # Stock diluted once so the strongest level's transfer can be pipetted
+
+
+@dataclass(frozen=True)
+class MasterMix:
+    volume_ml: float
+    base_media: str
+    base_media_ul: float
+    serum: str
+    serum_ul: float
+    additives: Tuple[AdditiveResult, ...]
+    sources: Tuple[str, ...]  # What each additive is pipetted from, e.g. 'KGF stock 9.9 ug/mL'
+    stock_preparations: Tuple[StockPreparation, ...]  # At the adjusted concentration where one was needed
+
+    def steps(self):
+        # (source, μL) for making the master mix
+        steps = [(self.base_media, self.base_media_ul), (self.serum, self.serum_ul)]
+        steps.extend((source, additive.volume_ul) for additive, source in zip(self.additives, self.sources)
+                     if additive.volume_ul is not None)
+        return steps
+
+
+@dataclass(frozen=True)
+class WorklistStep:
+    source: str
+    destination: str
+    volume_ul: float
+
+
+class PlateDesign:
+    # Wells are in plate order (A1, A2, ...); concentrations is shaped (wells, axes)
+    def __init__(self, rows, columns, well_volume_ul, axes, wells, concentrations, master_mix_ul, spike_ul,
+                 intermediates, master_mix, warnings):
+        self.rows = rows
+        self.columns = columns
+        self.well_volume_ul = well_volume_ul
+        self.axes = axes
+        self.wells = wells
+        self.concentrations = concentrations
+        self.master_mix_ul = master_mix_ul
+        self.spike_ul = spike_ul
+        self.intermediates = intermediates
+        self.master_mix = master_mix
+        self.warnings = warnings
+
+    def well_label(self, index):
+        values = ', '.join(f"{axis.name} {c:.4g} {axis.unit}" if c else f"{axis.name} vehicle"
+                           for axis, c in zip(self.axes, self.concentrations[index]))
+        return values
+
+    def plate_map(self):
+        # rows x columns grid of well labels ('' for empty wells)
+        grid = [[''] * self.columns for _ in range(self.rows)]
+        for index, well in enumerate(self.wells):
+            row = ROW_LETTERS.index(well[0])
+            grid[row][int(well[1:]) - 1] = self.well_label(index)
+        return grid
+
+    def intermediate_name(self, dilution):
+        return f"{dilution.axis} {dilution.intermediate_concentration:.4g} {dilution.unit}"
+
+    def worklist(self):
+        # Intermediate series first (stock and transfers, then diluent), then the master mix, then the plate
+        steps = []
+        for dilution in self.intermediates:
+            steps.append(WorklistStep(dilution.source, self.intermediate_name(dilution), dilution.source_ul))
+            if dilution.diluent_ul > 0:
+                steps.append(WorklistStep(self.master_mix.base_media, self.intermediate_name(dilution), dilution.diluent_ul))
+        for source, volume_ul in self.master_mix.steps():
+            steps.append(WorklistStep(source, 'Master mix', float(volume_ul)))
+        for index, well in enumerate(self.wells):
+            steps.append(WorklistStep('Master mix', well, float(self.master_mix_ul[index])))
+        for j, axis in enumerate(self.axes):
+            sources = {dilution.concentration: self.intermediate_name(dilution)
+                       for dilution in self.intermediates if dilution.axis == axis.name and not dilution.predilution}
+            for index, well in enumerate(self.wells):
+                concentration = self.concentrations[index, j]
+                source = sources.get(concentration, self.master_mix.base_media)  # Vehicle wells get plain base media
+                steps.append(WorklistStep(source, well, float(self.spike_ul[j])))
+        return steps
+
+    def write_worklist(self, filename):
+        with open(filename, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['Step', 'Source', 'Destination', 'Volume (uL)'])
+            for number, step in enumerate(self.worklist(), start=1):
+                writer.writerow([number, step.source, step.destination, f"{step.volume_ul:.4g}"])
+
+    def write_plate_map(self, filename):
+        with open(filename, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow([''] + [str(column) for column in range(1, self.columns + 1)])
+            for letter, row in zip(ROW_LETTERS, self.plate_map()):
+                writer.writerow([letter] + row)
+
+
+def axis_arrays(catalog, axis):
+    # (final concentrations, concentration of the stock in the axis unit, stock label) for one axis
+    comp = catalog.find(axis.name)
+    if comp is None:
+        raise ValueError(f"Component {axis.name} not found in stock!")
+    stock_concentration, stock_unit = stock_concentration_for(comp)
+    # Concentrations are linear, so converting one unit of the axis gives the factor for all of them
+    stock_common, per_unit_common, _, working_factor = common_concentrations(
+        comp, stock_concentration, stock_unit, 1.0, axis.unit)
+    source = f"{comp['name']} working solution" if working_factor is not None else f"{comp['name']} stock"
+    return np.asarray(axis.concentrations, dtype=float), stock_common / per_unit_common, source
+
+
+def plan_series(axis, concentrations, well_counts, stock, source, spike_ul, spike_fold, overage,
+                min_volume_ul=MIN_VOLUME_UL):
+    # Intermediate series for one axis, strongest first. Level i must supply its wells plus the
+    # transfer to level i + 1, which works out to V_i = sum(need_j x c_j for j >= i) / c_i.
+    order = np.argsort(-concentrations)
+    levels = concentrations[order]
+    counts = well_counts[order]
+    active = levels > 0
+    levels, counts = levels[active], counts[active]
+    if not len(levels):
+        return (), []
+    warnings = []
+    need = counts * spike_ul * (1 + overage)
+    intermediate = levels * spike_fold
+    volume = np.cumsum((need * levels)[::-1])[::-1] / levels
+    # Transfers into each level: from the stock for the first, from the level before for the rest
+    previous = np.concatenate(([stock], intermediate[:-1]))
+    transfer = volume * intermediate / previous
+    if intermediate[0] > stock:
+        raise ValueError(f"{axis.name}: the strongest intermediate ({intermediate[0]:.4g} {axis.unit}) is above "
+                         f"the stock ({stock:.4g} {axis.unit}); use a larger spike_fraction")
+    # Only transfers between levels (and the strongest level itself) scale the series up; a
+    # small transfer from the stock is bridged by one predilution instead
+    smallest = min(transfer[1:].min() if len(transfer) > 1 else np.inf, volume[0])
+    if smallest < min_volume_ul:
+        scale = min_volume_ul / smallest
+        volume, transfer = volume * scale, transfer * scale
+        warnings.append(f"{axis.name}: intermediates made {scale:.3g}x larger so every transfer is at least "
+                        f"{min_volume_ul:g} μL.")
+    series = []
+    sources = [source] + [f"{axis.name} {c:.4g} {axis.unit}" for c in intermediate[:-1]]
+    if transfer[0] < min_volume_ul:
+        # Predilution at the concentration that makes the transfer into the strongest level
+        # min_volume_ul, made from min_volume_ul of stock
+        predilution = volume[0] * intermediate[0] / min_volume_ul
+        predilution_ul = min_volume_ul * stock / predilution
+        series.append(IntermediateDilution(axis.name, float(predilution / spike_fold), float(predilution), axis.unit,
+                                           float(predilution_ul), source, float(min_volume_ul),
+                                           float(predilution_ul - min_volume_ul), predilution=True))
+        sources[0] = f"{axis.name} {predilution:.4g} {axis.unit}"
+        transfer[0] = min_volume_ul
+        warnings.append(f"{axis.name}: stock prediluted to {predilution:.4g} {axis.unit} so the transfer into the "
+                        f"strongest intermediate is at least {min_volume_ul:g} μL.")
+    series.extend(
+        IntermediateDilution(axis.name, float(c), float(ic), axis.unit, float(v), src, float(t), float(v - t))
+        for c, ic, v, src, t in zip(levels, intermediate, volume, sources, transfer)
+    )
+    return tuple(series), warnings
+
+
+def additive_source(catalog, additive, stock_preparations):
+    # Label of the solution a master mix addition is pipetted from, with the concentration of
+    # the stock as prepared (diluted where the 5 μL minimum required it)
+    comp = catalog.find(additive.name)
+    name = comp['name'] if comp is not None else additive.name
+    if additive.working_solution_dilution_factor is not None:
+        return f"{name} working solution"
+    plans = {plan.name: plan for plan in stock_preparations}
+    plan = plans.get(name)
+    if additive.adjusted_stock_concentration is not None and plan is not None:
+        return f"{name} stock {additive.adjusted_stock_concentration:.4g} {plan.stock_unit}"
+    if plan is not None:
+        return f"{name} stock {plan.stock_concentration:.4g} {plan.stock_unit}"
+    return name
+
+
+def design_plate(recipe, axes, well_volume_ul, plate=96, replicates=1, spike_fraction=0.1, overage=0.1,
+                 components_stock=components_stock):
+    # PlateDesign for a parse_recipe dict and ConcentrationAxis list. Every combination of the
+    # axes' concentrations is placed replicates times, filling the plate row by row.
+    if plate not in PLATE_FORMATS:
+        raise ValueError(f"Unknown plate format {plate}; use one of {', '.join(map(str, PLATE_FORMATS))}")
+    if not axes:
+        raise ValueError('A plate needs at least one concentration axis')
+    if not 0 < spike_fraction * len(axes) < 1:
+        raise ValueError('The spikes must leave room for the master mix (spike_fraction x axes < 1)')
+    catalog = as_catalog(components_stock)
+    rows, columns = PLATE_FORMATS[plate]
+
+    # Well grid: every combination of axis levels, replicated
+    grids = np.meshgrid(*[np.arange(len(axis.concentrations)) for axis in axes], indexing='ij')
+    level_index = np.stack([grid.ravel() for grid in grids], axis=1)
+    level_index = np.repeat(level_index, replicates, axis=0)
+    n_wells = len(level_index)
+    if n_wells > rows * columns:
+        raise ValueError(f"{n_wells} wells don't fit a {plate}-well plate")
+    wells = tuple(f"{ROW_LETTERS[i // columns]}{i % columns + 1}" for i in range(n_wells))
+
+    spike_ul = np.full(len(axes), well_volume_ul * spike_fraction)
+    master_mix_ul = np.full(n_wells, well_volume_ul - spike_ul.sum())
+    concentrations = np.empty((n_wells, len(axes)))
+    intermediates = []
+    warnings = []
+    for j, axis in enumerate(axes):
+        levels, stock, source = axis_arrays(catalog, axis)
+        concentrations[:, j] = levels[level_index[:, j]]
+        counts = np.bincount(level_index[:, j], minlength=len(levels))
+        series, axis_warnings = plan_series(axis, levels, counts, stock, source, spike_ul[j], 1 / spike_fraction,
+                                            overage)
+        intermediates.extend(series)
+        warnings.extend(axis_warnings)
+
+    # Master mix: the recipe for the plate's whole volume, minus the base media the spikes bring
+    axis_names = {catalog.find(axis.name)['name'] for axis in axes}
+    additives = []
+    for item in recipe['additives']:
+        comp = catalog.find(item['name'])
+        if comp is not None and comp['name'] in axis_names:
+            warnings.append(f"{item['name']} is a plate axis; left out of the master mix.")
+            continue
+        additives.append(item)
+    total_ml = n_wells * well_volume_ul * (1 + overage) / 1000
+    result = compute_recipe(catalog, additives, total_ml)
+    serum_ul = recipe['serum'].get('percentage', 10) / 100 * total_ml * 1000
+    master_mix_total_ul = float(master_mix_ul.sum()) * (1 + overage)
+    additives_ul = sum(a.volume_ul for a in result.additives if a.volume_ul is not None)
+    base_media_ul = master_mix_total_ul - serum_ul - additives_ul
+    if base_media_ul < 0:
+        raise ValueError('Serum and additives exceed the master mix volume; use a smaller spike_fraction.')
+    warnings.extend(f"{a.name}: {a.note}" for a in result.additives if a.volume_ul is None)
+    sources = tuple(additive_source(catalog, additive, result.stock_preparations) for additive in result.additives)
+    master_mix = MasterMix(master_mix_total_ul / 1000, recipe['base_media']['name'], base_media_ul,
+                           recipe['serum']['name'], serum_ul, result.additives, sources, result.stock_preparations)
+
+    return PlateDesign(rows, columns, well_volume_ul, tuple(axes), wells, concentrations, master_mix_ul, spike_ul,
+                       tuple(intermediates), master_mix, tuple(warnings))
+
+
+def main(argv=None):
+    from mediaCalc import parse_recipe
+
+    parser = argparse.ArgumentParser(description='Design a dose-response plate from a base recipe.')
+    parser.add_argument('recipe', help='Base recipe CSV (base media, serum and the additives every well gets)')
+    parser.add_argument('--axis', action='append', required=True, help='NAME:TOP:UNIT:FACTOR:POINTS, e.g. SB202190:10:uM:3:8')
+    parser.add_argument('--well-volume', type=float, default=100, help='Final volume per well in μL')
+    parser.add_argument('--plate', type=int, choices=sorted(PLATE_FORMATS), default=96)
+    parser.add_argument('--replicates', type=int, default=1)
+    parser.add_argument('--spike-fraction', type=float, default=0.1, help='Share of the well each axis spike takes')
+    parser.add_argument('--no-vehicle', action='store_true', help='Leave out the vehicle (0) wells')
+    parser.add_argument('--plate-map', help='Write the plate map to this CSV file')
+    parser.add_argument('--worklist', help='Write the pipetting worklist to this CSV file')
+    args = parser.parse_args(argv)
+
+    try:
+        axes = [parse_axis(text, vehicle=not args.no_vehicle) for text in args.axis]
+        design = design_plate(parse_recipe(args.recipe, components_stock), axes, args.well_volume, args.plate, args.replicates,
+                              args.spike_fraction)
+    except ValueError as e:
+        raise SystemExit(str(e))
+
+    mix = design.master_mix
+    print(f"{len(design.wells)} wells of {design.well_volume_ul:g} μL on a {args.plate}-well plate")
+    print(f"\nMaster mix ({mix.volume_ml:.4g} mL, {design.master_mix_ul[0]:.4g} μL per well):")
+    print(f"- {mix.base_media}: {mix.base_media_ul:.4g} μL")
+    print(f"- {mix.serum}: {mix.serum_ul:.4g} μL")
+    for additive, source in zip(mix.additives, mix.sources):
+        if additive.volume_ul is not None:
+            print(f"- {additive.name}: {additive.volume_ul:.4g} μL of {source}")
+    print('\nStock preparations for the master mix:')
+    for plan in mix.stock_preparations:
+        volume = f"{plan.stock_volume_ml:.4g} mL" if plan.stock_volume_ml is not None else 'the'
+        print(f"- {plan.name} {plan.stock_concentration:.4g} {plan.stock_unit}: {plan.initial_weight:g} "
+              f"{plan.initial_weight_unit} in {volume} {plan.solvent}")
+    print('\nIntermediate dilutions (in base media):')
+    for dilution in design.intermediates:
+        print(f"- {design.intermediate_name(dilution)}: {dilution.source_ul:.4g} μL of {dilution.source} "
+              f"+ {dilution.diluent_ul:.4g} μL base media")
+    for warning in design.warnings:
+        print(f"! {warning}")
+    if args.plate_map:
+        design.write_plate_map(args.plate_map)
+        print(f"Wrote '{args.plate_map}'.")
+    if args.worklist:
+        design.write_worklist(args.worklist)
+        print(f"Wrote '{args.worklist}'.")
+
+
+if __name__ == '__main__':
+    main()
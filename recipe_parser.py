@@ -0,0 +1,330 @@
+# recipe_parser.py
+#
+# Streaming, validating recipe reader. Rows are read one at a time and each recipe is
+# yielded as soon as its last row has been read, so a LIMS export with thousands of
+# recipes (one 'Recipe ID' column, each recipe's rows together) is handled in one pass
+# without loading the file. Instead of skipping rows it can't use, the parser records a
+# RowError with the line number and carries on; ParsedRecipe.recipe holds the valid rows
+# in the same dict form parse_recipe returns. Given the component catalog, it also rejects
+# fold (X) and percent (%) concentrations for components whose stock is in another
+# dimension, which no conversion can bridge.
+#
+#   python recipe_parser.py lims_export.csv     (lists the recipes and every row error)
+
+import argparse
+import csv
+import os
+import re
+from dataclasses import dataclass, replace
+from typing import Optional, Tuple
+
+import units
+from core import component_lookup
+
+RECIPE_ID_COLUMN = 'Recipe ID'
+_UNSAFE_FILENAME = re.compile(r'[^\w.-]+')
+REQUIRED_COLUMNS = ('Name', 'Type', 'Desired Concentration', 'Desired Unit', 'Dilution Factor')
+
+# Dimensions a desired concentration can be given in
+CONCENTRATION_DIMENSIONS = (units.MASS_CONCENTRATION, units.MOLAR, units.FOLD, units.PERCENT)
+# Dimensions that only convert to themselves (mass and molar convert through the molecular weight)
+RELATIVE_DIMENSIONS = (units.FOLD, units.PERCENT)
+
+
+@dataclass(frozen=True)
+class RowError:
+    line: int
+    message: str
+    recipe_id: Optional[str] = None
+    name: Optional[str] = None
+    source: Optional[str] = None  # File name, when several files are read together
+
+    def __str__(self):
+        where = f"line {self.line}"
+        if self.source:
+            where = f"{self.source}, {where}"
+        if self.recipe_id:
+            where += f" (recipe {self.recipe_id})"
+        if self.name:
+            where += f", {self.name}"
+        return f"{where}: {self.message}"
+
+
+@dataclass(frozen=True)
+class ParsedRecipe:
+    recipe_id: Optional[str]
+    recipe: dict  # {'base_media': ..., 'serum': ..., 'additives': [...]} as from parse_recipe
+    errors: Tuple[RowError, ...]
+    first_line: int
+    last_line: int
+
+    @property
+    def ok(self):
+        return not self.errors
+
+
+class RecipeParseError(ValueError):
+    def __init__(self, errors):
+        self.errors = tuple(errors)
+        super().__init__('\n'.join(str(error) for error in self.errors))
+
+
+def _number(text, what):
+    try:
+        value = float(text)
+    except ValueError:
+        raise ValueError(f"{what} '{text}' is not a number")
+    if value <= 0:
+        raise ValueError(f"{what} must be positive, got {text}")
+    return value
+
+
+def concentration_unit(text):
+    # The parsed unit, or ValueError if it isn't a concentration we can convert
+    try:
+        unit = units.parse_unit(text)
+    except ValueError:
+        raise ValueError(f"Unknown unit '{text}'")
+    if unit.dimension not in CONCENTRATION_DIMENSIONS:
+        raise ValueError(f"'{text}' is a {units.DIMENSION_NAMES[unit.dimension]} unit, not a concentration")
+    return unit
+
+
+def pipetted_unit(comp):
+    # Unit of the solution an additive is pipetted from (the working solution, if any), or None
+    if 'working_solution_concentration' in comp:
+        text = comp.get('working_solution_unit')
+    else:
+        text = comp.get('stock_unit')
+    try:
+        return units.parse_unit(text) if text else None
+    except ValueError:
+        return None
+
+
+def parse_additive(row, lookup=None):
+    # One Additive row as a recipe item; raises ValueError with the reason it can't be used.
+    # lookup (name -> catalog entry) enables the check against the component's stock unit.
+    dilution_factor = (row.get('Dilution Factor') or '').strip()
+    concentration = (row.get('Desired Concentration') or '').strip()
+    unit = (row.get('Desired Unit') or '').strip()
+    item = {'name': row['Name'].strip()}
+    if dilution_factor:
+        item['dilution_factor'] = _number(dilution_factor, 'Dilution factor')
+    elif concentration or unit:
+        if not (concentration and unit):
+            raise ValueError('Desired concentration and desired unit must be given together')
+        item['desired_concentration'] = _number(concentration, 'Desired concentration')
+        desired = concentration_unit(unit)
+        comp = lookup(item['name']) if lookup is not None and desired.dimension in RELATIVE_DIMENSIONS else None
+        stock = pipetted_unit(comp) if comp is not None else None
+        if stock is not None and stock.dimension != desired.dimension:
+            raise ValueError(f"'{unit}' is a {units.DIMENSION_NAMES[desired.dimension]} unit, but the stock is in "
+                             f"{stock.symbol} ({units.DIMENSION_NAMES[stock.dimension]}); give the concentration in "
+                             f"{stock.symbol} or a dilution factor")
+        item['desired_unit'] = unit
+    else:
+        raise ValueError('Needs a desired concentration and unit or a dilution factor')
+    return item
+
+
+def parse_item(item, lookup=None):
+    # parse_additive for a recipe item given as data ({'name': ..., 'desired_concentration': ...,
+    # 'desired_unit': ...} or {'name': ..., 'dilution_factor': ...}), e.g. from a JSON request
+    if not isinstance(item, dict) or not isinstance(item.get('name'), str) or not item['name'].strip():
+        raise ValueError("An additive needs a 'name'")
+    row = {'Name': item['name']}
+    for column, key in (('Dilution Factor', 'dilution_factor'), ('Desired Concentration', 'desired_concentration'),
+                        ('Desired Unit', 'desired_unit')):
+        value = item.get(key)
+        row[column] = '' if value is None else str(value)
+    return parse_additive(row, lookup)
+
+
+def serum_percentage(text):
+    # Serum percentage of a Serum row's Dilution Factor column, or ValueError
+    try:
+        value = float(text)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid serum percentage '{text}'")
+    if not 0 <= value < 100:
+        raise ValueError(f"Serum percentage must be between 0 and 100, got {text}")
+    return value
+
+
+class _RecipeBuilder:
+    # Collects the rows of one recipe
+    def __init__(self, recipe_id, line, lookup=None):
+        self.recipe_id = recipe_id
+        self.lookup = lookup
+        self.first_line = line
+        self.last_line = line
+        self.recipe = {'base_media': {}, 'serum': {}, 'additives': []}
+        self.errors = []
+        self.rows = 0
+
+    def error(self, line, message, name=None):
+        self.errors.append(RowError(line, message, self.recipe_id, name))
+
+    def add(self, line, row):
+        self.last_line = line
+        self.rows += 1
+        name = (row.get('Name') or '').strip()
+        kind = (row.get('Type') or '').strip()
+        if not name:
+            self.error(line, 'Missing component name')
+            return
+
+        if kind == 'Base Media':
+            if self.rows != 1:
+                self.error(line, 'Base Media must be the first row of a recipe', name)
+            elif not self.recipe['base_media']:
+                self.recipe['base_media']['name'] = name
+        elif kind == 'Serum':
+            if self.rows != 2:
+                self.error(line, 'Serum must be the second row of a recipe', name)
+            elif not self.recipe['serum']:
+                self.recipe['serum']['name'] = name
+                percentage = (row.get('Dilution Factor') or '').strip()
+                if percentage:
+                    try:
+                        self.recipe['serum']['percentage'] = serum_percentage(percentage)
+                    except ValueError as e:
+                        self.error(line, str(e), name)
+        elif kind == 'Additive':
+            try:
+                self.recipe['additives'].append(parse_additive(row, self.lookup))
+            except ValueError as e:
+                self.error(line, str(e), name)
+        else:
+            self.error(line, f"Unknown type '{kind}'; use Base Media, Serum or Additive", name)
+
+    def finish(self):
+        if not self.recipe['base_media']:
+            self.error(self.first_line, 'Recipe has no Base Media row')
+        if not self.recipe['serum']:
+            self.error(self.first_line, 'Recipe has no Serum row')
+        return ParsedRecipe(self.recipe_id, self.recipe, tuple(self.errors), self.first_line, self.last_line)
+
+
+def iter_recipes(csvfile, id_column=RECIPE_ID_COLUMN, components_stock=None):
+    # Yield a ParsedRecipe per recipe in an open CSV file. With an id_column, each change of
+    # its value starts a new recipe; without one the whole file is a single recipe. With
+    # components_stock, X and % concentrations are checked against the stock units.
+    lookup = component_lookup(components_stock) if components_stock is not None else None
+    reader = csv.DictReader(csvfile)
+    header = reader.fieldnames or []
+    missing = [column for column in REQUIRED_COLUMNS if column not in header]
+    if missing:
+        raise RecipeParseError([RowError(1, f"Missing column(s): {', '.join(missing)}")])
+    grouped = id_column in header
+
+    builder = None
+    seen = set()
+    for row in reader:
+        line = reader.line_num
+        if not any((value or '').strip() for value in row.values() if isinstance(value, str)):
+            continue  # Blank line
+        recipe_id = (row.get(id_column) or '').strip() if grouped else None
+        if builder is not None and recipe_id != builder.recipe_id:
+            yield builder.finish()
+            builder = None
+        if builder is None:
+            builder = _RecipeBuilder(recipe_id, line, lookup)
+            if grouped and not recipe_id:
+                builder.error(line, f"Missing {id_column}")
+            elif recipe_id in seen:
+                builder.error(line, f"Recipe {recipe_id} continues after other recipes; keep its rows together")
+            seen.add(recipe_id)
+        builder.add(line, row)
+    if builder is not None:
+        yield builder.finish()
+
+
+def read_recipes(recipe_file, id_column=RECIPE_ID_COLUMN, components_stock=None):
+    # iter_recipes for a file name; the file stays open only while the generator runs
+    with open(recipe_file, 'r', newline='', encoding='utf-8') as csvfile:
+        yield from iter_recipes(csvfile, id_column, components_stock)
+
+
+def load_recipe_csv(csvfile, components_stock=None):
+    # The single recipe in an open CSV file (or list of lines), raising RecipeParseError with
+    # every row error if there are any
+    recipes = list(iter_recipes(csvfile, None, components_stock))
+    errors = [error for parsed in recipes for error in parsed.errors]
+    if not recipes:
+        errors.append(RowError(1, 'No recipe rows'))
+    if errors:
+        raise RecipeParseError(errors)
+    return recipes[0].recipe
+
+
+def load_recipe(recipe_file, components_stock=None):
+    with open(recipe_file, 'r', newline='', encoding='utf-8') as csvfile:
+        return load_recipe_csv(csvfile, components_stock)
+
+
+def recipe_label(recipe_file, recipe_id=None):
+    # How batch results and messages name a recipe: the file, plus the ID for multi-recipe files
+    return recipe_file if recipe_id is None else f"{recipe_file}:{recipe_id}"
+
+
+def recipe_stem(recipe_file, recipe_id=None):
+    # Start of output file names for a recipe, e.g. 'lims_export_R-17'
+    stem = os.path.splitext(os.path.basename(recipe_file))[0]
+    return stem if recipe_id is None else f"{stem}_{_UNSAFE_FILENAME.sub('_', recipe_id)}"
+
+
+def iter_file_recipes(recipe_files, components_stock=None, id_column=RECIPE_ID_COLUMN):
+    # (recipe_file, recipe_id, recipe, error) for every recipe in single- or multi-recipe files.
+    # error is the exception (RecipeParseError with the row errors, OSError, ...) and recipe
+    # None when a recipe or a whole file can't be used; the other recipes still come through.
+    for recipe_file in recipe_files:
+        try:
+            for parsed in read_recipes(recipe_file, id_column, components_stock):
+                if parsed.ok:
+                    yield recipe_file, parsed.recipe_id, parsed.recipe, None
+                else:
+                    yield recipe_file, parsed.recipe_id, None, RecipeParseError(parsed.errors)
+        except (OSError, ValueError) as e:
+            yield recipe_file, None, None, e
+
+
+def load_file_recipes(recipe_files, components_stock=None, id_column=RECIPE_ID_COLUMN):
+    # [(recipe_file, recipe_id, recipe)] for every recipe in the files, raising the first error
+    recipes = []
+    for recipe_file, recipe_id, recipe, error in iter_file_recipes(recipe_files, components_stock, id_column):
+        if error is not None:
+            if isinstance(error, RecipeParseError):
+                raise RecipeParseError(replace(row_error, source=recipe_file) for row_error in error.errors)
+            raise error
+        recipes.append((recipe_file, recipe_id, recipe))
+    return recipes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check recipe CSV files and list every row error.')
+    parser.add_argument('recipe_file')
+    parser.add_argument('--id-column', default=RECIPE_ID_COLUMN, help='Column that separates recipes')
+    parser.add_argument('--catalog', help='Component catalog .csv or .sqlite file (default: components.py)')
+    args = parser.parse_args(argv)
+
+    from catalog_store import load_catalog
+
+    catalog = load_catalog(args.catalog)
+    failed = 0
+    try:
+        for parsed in read_recipes(args.recipe_file, args.id_column, catalog):
+            label = parsed.recipe_id if parsed.recipe_id is not None else args.recipe_file
+            print(f"{label}: {len(parsed.recipe['additives'])} additives, lines {parsed.first_line}-{parsed.last_line}")
+            for error in parsed.errors:
+                print(f"    ! {error}")
+            failed += not parsed.ok
+    except RecipeParseError as e:
+        raise SystemExit(str(e))
+    if failed:
+        raise SystemExit(f"{failed} recipe(s) with errors")
+
+
+if __name__ == '__main__':
+    main()
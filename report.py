@@ -0,0 +1,161 @@
+# report.py
+#
+# Render-agnostic model of a media preparation document. build_report does all the
+# arithmetic that used to live in generate_word_document (base media volume, serum
+# volume, total cost); the writers in writers.py and docx_writer.py only format it.
+
+from dataclasses import dataclass, asdict
+from typing import Optional, Tuple
+
+TITLE = 'Procedure to Prepare Media'
+
+FINAL_STEPS = (
+    'Gently mix all components to ensure thorough mixing.',
+    'Avoid creating bubbles.',
+    'Use the media immediately or store at 4°C for up to one week.',
+    'Protect from light if light-sensitive components are included.',
+)
+
+STOCK_HEADER = ['Component', 'Initial Weight', 'Stock Concentration', 'Solvent', 'Volume to Add', 'Cost per mL']
+STEPS_HEADER = ['Step', 'Component', 'Desired Concentration', 'Volume to Add (μL)', 'Cost']
+
+
+@dataclass(frozen=True)
+class PreparationStep:
+    step: int
+    component: str
+    desired_concentration: str
+    volume_ul: Optional[float]
+    cost: Optional[float]
+    note: Optional[str] = None
+    kind: str = 'additive'  # 'base_media', 'serum' or 'additive'
+
+
+@dataclass(frozen=True)
+class MediaReport:
+    base_media: str
+    serum: str
+    serum_percentage: float
+    final_volume_ml: float
+    stock_preparations: Tuple  # core.StockPreparation
+    steps: Tuple[PreparationStep, ...]
+    base_media_volume_ml: float
+    serum_volume_ml: float
+    total_additives_volume_ml: float
+    total_cost: float
+    cost_per_ml: float
+    title: str = TITLE
+    final_steps: Tuple[str, ...] = FINAL_STEPS
+
+    def as_dict(self):
+        return asdict(self)
+
+
+def desired_concentration_text(item):
+    if item is None:
+        return ''
+    if 'desired_concentration' in item:
+        return f"{item['desired_concentration']} {item['desired_unit']}"
+    if 'dilution_factor' in item:
+        return f"1:{int(item['dilution_factor'])} dilution"
+    return '-'
+
+
+def build_report(recipe_output, recipe_data, stock_preparations, base_media, serum, final_volume_ml):
+    # recipe_output is the list of generate_recipe rows (or AdditiveResults)
+    recipe_output = [comp.as_dict() if hasattr(comp, 'as_dict') else comp for comp in recipe_output]
+
+    # Calculate the total volume of additives (in μL)
+    total_additives_volume_ul = sum(comp['volume_ul'] for comp in recipe_output if comp['volume_ul'] is not None)
+    total_additives_volume_ml = total_additives_volume_ul / 1000  # Convert μL to mL
+
+    # Serum volume
+    serum_percentage = serum.get('percentage', 10) / 100
+    serum_volume_ml = serum_percentage * final_volume_ml
+
+    # Adjust base media volume
+    base_media_volume_ml = final_volume_ml - serum_volume_ml - total_additives_volume_ml
+
+    # Ensure base media volume is not negative
+    if base_media_volume_ml < 0:
+        raise ValueError("Total volume of additives and serum exceeds the final volume. Adjust final volume or component concentrations.")
+
+    # Step 1: Add Base Media, Step 2: Add Serum
+    steps = [
+        PreparationStep(1, base_media['name'], '-', base_media_volume_ml * 1000, None, kind='base_media'),
+        PreparationStep(2, serum['name'], f"{serum_percentage * 100}% v/v", serum_volume_ml * 1000, None, kind='serum'),
+    ]
+
+    # Index the recipe rows by name once instead of scanning them for every component
+    recipe_items = {}
+    for item in recipe_data:
+        recipe_items.setdefault(item['name'], item)
+
+    # Add Components
+    total_cost = 0.0
+    for comp in recipe_output:
+        cost = comp.get('cost')
+        if cost is not None:
+            total_cost += cost
+        steps.append(PreparationStep(
+            step=len(steps) + 1,
+            component=comp['name'],
+            desired_concentration=desired_concentration_text(recipe_items.get(comp['name'])),
+            volume_ul=comp['volume_ul'],
+            cost=cost,
+            note=comp.get('note'),
+        ))
+
+    return MediaReport(
+        base_media=base_media['name'],
+        serum=serum['name'],
+        serum_percentage=serum_percentage * 100,
+        final_volume_ml=final_volume_ml,
+        stock_preparations=tuple(stock_preparations),
+        steps=tuple(steps),
+        base_media_volume_ml=base_media_volume_ml,
+        serum_volume_ml=serum_volume_ml,
+        total_additives_volume_ml=total_additives_volume_ml,
+        total_cost=total_cost,
+        cost_per_ml=total_cost / final_volume_ml,
+    )
+
+
+def stock_table(report):
+    # Formatted (header, rows) for the Stock Solution Preparations table
+    rows = []
+    for comp in report.stock_preparations:
+        volume_ml = comp.stock_volume_ml
+        cost_per_ml = comp.cost_per_ml
+        rows.append([
+            comp.name,
+            f"{comp.initial_weight:.2f} {comp.initial_weight_unit}",
+            f"{comp.stock_concentration:.2f} {comp.stock_unit}",
+            comp.solvent,
+            f"{volume_ml:.2f} mL" if volume_ml is not None else 'N/A',
+            f"${cost_per_ml:.2f}/mL" if cost_per_ml is not None else 'N/A',
+        ])
+    return STOCK_HEADER, rows
+
+
+def steps_table(report):
+    # Formatted (header, rows) for the Media Preparation Steps table
+    rows = []
+    for step in report.steps:
+        if step.kind != 'additive':
+            # Base media and serum have no cost column
+            cost_str = '-'
+        elif step.cost is not None:
+            cost_str = f"${step.cost:.2f}"
+        else:
+            cost_str = 'N/A'
+        volume_str = f"{step.volume_ul:.2f}" if step.volume_ul is not None else 'N/A'
+        rows.append([str(step.step), step.component, step.desired_concentration, volume_str, cost_str])
+    return STEPS_HEADER, rows
+
+
+def total_cost_lines(report):
+    return [
+        f"Total Cost of Media: ${report.total_cost:.2f}",
+        f"Cost per mL of Media: ${report.cost_per_ml:.2f}/mL",
+    ]
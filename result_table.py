@@ -0,0 +1,278 @@
+# result_table.py
+#
+# Columnar store for many generate_recipe results at once (e.g. thousands of
+# recipe x volume combinations from batch.py). Instead of a dict per row it keeps:
+#
+#   run        int32 index into runs, the (recipe, final volume) each row belongs to
+#   name       int32 index into names, the interned component names
+#   volume_ul  float64, NaN where the volume couldn't be calculated
+#   cost       float64, NaN where there is no cost
+#   notes      sparse: sorted row numbers plus their texts, as most rows have none
+#
+# Rows are stored run by run, so slicing (table[a:b], table.run(i), table.recipe(name))
+# returns views on the same arrays without copying. Iterating gives ResultRow views that
+# behave like the generate_recipe dicts ('note' only present when there is one).
+#
+#   table = run_batch_table(['exampleMedia.csv'], [15, 50, 500])
+#   table.matrix('volume_ul', 'exampleMedia.csv')   (volumes x additives view)
+#   table.to_pandas()
+
+import sys
+from collections.abc import Mapping
+
+import numpy as np
+
+COLUMNS = ('volume_ul', 'cost')
+
+
+class ResultRow(Mapping):
+    # Read-only view of one row; same keys as a generate_recipe dict
+    __slots__ = ('_table', '_index')
+
+    def __init__(self, table, index):
+        self._table = table
+        self._index = index
+
+    @property
+    def name(self):
+        return self._table.names[self._table.name_codes[self._index]]
+
+    @property
+    def volume_ul(self):
+        return _optional(self._table.volume_ul[self._index])
+
+    @property
+    def cost(self):
+        return _optional(self._table.cost[self._index])
+
+    @property
+    def note(self):
+        return self._table.note(self._index)
+
+    @property
+    def run(self):
+        return self._table.runs[self._table.run_codes[self._index]]
+
+    def _keys(self):
+        return ('name', 'volume_ul', 'cost', 'note') if self.note is not None else ('name', 'volume_ul', 'cost')
+
+    def __getitem__(self, key):
+        if key not in self._keys():
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __iter__(self):
+        return iter(self._keys())
+
+    def __len__(self):
+        return len(self._keys())
+
+    def as_dict(self):
+        return {key: getattr(self, key) for key in self._keys()}
+
+    def __repr__(self):
+        return f"ResultRow({self.as_dict()!r})"
+
+
+def _optional(value):
+    return None if np.isnan(value) else float(value)
+
+
+class ResultTable:
+    def __init__(self, runs, names, run_codes, name_codes, volume_ul, cost, note_rows, note_texts, start=0,
+                 run_range=None):
+        self.runs = runs            # Tuple of (recipe, final_volume_ml), shared by every view
+        self.names = names          # Tuple of interned component names, shared by every view
+        self.run_codes = run_codes
+        self.name_codes = name_codes
+        self.volume_ul = volume_ul
+        self.cost = cost
+        self._note_rows = note_rows    # Absolute row numbers in the table this one is a view of
+        self._note_texts = note_texts
+        self._start = start
+        self._run_range = run_range    # Runs this table covers, including ones without rows; None to go by run_codes
+
+    @classmethod
+    def from_results(cls, results):
+        # Table from {(recipe, final_volume_ml): RecipeResult or generate_recipe rows}, as run_batch
+        # returns, or from an iterable of such pairs (so results needn't all be held at once)
+        runs = []
+        name_index = {}
+        run_codes = []
+        name_codes = []
+        volume_ul = []
+        cost = []
+        note_rows = []
+        note_texts = []
+        for run, rows in (results.items() if isinstance(results, Mapping) else results):
+            code = len(runs)
+            runs.append(run)
+            for row in getattr(rows, 'additives', rows):
+                if isinstance(row, Mapping):
+                    name, volume, row_cost, note = row['name'], row['volume_ul'], row['cost'], row.get('note')
+                else:
+                    name, volume, row_cost, note = row.name, row.volume_ul, row.cost, row.note
+                if name not in name_index:
+                    name_index[name] = len(name_index)
+                if note is not None:
+                    note_rows.append(len(run_codes))
+                    note_texts.append(note)
+                run_codes.append(code)
+                name_codes.append(name_index[name])
+                volume_ul.append(np.nan if volume is None else volume)
+                cost.append(np.nan if row_cost is None else row_cost)
+        return cls(
+            tuple(runs),
+            tuple(sys.intern(name) for name in name_index),
+            np.array(run_codes, dtype=np.int32),
+            np.array(name_codes, dtype=np.int32),
+            np.array(volume_ul, dtype=np.float64),
+            np.array(cost, dtype=np.float64),
+            np.array(note_rows, dtype=np.int64),
+            tuple(note_texts),
+            run_range=range(len(runs)),
+        )
+
+    def __len__(self):
+        return len(self.name_codes)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                raise ValueError('ResultTable slices must be contiguous')
+            return self._view(start, stop)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('ResultTable index out of range')
+        return ResultRow(self, index)
+
+    def __iter__(self):
+        return (ResultRow(self, index) for index in range(len(self)))
+
+    def _view(self, start, stop, run_range=None):
+        # Rows start:stop as a table sharing this one's arrays
+        return ResultTable(self.runs, self.names, self.run_codes[start:stop], self.name_codes[start:stop],
+                           self.volume_ul[start:stop], self.cost[start:stop], self._note_rows, self._note_texts,
+                           self._start + start, run_range)
+
+    def note(self, index):
+        row = self._start + index
+        position = np.searchsorted(self._note_rows, row)
+        if position < len(self._note_rows) and self._note_rows[position] == row:
+            return self._note_texts[position]
+        return None
+
+    def notes(self):
+        # {row: note} for the rows of this view
+        first, last = np.searchsorted(self._note_rows, [self._start, self._start + len(self)])
+        return {int(row) - self._start: self._note_texts[i] for i, row in enumerate(self._note_rows[first:last], first)}
+
+    def run_indexes(self):
+        # Runs this table covers, in order; the whole table and run()/recipe() views also
+        # cover runs without any rows, so totals() lines up with them
+        if self._run_range is not None:
+            return self._run_range
+        if not len(self):
+            return range(0)
+        return range(int(self.run_codes[0]), int(self.run_codes[-1]) + 1)
+
+    def run(self, run):
+        # Rows of one run, by index into runs or by (recipe, final_volume_ml)
+        if not isinstance(run, (int, np.integer)):
+            run = self.runs.index(run)
+        start, stop = np.searchsorted(self.run_codes, [run, run + 1])
+        return self._view(int(start), int(stop), range(run, run + 1))
+
+    def recipe(self, recipe):
+        # Rows of every run of one recipe; a view when its runs are next to each other
+        codes = [code for code in self.run_indexes() if self.runs[code][0] == recipe]
+        if not codes:
+            return self._view(0, 0)
+        if codes[-1] - codes[0] + 1 == len(codes):
+            start, stop = np.searchsorted(self.run_codes, [codes[0], codes[-1] + 1])
+            return self._view(int(start), int(stop), range(codes[0], codes[-1] + 1))
+        return self.take(np.isin(self.run_codes, codes))
+
+    def component(self, name):
+        # Rows of one component across every run (a copy; see matrix() for a view)
+        code = self.names.index(name)
+        return self.take(self.name_codes == code)
+
+    def take(self, rows):
+        # New table with the selected rows (a boolean mask or ascending row numbers); the arrays are copied
+        rows = np.flatnonzero(rows) if np.asarray(rows).dtype == bool else np.asarray(rows, dtype=np.int64)
+        first, last = np.searchsorted(self._note_rows, [self._start, self._start + len(self)])
+        noted = self._note_rows[first:last] - self._start
+        kept = np.flatnonzero(np.isin(rows, noted))
+        texts = np.searchsorted(noted, rows[kept]) + first
+        return ResultTable(self.runs, self.names, self.run_codes[rows], self.name_codes[rows],
+                           self.volume_ul[rows], self.cost[rows], kept.astype(np.int64),
+                           tuple(self._note_texts[i] for i in texts))
+
+    def column(self, column):
+        if column not in COLUMNS:
+            raise ValueError(f"Unknown column '{column}'; use one of {', '.join(COLUMNS)}")
+        return getattr(self, column)
+
+    def matrix(self, column='volume_ul', recipe=None):
+        # (runs x additives) view of a column, for runs that list the same additives in the same
+        # order (one recipe at several volumes); column j is then a view of one component
+        table = self.recipe(recipe) if recipe is not None else self
+        runs = len(table.run_indexes())
+        if not runs or len(table) % runs:
+            raise ValueError('The runs have different additives; select one recipe')
+        width = len(table) // runs
+        names = table.name_codes.reshape(runs, width)
+        if not (names == names[0]).all():
+            raise ValueError('The runs have different additives; select one recipe')
+        return table.column(column).reshape(runs, width)
+
+    def totals(self, column='cost'):
+        # Per-run sums of a column, skipping NaN, in the order of run_indexes()
+        runs = self.run_indexes()
+        values = self.column(column)
+        present = ~np.isnan(values)
+        return np.bincount(self.run_codes[present] - runs.start, weights=values[present], minlength=len(runs))
+
+    def rows(self, run=None):
+        # generate_recipe style dicts, for one run or all rows
+        table = self.run(run) if run is not None else self
+        return [row.as_dict() for row in table]
+
+    def to_numpy(self):
+        # Structured array with recipe, final_volume_ml, name, volume_ul, cost and note fields
+        array = np.empty(len(self), dtype=[('recipe', object), ('final_volume_ml', 'f8'), ('name', object),
+                                           ('volume_ul', 'f8'), ('cost', 'f8'), ('note', object)])
+        recipes = np.array([run[0] for run in self.runs], dtype=object)
+        volumes = np.array([run[1] for run in self.runs], dtype=np.float64)
+        array['recipe'] = recipes[self.run_codes]
+        array['final_volume_ml'] = volumes[self.run_codes]
+        array['name'] = np.array(self.names, dtype=object)[self.name_codes]
+        array['volume_ul'] = self.volume_ul
+        array['cost'] = self.cost
+        array['note'] = None
+        for row, note in self.notes().items():
+            array['note'][row] = note
+        return array
+
+    def to_pandas(self):
+        # DataFrame with categorical recipe and name columns (the codes are reused, not re-hashed)
+        import pandas as pd
+
+        recipes = [run[0] for run in self.runs]
+        recipe_categories = list(dict.fromkeys(recipes))
+        recipe_codes = np.array([recipe_categories.index(recipe) for recipe in recipes], dtype=np.int32)
+        notes = pd.Series(self.notes(), dtype=object).reindex(range(len(self)))
+        return pd.DataFrame({
+            'recipe': pd.Categorical.from_codes(recipe_codes[self.run_codes], recipe_categories),
+            'final_volume_ml': np.array([run[1] for run in self.runs], dtype=np.float64)[self.run_codes],
+            'name': pd.Categorical.from_codes(self.name_codes, self.names),
+            'volume_ul': self.volume_ul,
+            'cost': self.cost,
+            'note': notes.to_numpy(),
+        })
+
+    def __repr__(self):
+        return f"<ResultTable {len(self)} rows, {len(self.run_indexes())} runs, {len(self.names)} components>"
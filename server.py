@@ -0,0 +1,260 @@
+# server.py
+#
+# Local HTTP service for lab tools that would otherwise start `python main.py` for every
+# calculation. The catalog is indexed once at startup, python-docx is imported up front
+# and the stock plan and unit caches stay warm between requests. Only the standard
+# library is used (asyncio streams); calculations and rendering run in a thread pool,
+# and each request works on its own helper and report, so nothing carries over from one
+# request to the next.
+#
+#   python server.py --port 8765
+#
+#   GET  /health              {"status": "ok", "components": 16}
+#   POST /recipe              JSON in, MediaReport as JSON out
+#   POST /render?format=md    JSON in, the document in that format out (json, csv, md, html, docx)
+#
+# Request body: {"final_volume_ml": 15, "recipe_csv": "<recipe CSV text>"}
+#           or: {"final_volume_ml": 15, "recipe": {"base_media": {...}, "serum": {...}, "additives": [...]}}
+#
+# Both forms go through the checks of recipe_parser.py; a recipe it rejects answers 400.
+
+import argparse
+import asyncio
+import io
+import json
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+
+from catalog import as_catalog
+from catalog_store import load_catalog
+from components import components_stock
+from core import component_lookup
+from mediaCalc import MediaPreparationHelper, parse_recipe_csv
+from recipe_parser import parse_item, serum_percentage
+from writers import RENDERERS, report_to_json
+
+MAX_BODY_BYTES = 10 * 1024 * 1024
+
+CONTENT_TYPES = {
+    'json': 'application/json',
+    'csv': 'text/csv; charset=utf-8',
+    'md': 'text/markdown; charset=utf-8',
+    'markdown': 'text/markdown; charset=utf-8',
+    'html': 'text/html; charset=utf-8',
+    'htm': 'text/html; charset=utf-8',
+    'docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def read_request_recipe(body, components_stock=None):
+    # (recipe dict, final volume) from a request body
+    try:
+        payload = json.loads(body.decode('utf-8') or '{}')
+    except (UnicodeDecodeError, ValueError):
+        raise HTTPError(HTTPStatus.BAD_REQUEST, 'Request body must be JSON')
+    if not isinstance(payload, dict):
+        raise HTTPError(HTTPStatus.BAD_REQUEST, 'Request body must be a JSON object')
+
+    try:
+        final_volume_ml = float(payload['final_volume_ml'])
+    except (KeyError, TypeError, ValueError):
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "'final_volume_ml' must be a number")
+    if final_volume_ml <= 0:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "'final_volume_ml' must be positive")
+
+    if 'recipe_csv' in payload:
+        try:
+            recipe = parse_recipe_csv(io.StringIO(payload['recipe_csv']), components_stock)
+        except (KeyError, TypeError, ValueError) as e:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f"Invalid recipe CSV: {e}")
+    elif isinstance(payload.get('recipe'), dict):
+        recipe = read_recipe_object(payload['recipe'], components_stock)
+    else:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "Give either 'recipe_csv' or 'recipe'")
+    return recipe, final_volume_ml
+
+
+def read_recipe_object(recipe, components_stock=None):
+    # A JSON recipe through the same checks as a recipe CSV (see recipe_parser.py)
+    if not isinstance(recipe.get('additives'), list):
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "'recipe' needs an 'additives' list")
+    base_media = recipe.get('base_media') or {}
+    serum = recipe.get('serum') or {}
+    if not isinstance(base_media, dict) or not isinstance(serum, dict):
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "'base_media' and 'serum' must be objects")
+    lookup = component_lookup(components_stock) if components_stock is not None else None
+    additives = []
+    errors = []
+    serum = dict(serum)
+    if serum.get('percentage') is not None:
+        try:
+            serum['percentage'] = serum_percentage(serum['percentage'])
+        except ValueError as e:
+            errors.append(f"serum: {e}")
+    for index, item in enumerate(recipe['additives']):
+        try:
+            additives.append(parse_item(item, lookup))
+        except ValueError as e:
+            name = item.get('name') if isinstance(item, dict) else None
+            errors.append(f"additives[{index}]{f' ({name})' if isinstance(name, str) else ''}: {e}")
+    if errors:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, 'Invalid recipe: ' + '; '.join(errors))
+    return {'base_media': dict(base_media), 'serum': serum, 'additives': additives}
+
+
+class RecipeService:
+    # The warm state shared by all requests; everything in it is read-only or thread-safe
+    def __init__(self, components_stock=components_stock, workers=None, preload_docx=True):
+        self.catalog = as_catalog(components_stock)
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.render_docx = None
+        if preload_docx:
+            try:
+                from docx_writer import write_docx
+                self.render_docx = write_docx
+            except ImportError:
+                pass  # .docx requests will answer 501
+
+    def build_report(self, recipe, final_volume_ml):
+        try:
+            helper = MediaPreparationHelper(self.catalog, final_volume_ml, None, recipe=recipe)
+            return helper.build_report()
+        except (KeyError, TypeError, ValueError, ZeroDivisionError) as e:
+            raise HTTPError(HTTPStatus.UNPROCESSABLE_ENTITY, str(e))
+
+    def compute(self, body):
+        recipe, final_volume_ml = read_request_recipe(body, self.catalog)
+        report = self.build_report(recipe, final_volume_ml)
+        return CONTENT_TYPES['json'], report_to_json(report).encode('utf-8')
+
+    def render(self, body, fmt):
+        fmt = fmt.lower()
+        if fmt != 'docx' and fmt not in RENDERERS:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f"Unknown format '{fmt}'")
+        recipe, final_volume_ml = read_request_recipe(body, self.catalog)
+        report = self.build_report(recipe, final_volume_ml)
+        if fmt == 'docx':
+            if self.render_docx is None:
+                raise HTTPError(HTTPStatus.NOT_IMPLEMENTED, 'python-docx is not installed')
+            f = io.BytesIO()
+            self.render_docx(report, f)
+            return CONTENT_TYPES['docx'], f.getvalue()
+        return CONTENT_TYPES[fmt], RENDERERS[fmt](report).encode('utf-8')
+
+    def health(self):
+        body = json.dumps({'status': 'ok', 'components': len(self.catalog)})
+        return CONTENT_TYPES['json'], body.encode('utf-8')
+
+    async def dispatch(self, method, target, body):
+        url = urlsplit(target)
+        query = parse_qs(url.query)
+        loop = asyncio.get_running_loop()
+        if url.path == '/health':
+            if method != 'GET':
+                raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, 'Use GET')
+            return self.health()
+        if url.path in ('/recipe', '/render'):
+            if method != 'POST':
+                raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, 'Use POST')
+            if url.path == '/recipe':
+                return await loop.run_in_executor(self.executor, self.compute, body)
+            fmt = query.get('format', ['docx'])[0]
+            return await loop.run_in_executor(self.executor, self.render, body, fmt)
+        raise HTTPError(HTTPStatus.NOT_FOUND, f"No endpoint {url.path}")
+
+    async def handle(self, reader, writer):
+        # One request per connection
+        try:
+            try:
+                method, target, body = await read_request(reader)
+                content_type, payload = await self.dispatch(method, target, body)
+                status = HTTPStatus.OK
+            except HTTPError as e:
+                status = e.status
+                content_type = CONTENT_TYPES['json']
+                payload = json.dumps({'error': str(e)}).encode('utf-8')
+            except Exception as e:
+                status = HTTPStatus.INTERNAL_SERVER_ERROR
+                content_type = CONTENT_TYPES['json']
+                payload = json.dumps({'error': f"{type(e).__name__}: {e}"}).encode('utf-8')
+            writer.write(response_bytes(status, content_type, payload))
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass  # Client went away
+        finally:
+            writer.close()
+
+    async def start(self, host='127.0.0.1', port=8765):
+        # Returns the asyncio server; port=0 picks a free port (see server.sockets[0].getsockname())
+        return await asyncio.start_server(self.handle, host, port)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+
+async def read_request(reader):
+    request_line = (await reader.readline()).decode('latin-1').strip()
+    parts = request_line.split()
+    if len(parts) != 3:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, 'Malformed request line')
+    method, target, _ = parts
+
+    headers = {}
+    while True:
+        line = (await reader.readline()).decode('latin-1')
+        if line in ('\r\n', '\n', ''):
+            break
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    try:
+        length = int(headers.get('content-length', 0))
+    except ValueError:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, 'Invalid Content-Length')
+    if length > MAX_BODY_BYTES:
+        raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, 'Request body too large')
+    body = await reader.readexactly(length) if length else b''
+    return method.upper(), target, body
+
+
+def response_bytes(status, content_type, payload):
+    head = (f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            f"Connection: close\r\n\r\n")
+    return head.encode('latin-1') + payload
+
+
+async def serve(host='127.0.0.1', port=8765, workers=None, catalog=None):
+    service = RecipeService(load_catalog(catalog), workers=workers)
+    server = await service.start(host, port)
+    print(f"Serving on http://{host}:{server.sockets[0].getsockname()[1]}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Local HTTP service for recipe calculations and documents.')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on (default: localhost only)')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--workers', type=int, help='Threads for calculations and rendering')
+    parser.add_argument('--catalog', help='Component catalog .csv or .sqlite file (default: components.py)')
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers, args.catalog))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
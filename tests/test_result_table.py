@@ -0,0 +1,40 @@
+# test_result_table.py
+#
+# Per-run totals of a ResultTable must line up with table.runs, also when the first or
+# last run has no additive rows (batch.py zips them together for its summary).
+#
+#   python -m pytest tests
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from result_table import ResultTable  # noqa: E402
+
+ROW = {'name': 'EGF', 'volume_ul': 7.5, 'cost': 0.55}
+
+
+def table_with_empty_runs():
+    return ResultTable.from_results([
+        (('empty.csv', 15), []),
+        (('media.csv', 15), [ROW, dict(ROW, name='Noggin', volume_ul=15.0, cost=None)]),
+        (('media.csv', 50), [dict(ROW, volume_ul=25.0, cost=1.83)]),
+        (('empty.csv', 50), []),
+    ])
+
+
+def test_totals_cover_runs_without_rows():
+    table = table_with_empty_runs()
+    assert table.run_indexes() == range(4)
+    np.testing.assert_allclose(table.totals('volume_ul'), [0, 22.5, 25.0, 0])
+    np.testing.assert_allclose(table.totals('cost'), [0, 0.55, 1.83, 0])
+
+
+def test_views_keep_their_empty_runs():
+    table = table_with_empty_runs()
+    np.testing.assert_allclose(table.run(0).totals('volume_ul'), [0])
+    np.testing.assert_allclose(table.run(3).totals('cost'), [0])
+    np.testing.assert_allclose(table.recipe('media.csv').totals('volume_ul'), [22.5, 25.0])
@@ -0,0 +1,183 @@
+# units.py
+#
+# Unit registry. Each unit string is parsed once into an interned Unit holding its
+# dimension and its scale relative to the dimension's base unit:
+#   mass                  grams
+#   volume                litres
+#   mass concentration    μg/mL (the common unit calculate_volume has always used)
+#   molar concentration   M
+#   fold (X) and percent
+# μ (Greek mu), µ (micro sign) and u are all accepted for micro.
+
+import re
+
+MASS = 1
+VOLUME = 2
+MASS_CONCENTRATION = 3
+MOLAR = 4
+FOLD = 5
+PERCENT = 6
+
+DIMENSION_NAMES = {
+    MASS: 'mass',
+    VOLUME: 'volume',
+    MASS_CONCENTRATION: 'mass concentration',
+    MOLAR: 'molar concentration',
+    FOLD: 'fold',
+    PERCENT: 'percent',
+}
+
+# Decimal exponent of each SI prefix; scales are kept as integer exponents so
+# equal units always intern to the same object
+PREFIXES = {
+    '': 0,
+    'k': 3,
+    'm': -3,
+    'u': -6,
+    'n': -9,
+    'p': -12,
+}
+
+# 1 M of a compound with molecular weight MW (g/mol) is MW g/L, i.e. MW * 1e3 μg/mL
+MOLAR_TO_MASS_CONCENTRATION = 1e3
+
+_UNIT_PATTERN = re.compile(r'^([kmunp]?)(g|L|l|M)$')
+
+
+class Unit:
+    __slots__ = ('symbol', 'dimension', 'exponent', 'scale')
+
+    def __init__(self, symbol, dimension, exponent):
+        self.symbol = symbol
+        self.dimension = dimension
+        self.exponent = exponent
+        self.scale = 10.0 ** exponent
+
+    def __repr__(self):
+        return f"Unit({self.symbol!r}, {DIMENSION_NAMES[self.dimension]}, {self.scale:g})"
+
+
+# Interned units by (dimension, exponent) and parsed units by the exact string given
+_interned = {}
+_parsed = {}
+
+
+def _intern(symbol, dimension, exponent):
+    unit = _interned.get((dimension, exponent))
+    if unit is None:
+        unit = _interned[(dimension, exponent)] = Unit(symbol, dimension, exponent)
+    return unit
+
+
+def _normalize(text):
+    return text.strip().replace('μ', 'u').replace('µ', 'u')
+
+
+def _parse_simple(text):
+    match = _UNIT_PATTERN.match(text)
+    if match is None:
+        return None
+    prefix, base = match.groups()
+    exponent = PREFIXES[prefix]
+    if base == 'g':
+        return MASS, exponent
+    if base in ('L', 'l'):
+        return VOLUME, exponent
+    return MOLAR, exponent
+
+
+def parse_unit(text):
+    # Unit for a unit string; raises ValueError for anything we can't convert
+    unit = _parsed.get(text)
+    if unit is not None:
+        return unit
+
+    if not isinstance(text, str):
+        raise ValueError(f"Unknown unit {text}")
+    normalized = _normalize(text)
+    parsed = None
+    if normalized in ('X', 'x'):
+        parsed = FOLD, 0
+    elif normalized == '%':
+        parsed = PERCENT, 0
+    elif normalized.count('/') == 1:
+        numerator, denominator = (_parse_simple(part.strip()) for part in normalized.split('/'))
+        if numerator and denominator and numerator[0] == MASS and denominator[0] == VOLUME:
+            # g/L is 1 mg/mL, i.e. 1e3 μg/mL
+            parsed = MASS_CONCENTRATION, numerator[1] - denominator[1] + 3
+    else:
+        parsed = _parse_simple(normalized)
+
+    if parsed is None:
+        raise ValueError(f"Unknown unit {text}")
+
+    unit = _parsed[text] = _intern(normalized, *parsed)
+    return unit
+
+
+def is_unit(text):
+    try:
+        parse_unit(text)
+    except ValueError:
+        return False
+    return True
+
+
+# Conversion factors between units of the same dimension, filled on first use
+_factors = {}
+
+
+def conversion_factor(from_unit, to_unit, molecular_weight=None):
+    # Multiply a value in from_unit by this to get to_unit. Molar and mass
+    # concentrations convert through the molecular weight (g/mol).
+    if isinstance(from_unit, str):
+        from_unit = parse_unit(from_unit)
+    if isinstance(to_unit, str):
+        to_unit = parse_unit(to_unit)
+
+    factor = _factors.get((from_unit, to_unit))
+    if factor is not None:
+        return factor
+
+    if from_unit.dimension == to_unit.dimension:
+        factor = _factors[(from_unit, to_unit)] = 10.0 ** (from_unit.exponent - to_unit.exponent)
+        return factor
+
+    dimensions = (from_unit.dimension, to_unit.dimension)
+    if dimensions in ((MOLAR, MASS_CONCENTRATION), (MASS_CONCENTRATION, MOLAR)):
+        if not molecular_weight:
+            raise ValueError(f"Molecular weight is required to convert {from_unit.symbol} to {to_unit.symbol}")
+        mass_per_molar = molecular_weight * MOLAR_TO_MASS_CONCENTRATION
+        if from_unit.dimension == MOLAR:
+            return from_unit.scale * mass_per_molar / to_unit.scale
+        return from_unit.scale / mass_per_molar / to_unit.scale
+
+    raise ValueError(f"Unit conversion not defined for units {from_unit.symbol} or {to_unit.symbol}")
+
+
+def to_base(value, unit, dimension, molecular_weight=None):
+    # Value in the base unit of the given dimension (see module comment)
+    if isinstance(unit, str):
+        unit = parse_unit(unit)
+    if unit.dimension == dimension:
+        return value * unit.scale
+    return value * conversion_factor(unit, base_unit(dimension), molecular_weight)
+
+
+BASE_SYMBOLS = {
+    MASS: 'g',
+    VOLUME: 'L',
+    MASS_CONCENTRATION: 'ug/mL',
+    MOLAR: 'M',
+    FOLD: 'X',
+    PERCENT: '%',
+}
+
+
+def base_unit(dimension):
+    return parse_unit(BASE_SYMBOLS[dimension])
+
+
+def conversion_factor_table(symbols):
+    # {symbol: scale} in the style of the old conversion_factors dict
+    return {symbol: parse_unit(symbol).scale for symbol in symbols}
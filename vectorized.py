@@ -0,0 +1,106 @@
+# vectorized.py
+
+import numpy as np
+
+from catalog import as_catalog
+from core import MIN_VOLUME_UL, common_concentrations, default_plan_cache, stock_concentration_for
+
+
+class VolumeMatrix:
+    # Volumes for every additive of a recipe at every final volume.
+    # Arrays are shaped (n_volumes, n_additives); per-additive arrays are shaped (n_additives,).
+    def __init__(self, names, final_volumes_ml, volume_ul, adjusted_stock_concentration,
+                 working_solution_dilution_factor, errors):
+        self.names = names
+        self.final_volumes_ml = final_volumes_ml
+        self.volume_ul = volume_ul
+        self.adjusted_stock_concentration = adjusted_stock_concentration
+        self.working_solution_dilution_factor = working_solution_dilution_factor
+        self.errors = errors  # {additive index: reason}
+
+    @property
+    def clamped(self):
+        # True where the 5 μL minimum forced a diluted stock
+        return ~np.isnan(self.adjusted_stock_concentration)
+
+    def column(self, name):
+        return self.volume_ul[:, self.names.index(name)]
+
+
+def recipe_arrays(components_stock, recipe_data, plan_cache=None):
+    # Turn a recipe into arrays of stock/desired concentrations in common units and dilution factors.
+    # Additives that cannot be calculated get NaN entries and an error message, keyed by row
+    # index (a recipe can list a component twice). Stock
+    # concentrations come from the stock plan, as in core.compute_recipe.
+    catalog = as_catalog(components_stock)
+    if plan_cache is None:
+        plan_cache = default_plan_cache
+    catalog_version = getattr(catalog, 'version', None)
+
+    n = len(recipe_data)
+    names = []
+    stock_conc_common = np.full(n, np.nan)
+    desired_conc_common = np.full(n, np.nan)
+    dilution_factors = np.full(n, np.nan)
+    stock_unit_factors = np.full(n, np.nan)
+    working_dilution = np.full(n, np.nan)
+    errors = {}
+
+    for i, item in enumerate(recipe_data):
+        name = item['name']
+        names.append(name)
+        component_stock = catalog.find(name)
+        if component_stock is None:
+            errors[i] = 'Component not found in stock!'
+            continue
+
+        if 'dilution_factor' in item:
+            dilution_factors[i] = item['dilution_factor']
+            continue
+
+        try:
+            stock_plan = plan_cache.plan(component_stock, catalog_version=catalog_version)
+            stock_concentration, stock_unit = stock_concentration_for(component_stock, stock_plan)
+            stock_common, desired_common, stock, working_factor = common_concentrations(
+                component_stock, stock_concentration, stock_unit, item['desired_concentration'], item['desired_unit'])
+        except ValueError as e:
+            errors[i] = str(e)
+            continue
+
+        stock_conc_common[i] = stock_common
+        desired_conc_common[i] = desired_common
+        stock_unit_factors[i] = stock.scale
+        if working_factor is not None:
+            working_dilution[i] = working_factor
+
+    return names, stock_conc_common, desired_conc_common, dilution_factors, stock_unit_factors, working_dilution, errors
+
+
+def calculate_volume_matrix(components_stock, recipe_data, final_volumes_ml, min_volume_ul=MIN_VOLUME_UL):
+    # Vectorized calculate_volume for a whole recipe across many final volumes at once
+    names, stock_conc, desired_conc, dilution_factors, stock_unit_factors, working_dilution, errors = \
+        recipe_arrays(components_stock, recipe_data)
+    final_volumes_ml = np.atleast_1d(np.asarray(final_volumes_ml, dtype=float))
+    volumes = final_volumes_ml[:, np.newaxis]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Concentration based additives
+        required_ul = desired_conc * volumes * 1000  # desired concentration x final volume, in common units x μL
+        volume_ul = required_ul / stock_conc
+
+        # Dilute the stock where the volume would fall below the minimum, so the minimum is pipetted
+        clamp = volume_ul < min_volume_ul
+        volume_ul = np.where(clamp, min_volume_ul, volume_ul)
+        adjusted_stock_concentration = np.where(clamp, required_ul / min_volume_ul / stock_unit_factors, np.nan)
+
+        # Dilution factor based additives
+        is_dilution = ~np.isnan(dilution_factors)
+        volume_ul = np.where(is_dilution, volumes / dilution_factors * 1000, volume_ul)
+
+    return VolumeMatrix(names, final_volumes_ml, volume_ul, adjusted_stock_concentration, working_dilution, errors)
+
+
+def scale_up_table(components_stock, recipe_data, start_ml=1, stop_ml=10000, steps=1000):
+    # Volumes for every additive from start_ml to stop_ml, as printed for the media kitchen
+    final_volumes_ml = np.linspace(start_ml, stop_ml, steps)
+    return calculate_volume_matrix(components_stock, recipe_data, final_volumes_ml)
@@ -0,0 +1,177 @@
+# writers.py
+#
+# Lightweight output backends for report.MediaReport. None of these import python-docx;
+# the Word backend in docx_writer.py is only loaded when a .docx is requested.
+
+import csv
+import html
+import io
+import json
+import os
+
+from report import stock_table, steps_table, total_cost_lines
+
+CSV_FIELDS = ['step', 'component', 'desired_concentration', 'volume_ul', 'cost', 'note']
+
+# Bump whenever any writer (here or in docx_writer.py) changes its output; cached documents
+# (see output_cache.py) rendered by another version are then made again
+RENDERER_VERSION = 1
+
+
+def report_to_json(report):
+    return json.dumps(report.as_dict(), indent=2, ensure_ascii=False)
+
+
+def write_json(report, filename):
+    with open(filename, 'w', encoding='utf-8') as f:
+        f.write(report_to_json(report))
+
+
+def report_to_csv(report):
+    # One row per preparation step with unformatted numbers, for LIMS imports
+    f = io.StringIO()
+    writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+    writer.writeheader()
+    for step in report.steps:
+        writer.writerow({
+            'step': step.step,
+            'component': step.component,
+            'desired_concentration': step.desired_concentration,
+            'volume_ul': step.volume_ul,
+            'cost': step.cost,
+            'note': step.note,
+        })
+    return f.getvalue()
+
+
+def write_csv(report, filename):
+    with open(filename, 'w', newline='', encoding='utf-8') as f:
+        f.write(report_to_csv(report))
+
+
+def _markdown_table(header, rows):
+    def line(cells):
+        return '| ' + ' | '.join(str(cell).replace('|', '\\|') for cell in cells) + ' |'
+    lines = [line(header), '|' + '---|' * len(header)]
+    lines.extend(line(row) for row in rows)
+    return '\n'.join(lines)
+
+
+def report_to_markdown(report):
+    parts = [
+        f"# {report.title}",
+        '## Materials Needed:',
+        f"- **Base Media:** {report.base_media}\n- **Serum:** {report.serum}",
+    ]
+    if report.stock_preparations:
+        parts.append('## Stock Solution Preparations:')
+        parts.append(_markdown_table(*stock_table(report)))
+        parts.append('Prepare the stock solutions as per the table above.')
+    parts.append('## Media Preparation Steps:')
+    parts.append(_markdown_table(*steps_table(report)))
+    parts.append('**Final Steps:**')
+    parts.append('\n'.join(f"- {line}" for line in report.final_steps))
+    parts.append('**Total Cost:**')
+    parts.append('\n'.join(f"- {line}" for line in total_cost_lines(report)))
+    return '\n\n'.join(parts) + '\n'
+
+
+def write_markdown(report, filename):
+    with open(filename, 'w', encoding='utf-8') as f:
+        f.write(report_to_markdown(report))
+
+
+def _html_table(header, rows):
+    lines = ['<table>', '<tr>' + ''.join(f"<th>{html.escape(cell)}</th>" for cell in header) + '</tr>']
+    for row in rows:
+        lines.append('<tr>' + ''.join(f"<td>{html.escape(str(cell))}</td>" for cell in row) + '</tr>')
+    lines.append('</table>')
+    return '\n'.join(lines)
+
+
+def _html_list(lines):
+    return '<ul>\n' + '\n'.join(f"<li>{html.escape(line)}</li>" for line in lines) + '\n</ul>'
+
+
+def report_to_html(report):
+    title = html.escape(report.title)
+    parts = [
+        '<!DOCTYPE html>',
+        f'<html>\n<head>\n<meta charset="utf-8">\n<title>{title}</title>\n</head>\n<body>',
+        f"<h1>{title}</h1>",
+        '<h2>Materials Needed:</h2>',
+        f"<ul>\n<li><strong>Base Media:</strong> {html.escape(report.base_media)}</li>\n"
+        f"<li><strong>Serum:</strong> {html.escape(report.serum)}</li>\n</ul>",
+    ]
+    if report.stock_preparations:
+        parts.append('<h2>Stock Solution Preparations:</h2>')
+        parts.append(_html_table(*stock_table(report)))
+        parts.append('<p>Prepare the stock solutions as per the table above.</p>')
+    parts.append('<h2>Media Preparation Steps:</h2>')
+    parts.append(_html_table(*steps_table(report)))
+    parts.append('<h2>Final Steps:</h2>')
+    parts.append(_html_list(report.final_steps))
+    parts.append('<h2>Total Cost:</h2>')
+    parts.append(_html_list(total_cost_lines(report)))
+    parts.append('</body>\n</html>')
+    return '\n'.join(parts) + '\n'
+
+
+def write_html(report, filename):
+    with open(filename, 'w', encoding='utf-8') as f:
+        f.write(report_to_html(report))
+
+
+def write_docx(report, filename):
+    # python-docx is only imported when a Word document is actually requested
+    from docx_writer import write_docx
+    write_docx(report, filename)
+
+
+WRITERS = {
+    'json': write_json,
+    'csv': write_csv,
+    'md': write_markdown,
+    'markdown': write_markdown,
+    'html': write_html,
+    'htm': write_html,
+    'docx': write_docx,
+}
+
+
+# Formats that can be rendered to a string (everything but Word)
+RENDERERS = {
+    'json': report_to_json,
+    'csv': report_to_csv,
+    'md': report_to_markdown,
+    'markdown': report_to_markdown,
+    'html': report_to_html,
+    'htm': report_to_html,
+}
+
+
+def render_report(report, fmt):
+    fmt = fmt.lower()
+    if fmt not in RENDERERS:
+        raise ValueError(f"Format '{fmt}' can't be rendered as text. Use one of: {', '.join(sorted(RENDERERS))}")
+    return RENDERERS[fmt](report)
+
+
+def save_rendered(text, filename, fmt):
+    # Write the output of render_report(report, fmt) the way the matching write_* function does
+    newline = '' if fmt.lower() == 'csv' else None
+    with open(filename, 'w', newline=newline, encoding='utf-8') as f:
+        f.write(text)
+
+
+def output_format(filename, fmt=None):
+    if fmt is None:
+        fmt = os.path.splitext(filename)[1].lstrip('.')
+    fmt = fmt.lower()
+    if fmt not in WRITERS:
+        raise ValueError(f"Unknown output format '{fmt}'. Use one of: {', '.join(sorted(WRITERS))}")
+    return fmt
+
+
+def write_report(report, filename, fmt=None):
+    WRITERS[output_format(filename, fmt)](report, filename)